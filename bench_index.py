@@ -0,0 +1,89 @@
+# bench_index.py
+"""
+Compare FAISS index types on the real rag_data vectors.
+
+For each type: recall@k against the exact flat index, single-query search
+latency (p50 / p95) and serialized size as the memory footprint.
+
+    python bench_index.py --k 5 --queries 200
+"""
+import os, time, argparse
+import faiss, numpy as np
+
+from rag_index import INDEX_TYPES, configure_search, make_index
+
+VECTOR_CACHE = "vectors.npz"
+
+
+def load_vectors(rag_dir):
+    data = np.load(os.path.join(rag_dir, VECTOR_CACHE), allow_pickle=False)
+    xb = np.array(data["vectors"], dtype="float32")
+    faiss.normalize_L2(xb)
+    return xb
+
+
+def make_queries(xb, n, noise=0.05, seed=0):
+    # perturbed corpus vectors: realistic "near a real chunk" queries
+    rng = np.random.default_rng(seed)
+    xq = xb[rng.integers(0, len(xb), n)] + rng.normal(0, noise, (n, xb.shape[1]))
+    xq = xq.astype("float32")
+    faiss.normalize_L2(xq)
+    return xq
+
+
+def bench(kind, xb, xq, truth, k):
+    t0 = time.perf_counter()
+    index = make_index(kind, xb.shape[1], len(xb))
+    if not index.is_trained:
+        index.train(xb)
+    index.add_with_ids(xb, np.arange(len(xb), dtype="int64"))
+    configure_search(index)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    lat, found = [], []
+    for q in xq:
+        t = time.perf_counter()
+        _, I = index.search(q.reshape(1, -1), k)
+        lat.append((time.perf_counter() - t) * 1000)
+        found.append(I[0])
+
+    recall = np.mean([
+        len(set(f) & set(t)) / k for f, t in zip(found, truth)
+    ])
+    size = len(faiss.serialize_index(index))
+    return {
+        "type": kind,
+        "recall": recall,
+        "p50_ms": np.percentile(lat, 50),
+        "p95_ms": np.percentile(lat, 95),
+        "build_ms": build_ms,
+        "size_kb": size / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rag-dir", default="rag_data")
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    xb = load_vectors(args.rag_dir)
+    k = min(args.k, len(xb))
+    xq = make_queries(xb, args.queries)
+
+    exact = faiss.IndexFlatIP(xb.shape[1])
+    exact.add(xb)
+    _, truth = exact.search(xq, k)
+
+    print(f"{len(xb)} vectors, dim {xb.shape[1]}, {len(xq)} queries, k={k}\n")
+    print(f"{'type':<8}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'build ms':>11}{'size KB':>10}")
+    for kind in args.types:
+        r = bench(kind, xb, xq, truth, k)
+        print(f"{r['type']:<8}{r['recall']:>10.3f}{r['p50_ms']:>10.3f}"
+              f"{r['p95_ms']:>10.3f}{r['build_ms']:>11.1f}{r['size_kb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
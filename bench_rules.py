@@ -0,0 +1,130 @@
+# bench_rules.py
+"""
+Per-utterance cost of the keyword rules: the old per-module scans
+(one re.sub per hinglish alias, one regex per small-talk pattern, substring
+checks for nlu intents / slots / movement) against one RuleMatcher scan.
+
+    python bench_rules.py --repeat 2000
+    python bench_rules.py --scale 10     # rule tables grown 10x
+"""
+import re, time, argparse
+import numpy as np
+
+from rule_matcher import RuleMatcher, load_rules
+
+UTTERANCES = [
+    "CSE HOD kaun hai",
+    "namaste, aap kaun ho?",
+    "GITS placement package kitna hai 2024 batch ka",
+    "mechanical branch ke courses batao",
+    "aage chalo please",
+    "Explain black hole in simple words",
+    "what is artificial intelligence and machine learning",
+    "hostel aur library ka infrastructure kaisa hai",
+    "thank you so much, tum bahut helpful ho",
+    "physics department ke chairman kaun hain",
+]
+
+
+def grow(rules, scale):
+    """Synthetic bigger tables: every keyword list gets `scale` variants."""
+    if scale <= 1:
+        return rules
+
+    def more(words):
+        return list(words) + [f"{w}{i}" for w in words for i in range(1, scale)]
+
+    for r in rules["small_talk"]:
+        r["patterns"] = more(r["patterns"])
+    for r in rules["nlu_intents"]:
+        r["keywords"] = more(r["keywords"])
+    for values in rules["slots"].values():
+        for r in values:
+            r["keywords"] = more(r["keywords"])
+    rules["movement"] = more(rules["movement"])
+    return rules
+
+
+def legacy(rules):
+    """The scans as they were before rule_matcher (substring semantics kept)."""
+    aliases = rules["aliases"]
+    small_talk = rules["small_talk"]
+    intents = rules["nlu_intents"]
+    slots = rules["slots"]
+    movement = rules["movement"]
+
+    def run(text):
+        t = text.lower().strip()
+        moving = any(w in t for w in movement)
+
+        n = t
+        for k, v in aliases.items():
+            n = re.sub(rf"\b{k}\b", v, n)
+        n = re.sub(r"[^\w\s]", " ", n)
+        n = re.sub(r"\s+", " ", n)
+        scores = {}
+        for intent in small_talk:
+            s = 0
+            for p in intent["patterns"]:
+                if re.search(rf"\b{re.escape(p)}\b", n):
+                    s += 2
+            scores[intent["name"]] = s
+
+        found = "GENERAL"
+        for rule in intents:
+            if any(k in t for k in rule["keywords"]):
+                found = rule["intent"]
+                break
+
+        out = {}
+        for slot, values in slots.items():
+            for rule in values:
+                if any(k in t for k in rule["keywords"]):
+                    out[slot] = rule["value"]
+                    break
+        return moving, scores, found, out
+
+    return run
+
+
+def compiled(rules):
+    matcher = RuleMatcher(rules)
+
+    def run(text):
+        hits = matcher.scan(text)
+        return (hits.any("movement"), hits.counts("small_talk"), hits.first("intent"),
+                {s: hits.first(s) for s in rules["slots"]})
+
+    return run
+
+
+def bench(fn, repeat):
+    lat = []
+    for _ in range(repeat):
+        for u in UTTERANCES:
+            t = time.perf_counter()
+            fn(u)
+            lat.append((time.perf_counter() - t) * 1e6)
+    return np.percentile(lat, 50), np.percentile(lat, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=1000)
+    parser.add_argument("--scale", type=int, default=1)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    rules = grow(load_rules(), args.scale)
+    old, new = legacy(rules), compiled(rules)
+    print(f"{RuleMatcher(rules).patterns} patterns, {len(UTTERANCES)} utterances x {args.repeat}"
+          f" (setup {(time.perf_counter() - t0) * 1000:.1f} ms)\n")
+
+    print(f"{'matcher':<10}{'p50 us':>10}{'p95 us':>10}")
+    for name, fn in (("legacy", old), ("compiled", new)):
+        p50, p95 = bench(fn, args.repeat)
+        print(f"{name:<10}{p50:>10.1f}{p95:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
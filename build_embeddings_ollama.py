@@ -1,41 +1,271 @@
-print("🔥 build_embeddings_ollama STARTED", flush=True)
+# build_embeddings_ollama.py (INCREMENTAL)
+import os, json, time, hashlib, argparse
+import faiss, numpy as np
 
-import json, faiss, numpy as np, requests, os
+from embedder import Embedder, OLLAMA_URL
+from chunk_store import ChunkStore, write_store
+from lexicon_store import write_lexicon
+from rag_index import (
+    INDEX_TYPES, build_lexicon, index_kind, make_index, normalize_text,
+    tmp_path, write_version
+)
 
-OLLAMA_URL = "http://localhost:11434"
 MODEL = "nomic-embed-text"
+VECTOR_CACHE = "vectors.npz"
 
-print("Loading chunks.json", flush=True)
-with open("rag_data/chunks.json", encoding="utf-8") as f:
-    data = json.load(f)
 
-chunks = data["chunks"]
-print("Total chunks:", len(chunks), flush=True)
+def chunk_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
-vectors = []
 
-for i, c in enumerate(chunks):
-    if i % 5 == 0:
-        print(f"Embedding {i}/{len(chunks)}", flush=True)
+# ---------- VECTOR CACHE (hash -> vector) ----------
 
-    r = requests.post(
-        f"{OLLAMA_URL}/api/embeddings",
-        json={"model": MODEL, "prompt": c["text"]},
-        timeout=60
-    )
-    r.raise_for_status()
-    vectors.append(r.json()["embedding"])
+def load_vector_cache(rag_dir, model):
+    path = os.path.join(rag_dir, VECTOR_CACHE)
+    if not os.path.exists(path):
+        return {}
+    data = np.load(path, allow_pickle=False)
+    if str(data["model"]) != model:
+        print("Vector cache is for another model, ignoring it", flush=True)
+        return {}
+    return dict(zip(data["hashes"].tolist(), data["vectors"]))
 
-print("All embeddings done", flush=True)
 
-xb = np.array(vectors).astype("float32")
-faiss.normalize_L2(xb)
+def seed_from_index(rag_dir):
+    """
+    Older builds wrote a plain flat index with no vector cache; its vectors
+    are still valid, so recover them instead of re-embedding everything.
+    """
+    try:
+        index = faiss.read_index(os.path.join(rag_dir, "index.faiss"))
+        with open(os.path.join(rag_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception:
+        return {}
+    if not isinstance(index, faiss.IndexFlat) or index.ntotal != len(meta):
+        return {}
+    xb = index.reconstruct_n(0, index.ntotal)
+    return {chunk_hash(c["text"]): xb[i] for i, c in enumerate(meta)}
 
-index = faiss.IndexFlatIP(xb.shape[1])
-index.add(xb)
-faiss.write_index(index, "rag_data/index.faiss")
 
-with open("rag_data/meta.json", "w", encoding="utf-8") as f:
-    json.dump(chunks, f)
+def save_vector_cache(rag_dir, model, cache, keep):
+    hashes = [h for h in keep if h in cache]
+    if hashes:
+        vectors = np.stack([cache[h] for h in hashes]).astype("float32")
+    else:
+        vectors = np.zeros((0, 0), dtype="float32")
+    path = os.path.join(rag_dir, VECTOR_CACHE)
+    tmp = tmp_path(path) + ".npz"
+    np.savez(tmp, model=np.array(model), hashes=np.array(hashes), vectors=vectors)
+    os.replace(tmp, path)
 
-print("✅ index.faiss + meta.json created", flush=True)
+
+# ---------- EMBEDDING ----------
+
+def embed_missing(texts, workers=4, batch=16, retries=3):
+    """
+    Embeds `texts` concurrently (at most `workers` batches in flight),
+    retrying failed ones with backoff. Returns a list of vectors.
+    """
+    emb = Embedder(MODEL, OLLAMA_URL, window=0, max_batch=batch,
+                   parallel=workers, cache_items=1, timeout=60)
+    try:
+        return _embed_with_retries(emb, texts, retries)
+    finally:
+        emb.close()
+
+
+def _embed_with_retries(emb, texts, retries):
+    out = [None] * len(texts)
+    todo = list(range(len(texts)))
+
+    for attempt in range(retries + 1):
+        futs = {i: emb.submit(texts[i]) for i in todo}
+        failed = []
+        for n, (i, f) in enumerate(futs.items(), 1):
+            try:
+                out[i] = f.result()
+            except Exception as e:
+                failed.append(i)
+                last_err = e
+            if n % 10 == 0:
+                print(f"Embedding {n}/{len(futs)}", flush=True)
+
+        if not failed:
+            return out
+        if attempt < retries:
+            print(f"Retrying {len(failed)} failed embeddings", flush=True)
+            time.sleep(2 ** attempt)
+        todo = failed
+
+    raise RuntimeError(f"{len(todo)} chunks failed to embed") from last_err
+
+
+# ---------- INDEX ----------
+
+def load_previous(rag_dir):
+    """Existing ID-mapped index + {chunk id: hash}, or (None, {})."""
+    try:
+        index = faiss.read_index(os.path.join(rag_dir, "index.faiss"))
+        store = os.path.join(rag_dir, "chunks.bin")
+        if os.path.exists(store):
+            meta = list(ChunkStore(store))
+        else:
+            with open(os.path.join(rag_dir, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+    except Exception:
+        return None, {}
+
+    if not isinstance(index, faiss.IndexIDMap2) or index.ntotal != len(meta):
+        return None, {}
+    if any("hash" not in c for c in meta):
+        return None, {}
+    return index, {c["id"]: c["hash"] for c in meta}
+
+
+def normalized(vectors):
+    xb = np.array(vectors, dtype="float32")
+    faiss.normalize_L2(xb)
+    return xb
+
+
+def update_index(index, chunks, old, new, cache):
+    """Remove stale ids, add fresh ones. Raises if the index type can't remove."""
+    stale = [i for i, h in old.items() if new.get(i) != h]
+    fresh = [c for c in chunks if old.get(c["id"]) != c["hash"]]
+    if stale:
+        index.remove_ids(np.array(stale, dtype="int64"))
+    if fresh:
+        index.add_with_ids(
+            normalized([cache[c["hash"]] for c in fresh]),
+            np.array([c["id"] for c in fresh], dtype="int64")
+        )
+    print(f"Index updated: -{len(stale)} +{len(fresh)}", flush=True)
+    return index
+
+
+def rebuild_index(kind, chunks, cache, dim):
+    index = make_index(kind, dim, len(chunks))
+    if chunks:
+        xb = normalized([cache[c["hash"]] for c in chunks])
+        if not index.is_trained:
+            print(f"Training {kind} index on {len(xb)} vectors", flush=True)
+            index.train(xb)
+        index.add_with_ids(xb, np.array([c["id"] for c in chunks], dtype="int64"))
+    print(f"{kind} index rebuilt from scratch", flush=True)
+    return index
+
+
+def check_unique_ids(chunks):
+    """Chunk ids come from (doc, text): a repeat means two documents share a doc name."""
+    seen = {}
+    for c in chunks:
+        if c["id"] in seen:
+            raise ValueError(
+                f"duplicate chunk id {c['id']} in {seen[c['id']]!r} and {c.get('doc')!r}; "
+                "every document needs a unique doc name (its path relative to the input root)"
+            )
+        seen[c["id"]] = c.get("doc")
+
+
+def build(rag_dir="rag_data", full=False, workers=4, batch=16, retries=3,
+          index_type=None):
+    """
+    chunks.json → index.faiss + chunks.bin + lexicon.bin, embedding only
+    chunks whose text is new. index_type=None keeps the current index type
+    (flat for a fresh index).
+    """
+    print("Loading chunks.json", flush=True)
+    with open(os.path.join(rag_dir, "chunks.json"), encoding="utf-8") as f:
+        chunks = json.load(f)["chunks"]
+    print("Total chunks:", len(chunks), flush=True)
+    check_unique_ids(chunks)
+
+    for c in chunks:
+        c["hash"] = chunk_hash(c["text"])
+        c["norm"] = normalize_text(c["text"])
+
+    cache = {} if full else (load_vector_cache(rag_dir, MODEL) or seed_from_index(rag_dir))
+    missing = sorted({c["hash"] for c in chunks if c["hash"] not in cache})
+    by_hash = {c["hash"]: c["text"] for c in chunks}
+
+    print(f"Embedding {len(missing)} new/changed chunks "
+          f"({len(chunks) - len(missing)} cached)", flush=True)
+    if missing:
+        vecs = embed_missing([by_hash[h] for h in missing], workers, batch, retries)
+        cache.update(zip(missing, vecs))
+    print("All embeddings done", flush=True)
+
+    index, old = (None, {}) if full else load_previous(rag_dir)
+    new = {c["id"]: c["hash"] for c in chunks}
+    if chunks:
+        dim = len(cache[chunks[0]["hash"]])
+    else:
+        # every document removed: write an empty index / store / lexicon so
+        # retrievers stop serving the old chunks (dimension is moot when empty)
+        print("chunks.json has no chunks, writing an empty index", flush=True)
+        dim = index.d if index is not None else 1
+    if index_type is None:
+        index_type = index_kind(index) if index is not None else "flat"
+
+    if index is not None and index.d == dim and index_kind(index) == index_type:
+        try:
+            index = update_index(index, chunks, old, new, cache)
+        except RuntimeError:
+            # e.g. HNSW graphs don't support removal
+            print(f"{index_type} index can't be updated in place", flush=True)
+            index = rebuild_index(index_type, chunks, cache, dim)
+    else:
+        index = rebuild_index(index_type, chunks, cache, dim)
+
+    assert index.ntotal == len(chunks), "index / chunk count mismatch"
+
+    # write to temp files + rename so a running retriever never sees half a file
+    path = os.path.join(rag_dir, "index.faiss")
+    tmp = tmp_path(path)
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)
+
+    # chunk records (text + normalized text + hash), read lazily by the server
+    path = os.path.join(rag_dir, "chunks.bin")
+    tmp = tmp_path(path)
+    write_store(tmp, chunks)
+    os.replace(tmp, path)
+
+    # token postings for the lexical passes in query_rag, mapped like chunks.bin
+    path = os.path.join(rag_dir, "lexicon.bin")
+    tmp = tmp_path(path)
+    write_lexicon(tmp, build_lexicon(chunks, with_norm=False))
+    os.replace(tmp, path)
+
+    save_vector_cache(rag_dir, MODEL, cache, new.values())
+
+    # marker last → live retrievers swap to the new set
+    version = write_version(rag_dir)
+
+    # superseded by chunks.bin / lexicon.bin
+    for name in ("meta.json", "lexicon.json"):
+        legacy = os.path.join(rag_dir, name)
+        if os.path.exists(legacy):
+            os.remove(legacy)
+
+    print("✅ index.faiss + chunks.bin updated", flush=True)
+    return {"chunks": len(chunks), "embedded": len(missing), "version": version}
+
+
+if __name__ == "__main__":
+    print("🔥 build_embeddings_ollama STARTED", flush=True)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rag-dir", default="rag_data")
+    parser.add_argument("--full", action="store_true", help="ignore caches, rebuild everything")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None,
+                        help="FAISS index type (default: keep the current one); "
+                             "compare them with bench_index.py")
+    args = parser.parse_args()
+
+    build(args.rag_dir, args.full, args.workers, args.batch, args.retries,
+          args.index_type)
@@ -0,0 +1,205 @@
+# cache.py
+import os, sys, json, time, sqlite3, logging, threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _json_size(value) -> int:
+    try:
+        return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+def _as_key(obj):
+    # json turns tuples into lists; turn them back so loaded keys still hash
+    if isinstance(obj, list):
+        return tuple(_as_key(x) for x in obj)
+    return obj
+
+
+class BoundedCache:
+    """
+    Thread-safe LRU cache bounded by entry count AND total value bytes,
+    with an optional per-entry TTL (seconds).
+
+    With `path` set, every write goes through to a local sqlite file and the
+    cache is re-populated from it on start, so warm entries survive restarts.
+    Persisted keys/values must be JSON-serializable.
+    """
+
+    def __init__(self, max_items=1024, max_bytes=8 * 1024 * 1024, ttl=None,
+                 path=None, sizeof=_json_size):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.sizeof = sizeof
+
+        self._data = OrderedDict()      # key -> (value, size, created)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+        if path:
+            self._open_db()
+
+    # ---------- PERSISTENCE ----------
+
+    def _open_db(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT, created REAL)"
+            )
+            rows = self._db.execute(
+                "SELECT key, value, created FROM cache ORDER BY rowid"
+            ).fetchall()
+        except Exception:
+            logger.exception("cache db %s unavailable, running in memory", self.path)
+            self._db = None
+            return
+
+        now = time.time()
+        for k, v, created in rows:
+            if self.ttl and now - created > self.ttl:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (k,))
+                continue
+            value = json.loads(v)
+            for old in self._insert(_as_key(json.loads(k)), value, self.sizeof(value), created):
+                self._db_delete(old)
+        self._db.commit()
+
+    def _db_write(self, key, value, created):
+        if self._db is None:
+            return
+        try:
+            k = json.dumps(key, ensure_ascii=False)
+            # delete + insert keeps rowid order == LRU order for the next load
+            self._db.execute("DELETE FROM cache WHERE key = ?", (k,))
+            self._db.execute(
+                "INSERT INTO cache (key, value, created) VALUES (?, ?, ?)",
+                (k, json.dumps(value, ensure_ascii=False), created)
+            )
+            self._db.commit()
+        except Exception:
+            logger.exception("cache write failed")
+
+    def _db_delete(self, key):
+        if self._db is None:
+            return
+        try:
+            k = json.dumps(key, ensure_ascii=False)
+            self._db.execute("DELETE FROM cache WHERE key = ?", (k,))
+        except Exception:
+            logger.exception("cache delete failed")
+
+    # ---------- CORE ----------
+
+    def _insert(self, key, value, size, created):
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._data[key] = (value, size, created)
+        self._bytes += size
+
+        evicted = []
+        while self._data and (
+            len(self._data) > self.max_items or self._bytes > self.max_bytes
+        ):
+            k, (_, s, _) = self._data.popitem(last=False)
+            self._bytes -= s
+            self.evictions += 1
+            evicted.append(k)
+        return evicted
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+
+            value, size, created = item
+            if self.ttl and time.time() - created > self.ttl:
+                del self._data[key]
+                self._bytes -= size
+                self.expired += 1
+                self.misses += 1
+                self._db_delete(key)
+                if self._db is not None:
+                    self._db.commit()
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """Like get(), but leaves LRU order and hit/miss counters alone."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (self.ttl and time.time() - item[2] > self.ttl):
+                return default
+            return item[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        created = time.time()
+        with self._lock:
+            evicted = self._insert(key, value, size, created)
+            for k in evicted:
+                self._db_delete(k)
+            self._db_write(key, value, created)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return default
+            self._bytes -= item[1]
+            self._db_delete(key)
+            if self._db is not None:
+                self._db.commit()
+            return item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
+
+
+_MISSING = object()
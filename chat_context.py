@@ -0,0 +1,101 @@
+# chat_context.py
+"""
+Fixed-size conversation context for the LLM.
+
+The newest turns of a session are sent verbatim while they fit in
+CHAT_CONTEXT_TOKENS; everything older is folded into a short extractive
+summary (the visitor's question + the first sentence of each reply),
+kept per session and only extended with turns that newly fell out of the
+window. However long a visitor talks, the prompt stays around
+CHAT_CONTEXT_TOKENS + CHAT_SUMMARY_TOKENS.
+"""
+import os, re
+
+from cache import BoundedCache
+from context_packer import estimate_tokens
+
+# ---------------- CONFIG ----------------
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "600"))   # verbatim turns
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "120"))   # rolling summary
+CHAT_SUMMARY_TTL = float(os.getenv("CHAT_SUMMARY_TTL", str(6 * 3600)))
+# ----------------------------------------
+
+TURN_OVERHEAD = 8          # role markers etc. per verbatim exchange
+
+_SENT_RE = re.compile(r"(?<=[.!?।])\s+")
+
+# session → {"upto": seq of the last summarized turn, "pieces": [...]}
+SUMMARIES = BoundedCache(max_items=2000, ttl=CHAT_SUMMARY_TTL)
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    words, out, used = (text or "").split(), [], 0
+    for w in words:
+        used += estimate_tokens(w)
+        if used > max_tokens:
+            return " ".join(out) + " …"
+        out.append(w)
+    return " ".join(out)
+
+
+def summarize_turn(turn: dict) -> str:
+    """One exchange → one short line (extractive, no model call)."""
+    reply = _SENT_RE.split((turn.get("assistant") or "").strip(), 1)[0]
+    return f"Q: {_clip(turn.get('user'), 20)} A: {_clip(reply, 25)}"
+
+
+def rolling_summary(session, older, budget=CHAT_SUMMARY_TOKENS) -> str:
+    """Summary of `older` turns, reusing what was summarized on earlier calls."""
+    if not older:
+        return ""
+    key = session or ""
+    state = SUMMARIES.get(key)
+    last = older[-1].get("seq", -1)
+
+    if state is not None and state["upto"] == last:
+        return " ".join(state["pieces"])
+
+    if state is None or state["upto"] > last:
+        pieces, new = [], older
+    else:
+        pieces = list(state["pieces"])
+        new = [t for t in older if t.get("seq", -1) > state["upto"]]
+
+    pieces.extend(summarize_turn(t) for t in new)
+    # rolling: the oldest lines go first once the summary is over budget
+    while len(pieces) > 1 and sum(estimate_tokens(p) for p in pieces) > budget:
+        pieces.pop(0)
+
+    SUMMARIES.set(key, {"upto": last, "pieces": pieces})
+    return " ".join(pieces)
+
+
+def build_messages(turns, user_text, session=None,
+                   budget=CHAT_CONTEXT_TOKENS, summary_budget=CHAT_SUMMARY_TOKENS) -> list:
+    """Stored turns (oldest first) + the new message → chat messages."""
+    recent, used = [], estimate_tokens(user_text)
+    for turn in reversed(turns):
+        cost = (estimate_tokens(turn.get("user") or "")
+                + estimate_tokens(turn.get("assistant") or "") + TURN_OVERHEAD)
+        if used + cost > budget:
+            break
+        recent.append(turn)
+        used += cost
+    recent.reverse()
+
+    messages = []
+    summary = rolling_summary(session, turns[:len(turns) - len(recent)], summary_budget)
+    if summary:
+        messages.append({
+            "role": "system",
+            "content": f"Earlier in this conversation: {summary}"
+        })
+
+    for turn in recent:
+        if "user" in turn:
+            messages.append({"role": "user", "content": turn.get("user", "")})
+        if "assistant" in turn:
+            messages.append({"role": "assistant", "content": turn.get("assistant", "")})
+
+    messages.append({"role": "user", "content": user_text})
+    return messages
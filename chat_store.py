@@ -0,0 +1,206 @@
+# chat_store.py
+"""
+One conversation store for every front end.
+
+- recent turns live in in-memory ring buffers (one overall, one per
+  session), so building LLM context never touches the disk
+- every turn is also queued for an append-only JSONL log; a writer thread
+  (started with the first turn, not at import) flushes whatever queued up
+  in one write every `flush_interval` seconds and rotates the file
+  (log → log.1 → … → log.N) past `max_bytes`
+- flush() and the writer drain + write under one lock, so lines never
+  interleave and stay in turn order across a rotation
+"""
+import os, json, time, queue, atexit, logging, threading
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+CHAT_RING_SIZE = int(os.getenv("CHAT_RING_SIZE", "200"))
+CHAT_SESSION_RING_SIZE = int(os.getenv("CHAT_SESSION_RING_SIZE", "50"))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+CHAT_FLUSH_INTERVAL = float(os.getenv("CHAT_FLUSH_MS", "500")) / 1000
+CHAT_LOG_MAX_BYTES = int(os.getenv("CHAT_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+CHAT_LOG_BACKUPS = int(os.getenv("CHAT_LOG_BACKUPS", "3"))
+# ----------------------------------------
+
+
+class ChatStore:
+    def __init__(self, path, ring_size=CHAT_RING_SIZE, flush_interval=CHAT_FLUSH_INTERVAL,
+                 max_bytes=CHAT_LOG_MAX_BYTES, backups=CHAT_LOG_BACKUPS, legacy_path=None,
+                 session_ring_size=CHAT_SESSION_RING_SIZE, max_sessions=CHAT_MAX_SESSIONS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.session_ring_size = session_ring_size
+        self.max_sessions = max_sessions
+
+        self._ring = deque(maxlen=ring_size)
+        self._sessions = OrderedDict()      # session id → deque, least recently used first
+        self._seq = 0                       # store-wide turn counter ("seq" on each record)
+        self._ring_lock = threading.Lock()
+        self._q = queue.Queue()
+        self._io_lock = threading.Lock()    # drain + write: flush() and the writer
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._writer = None
+        self._start_lock = threading.Lock()
+
+        self._warm(legacy_path)
+
+    # ---------- PUBLIC ----------
+
+    def append(self, user_text, bot_text, lang="hinglish", intent=None, session=None,
+               source=None) -> dict:
+        """Record one turn. Never blocks on disk."""
+        record = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "language": lang,
+            "user": user_text,
+            "assistant": bot_text
+        }
+        if intent:
+            record["intent"] = intent
+        if source:
+            record["source"] = source       # who decided the intent: rule / classifier / llm
+        if session:
+            record["session"] = session
+
+        with self._ring_lock:
+            self._remember(record)
+            self._q.put(record)             # queue order == seq order
+        if self._stop.is_set():
+            self.flush()                    # closed: no writer left, write now
+        else:
+            self._start_writer()
+            self._wake.set()
+        return record
+
+    def recent(self, limit=None, session=None) -> list:
+        """
+        Last `limit` turns (all buffered turns if None), oldest first;
+        only `session`'s turns when a session id is given.
+        """
+        with self._ring_lock:
+            if session:
+                ring = self._sessions.get(session)
+                items = list(ring) if ring else []
+            else:
+                items = list(self._ring)
+        if limit is None:
+            return items
+        return items[-limit:] if limit > 0 else []
+
+    def flush(self):
+        """Write everything queued so far (the writer thread does this on its own)."""
+        with self._io_lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join(timeout=5)
+        self.flush()
+
+    def _remember(self, record):
+        # caller holds _ring_lock
+        if "seq" not in record:
+            record["seq"] = self._seq
+        self._seq = max(self._seq, record["seq"]) + 1
+        self._ring.append(record)
+
+        session = record.get("session")
+        if not session:
+            return
+        ring = self._sessions.pop(session, None)
+        if ring is None:
+            ring = deque(maxlen=self.session_ring_size)
+        ring.append(record)
+        self._sessions[session] = ring
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    # ---------- STARTUP ----------
+
+    def _warm(self, legacy_path):
+        """Fill the ring from the log tail (or import the old JSON history once)."""
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue        # torn last line after a crash
+                    if isinstance(record, dict):
+                        self._remember(record)
+            return
+
+        if legacy_path and os.path.exists(legacy_path):
+            try:
+                with open(legacy_path, encoding="utf-8") as f:
+                    history = json.load(f)
+            except (OSError, ValueError):
+                logger.warning("Could not import %s", legacy_path)
+                return
+            if isinstance(history, list):
+                history = [h for h in history if isinstance(h, dict)]
+                for record in history:
+                    self._remember(record)
+                with self._io_lock:
+                    self._write(history)
+
+    # ---------- WRITER ----------
+
+    def _start_writer(self):
+        if self._writer is not None:
+            return
+        with self._start_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="chat-log", daemon=True)
+                self._writer.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            # let a burst of turns pile up → one write (close() cuts the wait short)
+            self._stop.wait(self.flush_interval)
+            self.flush()
+
+    def _write(self, records):
+        # caller holds _io_lock
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        try:
+            self._rotate_if_needed()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(data)
+        except OSError:
+            logger.exception("chat log write failed (%d turns lost)", len(records))
+
+    def _rotate_if_needed(self):
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return
+        except OSError:
+            return
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
@@ -0,0 +1,99 @@
+# chunk_store.py
+"""
+Compact, memory-mapped chunk store (rag_data/chunks.bin).
+
+Layout:
+    magic   8 bytes   b"RAGCHNK1"
+    count   uint64
+    table   count x (id int64, offset uint64, length uint32), little-endian
+    payload one UTF-8 JSON object per chunk, at table[i].offset
+
+Only the table is touched at open time; a chunk's JSON is decoded when
+that chunk is read. Every process opening the file shares the same page
+cache instead of each holding its own parsed copy.
+"""
+import json, mmap, struct
+import numpy as np
+
+MAGIC = b"RAGCHNK1"
+_HEADER = struct.Struct("<8sQ")
+TABLE_DTYPE = np.dtype([("id", "<i8"), ("offset", "<u8"), ("length", "<u4")])
+
+
+def write_store(path: str, records) -> int:
+    """Write `records` (dicts with at least "id") to `path`; returns count."""
+    payloads = [
+        json.dumps(r, ensure_ascii=False).encode("utf-8") for r in records
+    ]
+    table = np.zeros(len(payloads), dtype=TABLE_DTYPE)
+    offset = _HEADER.size + TABLE_DTYPE.itemsize * len(payloads)
+    for i, (r, p) in enumerate(zip(records, payloads)):
+        table[i] = (r["id"], offset, len(p))
+        offset += len(p)
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(payloads)))
+        f.write(table.tobytes())
+        for p in payloads:
+            f.write(p)
+    return len(payloads)
+
+
+class _Field:
+    """Sequence view of one field across the store: store.texts[pos]."""
+
+    def __init__(self, store, name):
+        self._store = store
+        self._name = name
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, pos):
+        return self._store[pos][self._name]
+
+
+class ChunkStore:
+    """Read-only, lazily decoded view over chunks.bin."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chunk store")
+        self.table = np.frombuffer(
+            self._mm, dtype=TABLE_DTYPE, count=count, offset=_HEADER.size
+        )
+        self.ids = self.table["id"]
+        self._order = np.argsort(self.ids, kind="stable")
+        self._sorted_ids = self.ids[self._order]
+
+        self.texts = _Field(self, "text")
+        self.norms = _Field(self, "norm")
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, pos) -> dict:
+        if pos < 0:
+            pos += len(self.table)
+        row = self.table[pos]
+        start = int(row["offset"])
+        return json.loads(self._mm[start:start + int(row["length"])].decode("utf-8"))
+
+    def __iter__(self):
+        for pos in range(len(self)):
+            yield self[pos]
+
+    def positions(self, ids) -> list:
+        """Chunk ids → positions (unknown ids dropped), order preserved."""
+        if not len(self._sorted_ids):
+            return []
+        ids = np.asarray(ids, dtype="int64")
+        idx = np.searchsorted(self._sorted_ids, ids)
+        idx = np.minimum(idx, len(self._sorted_ids) - 1)
+        ok = self._sorted_ids[idx] == ids
+        return self._order[idx[ok]].tolist()
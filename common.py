@@ -1,19 +1,45 @@
-import uuid
 import os
 import asyncio
+import hashlib
+import logging
 import edge_tts
 
+from singleflight import SingleFlight
+from util import hinglish_to_hindi_reply
+
+logger = logging.getLogger(__name__)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 AUDIO_DIR = os.path.join(BASE_DIR, "audio_responses")
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
 VOICE = "hi-IN-SwaraNeural"
+# speak replies from Devanagari: the Hindi voice reads romanized Hinglish
+# poorly. Costs one batched (cached) translation request per new reply.
+TTS_HINDI_SCRIPT = os.getenv("TTS_HINDI_SCRIPT", "0") == "1"
+
+TTS_FLIGHT = SingleFlight("tts")
 
 async def tts_to_file(text):
-    fname = f"{uuid.uuid4().hex}.mp3"
+    if TTS_HINDI_SCRIPT:
+        try:
+            text = await hinglish_to_hindi_reply(text) or text
+        except Exception:
+            logger.exception("TTS translation failed, speaking the reply as is")
+
+    # named by content: the same reply (to several clients, or again later)
+    # is synthesized once and every client plays the same file
+    fname = hashlib.sha1(f"{VOICE}\0{text}".encode("utf-8")).hexdigest() + ".mp3"
+    return await TTS_FLIGHT.do(fname, lambda: _synthesize(text, fname))
+
+async def _synthesize(text, fname):
     path = os.path.join(AUDIO_DIR, fname)
+    if os.path.exists(path):
+        return fname
 
+    tmp = f"{path}.{os.getpid()}.part"
     communicate = edge_tts.Communicate(text, VOICE)
-    await communicate.save(path)
+    await communicate.save(tmp)
+    os.replace(tmp, path)
 
     return fname
@@ -0,0 +1,137 @@
+# context_packer.py
+"""
+Packs retrieved chunks into a prompt context under a token budget.
+
+- adjacent chunks of the same document are stitched back together,
+  dropping the overlap the ingester added between them
+- sentences already in the context are not repeated
+- blocks are added in rank order; one that does not fit is cut at a
+  sentence boundary instead of being dropped outright
+"""
+import os, re
+
+# rough prompt budgets for the retrieved context, per generation model
+MODEL_CONTEXT_TOKENS = {
+    "qwen2:0.5b": 350,
+    "llama-3.1-8b-instant": 1200,
+}
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "0")) or None
+
+MIN_BLOCK_TOKENS = 24       # don't bother adding a stub smaller than this
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SENT_RE = re.compile(r"(?<=[.!?।])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Tokenizer-free estimate: BPE vocabularies split long words, so count
+    word/punctuation pieces plus one extra per 6 chars of long words.
+    """
+    n = 0
+    for piece in _TOKEN_RE.findall(text):
+        n += 1 + max(0, len(piece) - 6) // 6
+    return n
+
+
+def budget_for(model: str) -> int:
+    return DEFAULT_CONTEXT_TOKENS or MODEL_CONTEXT_TOKENS.get(model, 500)
+
+
+def _overlap(a: str, b: str, max_len=200) -> int:
+    """Length of the longest suffix of a that is a prefix of b."""
+    for k in range(min(len(a), len(b), max_len), 0, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+
+def _position(chunk):
+    # (document, order within it); legacy chunks are one doc in id order
+    if "seq" in chunk:
+        return chunk.get("doc"), chunk["seq"]
+    return None, chunk.get("id", 0)
+
+
+def merge_adjacent(chunks) -> list:
+    """
+    Chunks in rank order → list of texts in rank order, where runs of
+    neighbouring chunks from one document are merged into a single block
+    (ranked at the position of its best member).
+    """
+    by_pos = {_position(c): c for c in chunks}
+    seen, blocks = set(), []
+
+    for c in chunks:
+        doc, seq = _position(c)
+        if (doc, seq) in seen:
+            continue
+
+        start = seq
+        while (doc, start - 1) in by_pos and (doc, start - 1) not in seen:
+            start -= 1
+
+        text, cur = "", start
+        while (doc, cur) in by_pos and (doc, cur) not in seen:
+            piece = by_pos[(doc, cur)]["text"]
+            text += piece[_overlap(text, piece):] if text else piece
+            seen.add((doc, cur))
+            cur += 1
+        blocks.append(text.strip())
+
+    return blocks
+
+
+def _sentences(text):
+    return [s for s in _SENT_RE.split(text) if s.strip()]
+
+
+def _key(sentence):
+    return re.sub(r"\W+", " ", sentence.lower()).strip()
+
+
+def pack_contexts(chunks, budget_tokens: int) -> list:
+    """Ranked chunk records → context strings within budget_tokens."""
+    out, used, emitted = [], 0, set()
+
+    for block in merge_adjacent(chunks):
+        kept = []
+        for s in _sentences(block):
+            k = _key(s)
+            if k and k not in emitted:
+                kept.append(s)
+        if not kept:
+            continue
+
+        room = budget_tokens - used
+        if room < MIN_BLOCK_TOKENS:
+            break
+
+        taken, cost = [], 0
+        for s in kept:
+            t = estimate_tokens(s)
+            if cost + t > room:
+                break
+            taken.append(s)
+            cost += t
+
+        if not taken:
+            # one long run-on "sentence": cut it by words instead
+            words, cut = kept[0].split(), []
+            for w in words:
+                t = estimate_tokens(w)
+                if cost + t > room:
+                    break
+                cut.append(w)
+                cost += t
+            if not cut:
+                continue
+            taken = [" ".join(cut)]
+        if cost < MIN_BLOCK_TOKENS and len(taken) < len(kept):
+            continue
+
+        emitted.update(_key(s) for s in taken)
+        out.append(" ".join(taken))
+        used += cost
+
+    return out
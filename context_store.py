@@ -0,0 +1,158 @@
+# context_store.py
+"""
+Per-session NLU context (college / department / year / last_intent).
+
+- each session has its own dict; reads and updates take one of
+  LOCK_STRIPES locks chosen by session id, so kiosks never wait on each
+  other's (or a global) lock
+- a session idle longer than `ttl` starts over empty
+- updates only mark the store dirty; a writer thread snapshots and
+  rewrites the JSON file at most every `flush_interval` seconds, off the
+  request path (and once more at exit)
+"""
+import os, json, time, atexit, logging, threading
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+NLU_CONTEXT_TTL = float(os.getenv("NLU_CONTEXT_TTL", "1800"))
+NLU_CONTEXT_MAX_SESSIONS = int(os.getenv("NLU_CONTEXT_MAX_SESSIONS", "5000"))
+NLU_CONTEXT_FLUSH_INTERVAL = float(os.getenv("NLU_CONTEXT_FLUSH_MS", "2000")) / 1000
+LOCK_STRIPES = 64
+# ----------------------------------------
+
+
+class ContextStore:
+    def __init__(self, path=None, ttl=NLU_CONTEXT_TTL, max_sessions=NLU_CONTEXT_MAX_SESSIONS,
+                 flush_interval=NLU_CONTEXT_FLUSH_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.flush_interval = flush_interval
+
+        self._sessions = {}         # session → {"data": {...}, "touched": epoch seconds}
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._io_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closed = False
+
+        self._load()
+        self._writer = None
+        if path:
+            self._writer = threading.Thread(target=self._run, name="nlu-context", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    def _lock(self, session):
+        return self._locks[hash(session) % LOCK_STRIPES]
+
+    # ---------- PUBLIC ----------
+
+    def get(self, session=None) -> dict:
+        """Copy of the session's context ({} if new or expired)."""
+        key = session or ""
+        with self._lock(key):
+            entry = self._sessions.get(key)
+            if entry is None:
+                return {}
+            if self._expired(entry, time.time()):
+                del self._sessions[key]
+                return {}
+            return dict(entry["data"])
+
+    def update(self, session, values: dict):
+        key = session or ""
+        now = time.time()
+        with self._lock(key):
+            entry = self._sessions.get(key)
+            if entry is None or self._expired(entry, now):
+                entry = self._sessions[key] = {"data": {}, "touched": now}
+            entry["data"].update(values)
+            entry["touched"] = now
+        if len(self._sessions) > self.max_sessions:
+            self._prune(now)
+        self._dirty.set()
+
+    def clear(self, session=None):
+        key = session or ""
+        with self._lock(key):
+            self._sessions.pop(key, None)
+        self._dirty.set()
+
+    def flush(self):
+        """Write the current state now (the writer thread does this on its own)."""
+        if not self.path:
+            return
+        self._dirty.clear()
+        now = time.time()
+        snapshot = {}
+        for key in list(self._sessions):
+            with self._lock(key):
+                entry = self._sessions.get(key)
+                if entry is not None and not self._expired(entry, now):
+                    snapshot[key] = {"data": dict(entry["data"]), "touched": entry["touched"]}
+
+        tmp = f"{self.path}.tmp"
+        with self._io_lock:
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"sessions": snapshot}, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError:
+                logger.exception("NLU context write failed")
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._dirty.set()
+        if self._writer is not None:
+            self._writer.join(timeout=5)
+        self.flush()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # ---------- INTERNAL ----------
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["touched"] > self.ttl
+
+    def _prune(self, now):
+        # expired sessions first, then the least recently touched
+        for key, entry in list(self._sessions.items()):
+            if self._expired(entry, now):
+                with self._lock(key):
+                    self._sessions.pop(key, None)
+        excess = len(self._sessions) - self.max_sessions
+        if excess > 0:
+            oldest = sorted(self._sessions.items(), key=lambda kv: kv[1]["touched"])[:excess]
+            for key, _ in oldest:
+                with self._lock(key):
+                    self._sessions.pop(key, None)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            logger.warning("Could not read %s, starting empty", self.path)
+            return
+        # the old single global context (no "sessions") is not carried over
+        sessions = saved.get("sessions") if isinstance(saved, dict) else None
+        now = time.time()
+        for key, entry in (sessions or {}).items():
+            if isinstance(entry, dict) and isinstance(entry.get("data"), dict):
+                entry = {"data": entry["data"], "touched": float(entry.get("touched", 0))}
+                if not self._expired(entry, now):
+                    self._sessions[key] = entry
+
+    def _run(self):
+        while not self._closed:
+            self._dirty.wait()
+            if self._closed:
+                return
+            time.sleep(self.flush_interval)       # batch the updates in this window
+            self.flush()
@@ -1,18 +1,16 @@
 # desi_brain.py (v2.1 – Respect Enforced)
 
-import re
 import random
 import datetime
 from collections import defaultdict
 
+from rule_matcher import MATCHER, RULES, analyze
+
 # ---------------------------
 # HARD RESPECT FILTER
 # ---------------------------
 
-FORBIDDEN_WORDS = {
-    "beta", "bhai", "bro", "yaar", "dost",
-    "dear", "boss", "buddy", "mate"
-}
+FORBIDDEN_WORDS = set(RULES["forbidden_words"])
 
 def enforce_respect(text: str) -> str:
     words = text.split()
@@ -24,25 +22,10 @@ def enforce_respect(text: str) -> str:
 # NORMALIZATION
 # ---------------------------
 
-HINGLISH_MAP = {
-    "kya": "what",
-    "kaun": "who",
-    "kaise": "how",
-    "kyu": "why",
-    "kab": "when",
-    "haan": "yes",
-    "nahi": "no",
-    "namaste": "hello",
-    "shukriya": "thanks"
-}
+HINGLISH_MAP = MATCHER.aliases
 
 def normalize(text: str) -> str:
-    t = text.lower().strip()
-    for k, v in HINGLISH_MAP.items():
-        t = re.sub(rf"\b{k}\b", v, t)
-    t = re.sub(r"[^\w\s]", " ", t)
-    t = re.sub(r"\s+", " ", t)
-    return t
+    return " ".join(MATCHER.tokens(text))
 
 
 # ---------------------------
@@ -62,86 +45,16 @@ def get_ctx(key):
 # INTENTS (RESPECTFUL ONLY)
 # ---------------------------
 
-INTENTS = [
-    {
-        "name": "greeting",
-        "patterns": ["hello", "hi", "hey", "namaste"],
-        "replies": [
-            "नमस्कार। कृपया बताइए, मैं आपकी किस प्रकार सहायता कर सकती हूँ?",
-            "नमस्ते। मैं आपकी सहायता के लिए उपलब्ध हूँ।",
-            "नमस्कार। आप क्या जानना चाहते हैं?"
-        ]
-    },
-    {
-        "name": "how_are_you",
-        "patterns": ["how are you", "kya haal", "kya scene"],
-        "replies": [
-            "धन्यवाद। मैं ठीक हूँ। कृपया बताइए, मैं आपकी कैसे सहायता कर सकती हूँ?",
-            "सब ठीक है। आप अपना प्रश्न बताइए।"
-        ]
-    },
-    {
-        "name": "who_are_you",
-        "patterns": ["who are you", "tum kaun", "aap kaun"],
-        "replies": [
-            "मैं सारा हूँ, एक डिजिटल सहायक, जो आपकी सहायता के लिए बनाई गई है।",
-            "मैं आपकी जानकारी और सहायता के लिए उपलब्ध एक एआई सहायक हूँ।"
-        ]
-    },
-    {
-        "name": "thanks",
-        "patterns": ["thanks", "thank you", "shukriya"],
-        "replies": [
-            "आपका धन्यवाद। यदि कोई और प्रश्न हो, तो कृपया बताइए।",
-            "धन्यवाद। आपकी सहायता करना मेरा उद्देश्य है।"
-        ]
-    },
-    {
-        "name": "time",
-        "patterns": ["time", "samay", "kitna baje"],
-        "dynamic": "time"
-    },
-    {
-        "name": "date",
-        "patterns": ["date", "aaj ka din"],
-        "dynamic": "date"
-    },
-    {
-        "name": "abuse",
-        "patterns": ["stupid", "idiot", "chutiya", "bewakoof"],
-        "replies": [
-            "कृपया सम्मानजनक भाषा का प्रयोग करें।",
-            "आइए शांति और सम्मान के साथ बातचीत करें।"
-        ]
-    },
-    {
-        "name": "joke",
-        "patterns": ["joke", "mazaak", "hasao"],
-        "replies": [
-            "एक हल्का सा हास्य: शिक्षक पूछते हैं – देर से क्यों आए? उत्तर मिला – सर, समय प्रबंधन सीख रहा था।",
-            "कभी-कभी मुस्कान भी ऊर्जा देती है।"
-        ]
-    },
-    {
-        "name": "motivation",
-        "patterns": ["motivate", "himmat", "confidence"],
-        "replies": [
-            "आपमें क्षमता है। निरंतर प्रयास करते रहिए।",
-            "धैर्य और अनुशासन सफलता की कुंजी हैं।"
-        ]
-    }
-]
+# patterns / replies live in rules.json ("small_talk")
+INTENTS = RULES["small_talk"]
 
 # ---------------------------
 # SCORING
 # ---------------------------
 
-def score_intent(text: str, intent) -> int:
-    score = 0
-    for p in intent["patterns"]:
-        if re.search(rf"\b{re.escape(p)}\b", text):
-            score += 2
-    return score
+def score_intents(text: str) -> dict:
+    """intent name → 2 per distinct pattern found (one scan for all intents)."""
+    return {name: 2 * n for name, n in analyze(text).counts("small_talk").items()}
 
 
 # ---------------------------
@@ -165,13 +78,13 @@ def desi_brain(text: str) -> str | None:
     if not text:
         return None
 
-    t = normalize(text)
+    scores = score_intents(text)
 
     best_intent = None
     best_score = 0
 
     for intent in INTENTS:
-        s = score_intent(t, intent)
+        s = scores.get(intent["name"], 0)
         if s > best_score:
             best_score = s
             best_intent = intent
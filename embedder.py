@@ -0,0 +1,176 @@
+# embedder.py
+import os, time, queue, logging, threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from cache import BoundedCache
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+
+EMBED_BATCH_WINDOW = float(os.getenv("EMBED_BATCH_WINDOW_MS", "3")) / 1000
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+EMBED_PARALLEL = int(os.getenv("EMBED_PARALLEL", "4"))
+EMBED_CACHE_ITEMS = int(os.getenv("EMBED_CACHE_ITEMS", "4096"))
+# ----------------------------------------
+
+
+class Embedder:
+    """
+    Ollama embedding client with a (model, text) cache and micro-batching.
+
+    Callers submit single texts; a worker thread gathers whatever arrives
+    within `window` seconds (up to `max_batch`) and sends it as ONE
+    /api/embed request, then fans the vectors back out to each caller's
+    Future. At most `parallel` batches are in flight at once. Older Ollama
+    builds without /api/embed fall back to parallel /api/embeddings calls.
+
+    Returned vectors are raw float32 and read-only (shared with the cache).
+    """
+
+    def __init__(self, model, url=OLLAMA_URL, window=EMBED_BATCH_WINDOW,
+                 max_batch=EMBED_MAX_BATCH, parallel=EMBED_PARALLEL,
+                 cache_items=EMBED_CACHE_ITEMS, timeout=10):
+        self.model = model
+        self.url = url
+        self.window = window
+        self.max_batch = max_batch
+        self.parallel = parallel
+        self.timeout = timeout
+        self.cache = BoundedCache(
+            max_items=cache_items,
+            max_bytes=cache_items * 16 * 1024,
+            sizeof=lambda v: v.nbytes
+        )
+
+        self._q = queue.Queue()
+        self._slots = threading.Semaphore(parallel)
+        self._pool = ThreadPoolExecutor(parallel, thread_name_prefix="embed")
+        self._legacy_pool = None
+        self._session = requests.Session()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    # ---------- PUBLIC ----------
+
+    def submit(self, text: str) -> Future:
+        fut = Future()
+        vec = self.cache.get((self.model, text))
+        if vec is not None:
+            fut.set_result(vec)
+            return fut
+
+        self._ensure_worker()
+        self._q.put((text, fut))
+        return fut
+
+    def embed(self, text: str, timeout=None) -> np.ndarray:
+        return self.submit(text).result(timeout)
+
+    def embed_many(self, texts, timeout=None) -> list:
+        futs = [self.submit(t) for t in texts]
+        return [f.result(timeout) for f in futs]
+
+    # ---------- BATCHING ----------
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="embed-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def close(self):
+        """Stop the batcher and release the HTTP pools (for short-lived embedders)."""
+        if self._worker is not None:
+            self._q.put(None)
+        self._pool.shutdown(wait=False)
+        if self._legacy_pool is not None:
+            self._legacy_pool.shutdown(wait=False)
+        self._session.close()
+
+    def _run(self):
+        while True:
+            item = self._q.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = self._q.get(timeout=remaining)
+                    else:
+                        item = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._q.put(None)   # close() requested; finish this batch first
+                    break
+                batch.append(item)
+
+            self._slots.acquire()
+            self._pool.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        try:
+            waiters = {}
+            for text, fut in batch:
+                waiters.setdefault(text, []).append(fut)
+            texts = list(waiters)
+
+            try:
+                vecs = self._request(texts)
+            except Exception as e:
+                for futs in waiters.values():
+                    for f in futs:
+                        f.set_exception(e)
+                return
+
+            for text, vec in zip(texts, vecs):
+                vec.setflags(write=False)
+                self.cache.set((self.model, text), vec)
+                for f in waiters[text]:
+                    f.set_result(vec)
+        finally:
+            self._slots.release()
+
+    # ---------- HTTP ----------
+
+    def _request(self, texts):
+        if self._legacy_pool is None:
+            r = self._session.post(
+                f"{self.url}/api/embed",
+                json={"model": self.model, "input": texts},
+                timeout=self.timeout
+            )
+            if r.status_code == 404 and "model" not in r.text.lower():
+                logger.warning("/api/embed not supported, using /api/embeddings")
+                self._legacy_pool = ThreadPoolExecutor(
+                    self.parallel, thread_name_prefix="embed-legacy"
+                )
+            else:
+                r.raise_for_status()
+                vecs = r.json()["embeddings"]
+                if len(vecs) != len(texts):
+                    raise ValueError("embedding count mismatch")
+                return [np.asarray(v, dtype="float32") for v in vecs]
+
+        return list(self._legacy_pool.map(self._request_one, texts))
+
+    def _request_one(self, text):
+        r = self._session.post(
+            f"{self.url}/api/embeddings",
+            json={"model": self.model, "prompt": text},
+            timeout=self.timeout
+        )
+        r.raise_for_status()
+        return np.asarray(r.json()["embedding"], dtype="float32")
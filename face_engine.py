@@ -1,28 +1,27 @@
 import os
 import pickle
 import cv2
-import numpy as np
 import face_recognition
 
+from face_gallery import FACE_TOP_K, FaceGallery
+
 BASE_DIR = os.path.dirname(__file__)
 FACES_DIR = os.path.join(BASE_DIR, "known_faces")
 ENC_FILE = os.path.join(BASE_DIR, "known_faces.pkl")
 
-_known_encodings = []
-_known_names = []
+_gallery = FaceGallery([], [])
 _loaded = False
 
 
 def load_known_faces():
-    global _known_encodings, _known_names, _loaded
+    global _gallery, _loaded
     if _loaded:
         return
 
     if os.path.exists(ENC_FILE):
         with open(ENC_FILE, "rb") as f:
             data = pickle.load(f)
-        _known_encodings = data["encodings"]
-        _known_names = data["names"]
+        _gallery = FaceGallery(data["encodings"], data["names"])
         _loaded = True
         return
 
@@ -47,33 +46,31 @@ def load_known_faces():
                 _known_encodings.append(e)
                 _known_names.append(person)
 
+    _gallery = FaceGallery(_known_encodings, _known_names)
     with open(ENC_FILE, "wb") as f:
         pickle.dump(
-            {"encodings": _known_encodings, "names": _known_names}, f
+            {"encodings": _gallery.matrix, "names": _gallery.names}, f
         )
 
     _loaded = True
 
 
-def recognize_faces(frame, tolerance=0.55):
+def recognize_faces_detailed(frame, tolerance=0.55, k=FACE_TOP_K):
+    """
+    Per detected face: {"name", "distance", "box": (top, right, bottom, left),
+    "candidates": top-k [{"name", "distance"}]}; all faces matched in one batch.
+    """
     load_known_faces()
 
     rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
     locs = face_recognition.face_locations(rgb, model="hog")
     encs = face_recognition.face_encodings(rgb, locs)
 
-    names = []
+    matches = _gallery.match(encs, k=k, tolerance=tolerance)
+    for m, loc in zip(matches, locs):
+        m["box"] = tuple(loc)
+    return matches
 
-    for enc in encs:
-        if not _known_encodings:
-            names.append("Unknown")
-            continue
 
-        dists = face_recognition.face_distance(_known_encodings, enc)
-        idx = int(np.argmin(dists))
-        if dists[idx] <= tolerance:
-            names.append(_known_names[idx])
-        else:
-            names.append("Unknown")
-
-    return names
+def recognize_faces(frame, tolerance=0.55):
+    return [m["name"] for m in recognize_faces_detailed(frame, tolerance)]
@@ -0,0 +1,108 @@
+# face_gallery.py
+"""
+Known-face gallery for recognition: every enrolled encoding in one
+contiguous float32 matrix, matched against all faces of a frame at once.
+
+- numpy: one (faces x gallery) distance matrix per frame via
+  |q|² + |x|² - 2·q·xᵀ (a single matrix multiply), norms precomputed
+- FAISS (IndexFlatL2) once the gallery reaches FACE_FAISS_MIN encodings,
+  if faiss is importable; FACE_INDEX=numpy|faiss forces either
+
+Distances are Euclidean, the same scale as face_recognition.face_distance,
+so the usual tolerance (~0.55) applies unchanged.
+"""
+import os, logging
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+FACE_INDEX = os.getenv("FACE_INDEX", "auto")                 # auto | numpy | faiss
+FACE_FAISS_MIN = int(os.getenv("FACE_FAISS_MIN", "2000"))
+FACE_TOP_K = int(os.getenv("FACE_TOP_K", "3"))
+# ----------------------------------------
+
+UNKNOWN = "Unknown"
+ENCODING_DIM = 128          # face_recognition / dlib
+
+
+class FaceGallery:
+    def __init__(self, encodings, names, index=FACE_INDEX):
+        self.names = list(names)
+        if self.names:
+            matrix = np.asarray(encodings, dtype="float32").reshape(len(self.names), -1)
+        else:
+            matrix = np.zeros((0, ENCODING_DIM), dtype="float32")
+        self.matrix = np.ascontiguousarray(matrix)
+        self.sq_norms = (self.matrix ** 2).sum(axis=1)
+        self.index = None
+
+        use_faiss = index == "faiss" or (index == "auto" and len(self.names) >= FACE_FAISS_MIN)
+        if use_faiss and len(self.names):
+            if faiss is None:
+                logger.warning("faiss not installed, matching faces with numpy")
+            else:
+                self.index = faiss.IndexFlatL2(self.matrix.shape[1])
+                self.index.add(self.matrix)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def backend(self) -> str:
+        return "faiss" if self.index is not None else "numpy"
+
+    # ---------- SEARCH ----------
+
+    def search(self, queries, k):
+        """(distances, rows), each (faces, k'), nearest first; k' = min(k, gallery size)."""
+        q = np.ascontiguousarray(np.asarray(queries, dtype="float32").reshape(-1, self.matrix.shape[1]))
+        k = min(k, len(self.names))
+        if not len(q) or not k:
+            return np.zeros((len(q), 0), "float32"), np.zeros((len(q), 0), "int64")
+
+        if self.index is not None:
+            sq, rows = self.index.search(q, k)
+            return np.sqrt(np.maximum(sq, 0)), rows
+
+        sq = (q ** 2).sum(axis=1)[:, None] + self.sq_norms[None, :] - 2.0 * (q @ self.matrix.T)
+        np.maximum(sq, 0, out=sq)
+        if k < len(self.names):
+            rows = np.argpartition(sq, k - 1, axis=1)[:, :k]
+        else:
+            rows = np.broadcast_to(np.arange(len(self.names)), sq.shape).copy()
+        part = np.take_along_axis(sq, rows, axis=1)
+        order = np.argsort(part, axis=1)
+        rows = np.take_along_axis(rows, order, axis=1)
+        return np.sqrt(np.take_along_axis(part, order, axis=1)), rows
+
+    def match(self, queries, k=FACE_TOP_K, tolerance=0.55) -> list:
+        """
+        Per face: {"name", "distance", "candidates": [{"name", "distance"}, ...]}
+        with up to k distinct people, nearest first. "name" is UNKNOWN when
+        the nearest is farther than `tolerance`.
+        """
+        # several encodings per person → look a bit deeper, keep each person's best
+        dists, rows = self.search(queries, k * 4)
+        out = []
+        for drow, rrow in zip(dists, rows):
+            candidates, seen = [], set()
+            for d, r in zip(drow.tolist(), rrow.tolist()):
+                if r < 0 or self.names[r] in seen:
+                    continue
+                seen.add(self.names[r])
+                candidates.append({"name": self.names[r], "distance": d})
+                if len(candidates) == k:
+                    break
+            best = candidates[0] if candidates else None
+            out.append({
+                "name": best["name"] if best and best["distance"] <= tolerance else UNKNOWN,
+                "distance": best["distance"] if best else None,
+                "candidates": candidates,
+            })
+        return out
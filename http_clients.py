@@ -0,0 +1,60 @@
+# http_clients.py
+import os
+import asyncio
+import logging
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+# per-backend keep-alive pool: max open connections + timeouts (seconds)
+BACKENDS = {
+    "groq": {
+        "limit": int(os.getenv("GROQ_POOL_LIMIT", "16")),
+        "timeout": float(os.getenv("GROQ_TIMEOUT", "30")),
+        "connect_timeout": float(os.getenv("GROQ_CONNECT_TIMEOUT", "5")),
+        "keepalive": float(os.getenv("GROQ_KEEPALIVE", "60")),
+    },
+    "ollama": {
+        "limit": int(os.getenv("OLLAMA_POOL_LIMIT", "8")),
+        "timeout": float(os.getenv("OLLAMA_TIMEOUT", "30")),
+        "connect_timeout": float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "2")),
+        "keepalive": float(os.getenv("OLLAMA_KEEPALIVE", "60")),
+    },
+}
+# ----------------------------------------
+
+# aiohttp sessions are bound to the loop that created them, and this code
+# runs on more than one loop (ws_server's, server.py's background _loop)
+_sessions = {}
+
+
+def get_session(backend: str) -> aiohttp.ClientSession:
+    """Shared keep-alive session for `backend` on the running event loop."""
+    loop = asyncio.get_running_loop()
+    key = (backend, loop)
+    session = _sessions.get(key)
+    if session is None or session.closed:
+        cfg = BACKENDS[backend]
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=cfg["limit"],
+                keepalive_timeout=cfg["keepalive"]
+            ),
+            timeout=aiohttp.ClientTimeout(
+                total=cfg["timeout"],
+                sock_connect=cfg["connect_timeout"]
+            )
+        )
+        _sessions[key] = session
+    return session
+
+
+async def close_sessions():
+    """Close every session owned by the running loop (call on shutdown)."""
+    loop = asyncio.get_running_loop()
+    for key in [k for k in _sessions if k[1] is loop]:
+        session = _sessions.pop(key)
+        if not session.closed:
+            await session.close()
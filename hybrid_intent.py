@@ -1,8 +1,17 @@
 # hybrid_intent.py
 
+import os
 import re
-from nlu_engine import nlu_pipeline
-from llm_engine import call_llm_api
+from cache import BoundedCache
+from nlu_engine import NLU_CONFIDENCE_THRESHOLD, nlu_analyze
+from llm_engine import CHAT_STORE
+from llm_router import ROUTER
+from intent_classifier import INTENT_CLS_THRESHOLD, build_classifier
+from rule_matcher import MATCHER
+
+# repeated ambiguous utterances reuse the classifier / LLM decision
+INTENT_DECISION_ITEMS = int(os.getenv("INTENT_DECISION_ITEMS", "2000"))
+INTENT_DECISION_TTL = float(os.getenv("INTENT_DECISION_TTL", str(24 * 3600)))
 
 # -----------------------------
 # Confidence Heuristics
@@ -29,27 +38,56 @@ ALLOWED_INTENTS = {
     "GENERAL"
 }
 
-def _low_confidence(intent: str, state: str, text: str) -> bool:
+def _low_confidence(nlu) -> bool:
     """
-    When should we consult LLM?
+    When should we consult the classifier / LLM?
+    (CLARIFY, clashing keywords, long or college-ish GENERAL queries)
     """
-    if state == "CLARIFY":
-        return True
+    return nlu.confidence < NLU_CONFIDENCE_THRESHOLD
 
-    # long GENERAL queries are often misclassified
-    if intent == "GENERAL" and len(text.split()) > 4:
-        return True
 
-    return False
+# -----------------------------
+# Local Classifier (no network)
+# -----------------------------
+
+# trained once at startup: rules.json examples + recent rule-decided turns
+CLASSIFIER = build_classifier(CHAT_STORE.recent(), allowed=ALLOWED_INTENTS)
+
+
+# -----------------------------
+# Decision Cache
+# -----------------------------
+
+# canonical utterance → (intent, source). Slots are not cached: they come
+# from the fresh NLU run, which also keeps the conversation context current.
+DECISIONS = BoundedCache(max_items=INTENT_DECISION_ITEMS, ttl=INTENT_DECISION_TTL)
+SOURCES = {"rule": 0, "classifier": 0, "llm": 0, "cache": 0}
+
+
+def canonical(text: str) -> str:
+    # same tokens + aliases as the rules: "CSE HOD kaun hai?" == "cse hod who hai"
+    return " ".join(MATCHER.tokens(text))
+
+
+def intent_stats() -> dict:
+    return {"sources": dict(SOURCES), "decisions": DECISIONS.stats()}
+
+
+def clear_decisions() -> int:
+    """Forget every cached decision (e.g. after rules.json or the examples changed)."""
+    n = len(DECISIONS)
+    DECISIONS.clear()
+    return n
 
 
 # -----------------------------
 # LLM Intent Picker (SAFE)
 # -----------------------------
 
-def _llm_pick_intent(text: str) -> str:
+async def _llm_pick_intent(text: str):
     """
     LLM is forced to choose ONE intent from whitelist.
+    None when the call failed or the answer was not a listed intent.
     """
     prompt = (
         "You are an intent classifier.\n\n"
@@ -62,37 +100,67 @@ def _llm_pick_intent(text: str) -> str:
         "Intent:"
     )
 
+    # the utterance alone: no persona, no chat history from any session
+    request = {
+        "temperature": 0.0,
+        "max_tokens": 12,
+        "messages": [{"role": "user", "content": prompt}]
+    }
+
     try:
-        raw = call_llm_api(prompt, lang="en")
+        raw = await ROUTER.complete("intent", request)
         cleaned = re.sub(r"[^A-Z_]", "", raw.upper())
         if cleaned in ALLOWED_INTENTS:
             return cleaned
     except Exception:
         pass
 
-    return "GENERAL"
+    return None
 
 
 # -----------------------------
 # Public Resolver
 # -----------------------------
 
-def resolve_intent(text: str):
+async def resolve_intent(text: str, session_id=None):
     """
+    `session_id` selects whose conversation context fills missing slots.
+
     Returns:
       intent (str)
       slots (dict)
-      source ("rule" | "llm")
+      source ("rule" | "classifier" | "llm")
     """
 
     # 1️⃣ Rule-based NLU
-    intent, slots, state = nlu_pipeline(text)
+    nlu = nlu_analyze(text, session_id)
+    slots = nlu.slots
 
     # 2️⃣ If confident → trust rules
-    if not _low_confidence(intent, state, text):
-        return intent, slots, "rule"
-
-    # 3️⃣ LLM fallback (restricted)
-    llm_intent = _llm_pick_intent(text)
-
+    if not _low_confidence(nlu):
+        SOURCES["rule"] += 1
+        return nlu.intent, slots, "rule"
+
+    # 3️⃣ Decided this utterance before
+    key = canonical(text)
+    decided = DECISIONS.get(key)
+    if decided is not None:
+        SOURCES["cache"] += 1
+        intent, source = decided
+        return intent, slots, source
+
+    # 4️⃣ Local classifier; the LLM only sees what it is unsure about
+    cls_intent, confidence = CLASSIFIER.predict(text)
+    if confidence >= INTENT_CLS_THRESHOLD:
+        SOURCES["classifier"] += 1
+        DECISIONS.set(key, (cls_intent, "classifier"))
+        return cls_intent, slots, "classifier"
+
+    # 5️⃣ LLM fallback (restricted); failures are not cached
+    SOURCES["llm"] += 1
+    llm_intent = await _llm_pick_intent(text)
+    if llm_intent is None:
+        return "GENERAL", slots, "llm"
+
+    DECISIONS.set(key, (llm_intent, "llm"))
     return llm_intent, slots, "llm"
@@ -1,54 +1,224 @@
-# ingest_docx_groq.py (MEMORY SAFE)
-import re, json
+# ingest_docx_groq.py (STREAMING, MULTI-DOC)
+import os, re, json, glob, zlib, shutil, hashlib
 from zipfile import ZipFile
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import xml.etree.ElementTree as ET
 import argparse
 
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def iter_blocks(docx_path):
+    """
+    Incrementally parses word/document.xml straight from the zip stream.
+    Yields ("para", text) for body paragraphs and ("cell", text) for table
+    cells, clearing each element once used so memory stays flat.
+    """
+    with ZipFile(docx_path) as z, z.open("word/document.xml") as xml:
+        body = None
+        cells = []          # text buffers of open w:tc (tables can nest)
+        paras = []          # text buffers of open w:p (text boxes nest inside paragraphs)
+
+        for event, el in ET.iterparse(xml, events=("start", "end")):
+            tag = el.tag
+            if event == "start":
+                if tag == W + "body":
+                    body = el
+                elif tag == W + "tc":
+                    cells.append([])
+                elif tag == W + "p":
+                    paras.append([])
+                continue
+
+            if tag == W + "t":
+                if el.text and paras:
+                    paras[-1].append(el.text)
+            elif tag in (W + "tab", W + "br", W + "cr"):
+                if paras:
+                    paras[-1].append(" ")
+            elif tag == W + "p":
+                text = "".join(paras.pop()).strip()
+                if cells:
+                    if text:
+                        cells[-1].append(text)
+                elif text:
+                    yield "para", text
+                el.clear()
+            elif tag == W + "tc":
+                text = " ".join(cells.pop()).strip()
+                if text:
+                    yield "cell", text
+                el.clear()
+
+            # drop finished top-level blocks so the tree never grows
+            if body is not None and tag in (W + "p", W + "tbl", W + "sdt"):
+                if el in body:
+                    body.remove(el)
+
+
 def extract_text_stream(docx_path):
-    with ZipFile(docx_path) as z:
-        xml = z.read("word/document.xml").decode("utf-8")
+    for _, text in iter_blocks(docx_path):
+        yield re.sub(r"\s+", " ", text)
+
+
+# a block whose hash hits this modulus always closes its chunk, so after an
+# edit the chunk boundaries fall back into step at the next such block
+ANCHOR_EVERY = 4
+
+
+def stable_chunk_id(doc, text, occurrence=0) -> int:
+    """
+    Chunk id from the chunk's content, not its position: editing one part
+    of a document leaves every other chunk (and its vector) with its id.
+    `occurrence` separates identical texts repeated within one document.
+    """
+    key = f"{doc}\0{occurrence}\0{text}".encode("utf-8")
+    return int.from_bytes(hashlib.sha1(key).digest()[:8], "big") & (2**63 - 1)
+
+
+def _is_anchor(text) -> bool:
+    return zlib.crc32(text.encode("utf-8")) % ANCHOR_EVERY == 0
+
+
+def _split_long(text, chunk_size, overlap):
+    """A single block longer than chunk_size → overlapping windows of that block only."""
+    step = max(chunk_size - overlap, 1)
+    return [text[i:i + chunk_size] for i in range(0, max(len(text) - overlap, 1), step)]
+
+
+def pack_blocks(blocks, chunk_size=400, overlap=80):
+    """
+    Whole paragraphs / table cells packed into chunks of at most chunk_size
+    characters. A chunk never starts or ends inside a block (except for a
+    block that alone exceeds chunk_size, which is windowed with `overlap`),
+    so an edit changes only the chunks around the edited block.
+    """
+    buffer = []
+    size = 0
+    for text in blocks:
+        if buffer and size + 1 + len(text) > chunk_size:
+            yield " ".join(buffer)
+            buffer, size = [], 0
 
-    for match in re.finditer(r"<w:t[^>]*>(.*?)</w:t>", xml, re.DOTALL):
-        text = match.group(1).strip()
-        if text:
-            yield re.sub(r"\s+", " ", text)
+        if len(text) > chunk_size:
+            yield from _split_long(text, chunk_size, overlap)
+            continue
+
+        buffer.append(text)
+        size += len(text) + (1 if size else 0)
+        if _is_anchor(text):
+            yield " ".join(buffer)
+            buffer, size = [], 0
+
+    if buffer:
+        yield " ".join(buffer)
+
+
+def chunk_document(docx_path, part_path, chunk_size=400, overlap=80, doc=None):
+    """
+    Worker: chunks one document into a JSONL part file.
+    Returns (doc, part_path, chunk_count).
+    """
+    doc = doc or os.path.basename(docx_path)
+    seq = 0
+    seen = {}
+
+    with open(part_path, "w", encoding="utf-8") as f:
+        for text in pack_blocks(extract_text_stream(docx_path), chunk_size, overlap):
+            n = seen[text] = seen.get(text, -1) + 1
+            record = {"id": stable_chunk_id(doc, text, n), "doc": doc, "seq": seq, "text": text}
+            json.dump(record, f, ensure_ascii=False)
+            f.write("\n")
+            seq += 1
+
+    return doc, part_path, seq
+
+
+def expand_inputs(inputs):
+    """
+    Files, directories (searched recursively) and glob patterns → list of
+    (.docx path, doc name). The doc name is the path relative to its input
+    root ("cse/syllabus.docx"), so same-named files in different folders
+    stay apart, as in ingest_watch.
+    """
+    docs = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            root = item
+            found = glob.glob(os.path.join(item, "**", "*.docx"), recursive=True)
+        elif glob.has_magic(item):
+            root = item
+            while glob.has_magic(root):
+                root = os.path.dirname(root)
+            found = glob.glob(item, recursive=True)
+        else:
+            root = os.path.dirname(item)
+            found = [item]
+        for p in sorted(found):
+            if os.path.basename(p).startswith("~$"):
+                continue
+            # same file given twice → ingest once
+            docs.setdefault(p, os.path.relpath(p, root or ".").replace(os.sep, "/"))
+    return list(docs.items())
+
+
+def main(inputs, out_dir="rag_data", chunk_size=400, overlap=80, workers=None):
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    docs = expand_inputs(inputs)
+    if not docs:
+        print("No .docx files found.")
+        return
 
-def main(docx_path, out_dir="rag_data", chunk_size=400, overlap=80):
     Path(out_dir).mkdir(exist_ok=True)
+    parts_dir = Path(out_dir) / ".parts"
+    parts_dir.mkdir(exist_ok=True)
 
-    out_file = Path(out_dir) / "chunks.json"
-    chunk_id = 0
-    buffer = ""
+    jobs = [
+        (path, str(parts_dir / f"{i:05d}.jsonl"), chunk_size, overlap, doc)
+        for i, (path, doc) in enumerate(docs)
+    ]
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(chunk_document, *zip(*jobs)))
+    else:
+        results = [chunk_document(*job) for job in jobs]
 
+    # merge part files in input order → one combined chunks.json
+    out_file = Path(out_dir) / "chunks.json"
+    total = 0
     with open(out_file, "w", encoding="utf-8") as f:
         f.write('{"chunks":[\n')
 
         first = True
-        for piece in extract_text_stream(docx_path):
-            buffer += " " + piece
-
-            while len(buffer) >= chunk_size:
-                chunk = buffer[:chunk_size]
-                buffer = buffer[chunk_size - overlap:]
+        for doc, part_path, count in results:
+            with open(part_path, encoding="utf-8") as part:
+                for line in part:
+                    if not first:
+                        f.write(",\n")
+                    f.write(line.rstrip("\n"))
 
-                record = {"id": chunk_id, "text": chunk}
-                if not first:
-                    f.write(",\n")
-                json.dump(record, f, ensure_ascii=False)
-
-                first = False
-                chunk_id += 1
+                    first = False
+                    total += 1
+            print(f"  {doc}: {count} chunks")
 
         f.write("\n]}")
 
-    print(f"✅ Done. Created {chunk_id} chunks safely.")
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    print(f"✅ Done. Created {total} chunks from {len(docs)} document(s).")
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("docx", nargs="?", default="Training data for CSE.docx")
+    parser.add_argument("docs", nargs="*", default=["Training data for CSE.docx"],
+                        help=".docx files, directories or glob patterns")
     parser.add_argument("--out", default="rag_data")
     parser.add_argument("--chunk", type=int, default=400)
     parser.add_argument("--overlap", type=int, default=80)
+    parser.add_argument("--workers", type=int, default=None)
     args = parser.parse_args()
 
-    main(args.docx, args.out, args.chunk, args.overlap)
+    main(args.docs, args.out, args.chunk, args.overlap, args.workers)
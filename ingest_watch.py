@@ -0,0 +1,235 @@
+# ingest_watch.py
+"""
+Keeps rag_data in sync with a folder of .docx files.
+
+The folder is polled every POLL_SECONDS. A document whose size/mtime moved
+is re-hashed, and only documents whose content really changed are
+re-chunked. Chunk ids come from (document, text) — see stable_chunk_id —
+so untouched chunks keep their ids and vectors, and build() only embeds
+and indexes the difference. The build bumps rag_data/VERSION, which every
+live Retriever picks up on its next check; in-process callers can pass
+on_update to reload immediately.
+
+    python ingest_watch.py college_docs/ --rag-dir rag_data
+"""
+import os, json, time, glob, hashlib, logging, argparse, tempfile, threading
+from zipfile import BadZipFile
+
+from build_embeddings_ollama import build
+from ingest_docx_groq import chunk_document
+from rag_index import tmp_path
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+WATCH_DIR = os.getenv("RAG_WATCH_DIR", "")
+POLL_SECONDS = float(os.getenv("RAG_WATCH_POLL", "5"))
+SETTLE_SECONDS = float(os.getenv("RAG_WATCH_SETTLE", "3"))   # let Word finish saving
+STATE_FILE = "sources.json"
+# ----------------------------------------
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan(docs_dir: str) -> dict:
+    """relative path → (absolute path, size, mtime_ns) for every .docx."""
+    found = {}
+    for path in glob.glob(os.path.join(docs_dir, "**", "*.docx"), recursive=True):
+        if os.path.basename(path).startswith("~$"):     # Word lock files
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        rel = os.path.relpath(path, docs_dir).replace(os.sep, "/")
+        found[rel] = (path, st.st_size, st.st_mtime_ns)
+    return found
+
+
+class DocWatcher:
+    """
+    Polls `docs_dir` and rebuilds `rag_dir` incrementally when documents
+    are added, edited or deleted. The folder is the source of truth:
+    chunks.json ends up holding exactly the chunks of the watched docs.
+    """
+
+    def __init__(self, docs_dir, rag_dir="rag_data", on_update=None,
+                 poll=POLL_SECONDS, settle=SETTLE_SECONDS,
+                 chunk_size=400, overlap=80):
+        self.docs_dir = docs_dir
+        self.rag_dir = rag_dir
+        self.on_update = on_update
+        self.poll = poll
+        self.settle = settle
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.state = self._load_state()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- STATE ----------
+
+    def _path(self, name):
+        return os.path.join(self.rag_dir, name)
+
+    def _load_state(self):
+        try:
+            with open(self._path(STATE_FILE), encoding="utf-8") as f:
+                return json.load(f)["docs"]
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def _save_state(self, state):
+        path = self._path(STATE_FILE)
+        tmp = tmp_path(path)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"docs": state}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+        self.state = state
+
+    def _load_chunks(self):
+        try:
+            with open(self._path("chunks.json"), encoding="utf-8") as f:
+                return json.load(f)["chunks"]
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def _write_chunks(self, chunks):
+        path = self._path("chunks.json")
+        tmp = tmp_path(path)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"chunks": chunks}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    # ---------- SYNC ----------
+
+    def _detect(self, found):
+        """→ (new state, changed docs). Touched-but-identical files aren't changes."""
+        state, changed = {}, []
+        now = time.time_ns()
+
+        for rel, (path, size, mtime) in sorted(found.items()):
+            old = self.state.get(rel)
+            if old and old["size"] == size and old["mtime_ns"] == mtime:
+                state[rel] = old
+                continue
+            if now - mtime < self.settle * 1e9:
+                # still being written; keep what we had and look again next poll
+                if old:
+                    state[rel] = old
+                continue
+
+            try:
+                digest = file_hash(path)
+            except OSError:
+                if old:
+                    state[rel] = old
+                continue
+            state[rel] = {"hash": digest, "size": size, "mtime_ns": mtime}
+            if not old or old["hash"] != digest:
+                changed.append(rel)
+
+        return state, changed
+
+    def _rechunk(self, changed, found, state):
+        """Chunk the changed docs; a doc that can't be read keeps its old chunks."""
+        fresh, failed = {}, []
+        with tempfile.TemporaryDirectory(dir=self.rag_dir) as tmp:
+            for i, rel in enumerate(changed):
+                part = os.path.join(tmp, f"{i:05d}.jsonl")
+                try:
+                    chunk_document(found[rel][0], part, self.chunk_size,
+                                   self.overlap, doc=rel)
+                except (BadZipFile, KeyError, OSError, SyntaxError) as e:
+                    logger.warning("Skipping %s for now: %s", rel, e)
+                    failed.append(rel)
+                    continue
+                with open(part, encoding="utf-8") as f:
+                    fresh[rel] = [json.loads(line) for line in f]
+
+        for rel in failed:
+            if rel in self.state:
+                state[rel] = self.state[rel]
+            else:
+                state.pop(rel, None)
+        return fresh
+
+    def sync(self):
+        """One pass: returns build stats if rag_data was rebuilt, else None."""
+        found = scan(self.docs_dir)
+        if not found and self.state:
+            # an empty folder is far more likely an unmounted share than
+            # staff deleting every document at once
+            logger.warning("No documents in %s, leaving the index as is", self.docs_dir)
+            return None
+
+        state, changed = self._detect(found)
+        removed = [rel for rel in self.state if rel not in found]
+        fresh = self._rechunk(changed, found, state) if changed else {}
+        if not fresh and not removed:
+            if state != self.state:
+                self._save_state(state)
+            return None
+
+        kept = [c for c in self._load_chunks()
+                if c.get("doc") in state and c["doc"] not in fresh]
+        for chunks in fresh.values():
+            kept.extend(chunks)
+        order = {rel: i for i, rel in enumerate(state)}
+        kept.sort(key=lambda c: (order[c["doc"]], c["seq"]))
+
+        logger.info("Re-ingesting %d changed / %d removed document(s): %s",
+                    len(fresh), len(removed), ", ".join(list(fresh) + removed))
+        self._write_chunks(kept)
+        stats = build(self.rag_dir)
+        # state only advances once the build landed → a failed build is retried
+        self._save_state(state)
+
+        stats.update(changed=list(fresh), removed=removed)
+        if self.on_update:
+            self.on_update(stats)
+        return stats
+
+    # ---------- LOOP ----------
+
+    def run(self):
+        logger.info("Watching %s for document changes", self.docs_dir)
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Document sync failed, retrying next poll")
+            self._stop.wait(self.poll)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="doc-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("docs_dir", nargs="?", default=WATCH_DIR or ".")
+    parser.add_argument("--rag-dir", default="rag_data")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS)
+    parser.add_argument("--once", action="store_true", help="sync once and exit")
+    args = parser.parse_args()
+
+    watcher = DocWatcher(args.docs_dir, args.rag_dir, poll=args.poll)
+    if args.once:
+        print(watcher.sync() or "Nothing changed")
+    else:
+        watcher.run()
@@ -0,0 +1,142 @@
+# intent_classifier.py
+"""
+In-process intent classifier: nearest centroid over hashed character
+n-grams (no model download, no network, well under a millisecond).
+
+Trained at startup from the labeled examples in rules.json
+("intent_examples") plus logged turns whose intent the keyword rules
+decided. Turns labeled by this classifier or the LLM picker are left
+out, so a misroute is never learned back as truth. Confidence
+is a softmax over the centroid similarities whose temperature is fitted
+on leave-one-out similarities of the training examples, so 0.8 means
+roughly "right 8 times out of 10" on data like the examples.
+
+hybrid_intent asks it before the LLM picker; the LLM is only consulted
+when confidence is below INTENT_CLS_THRESHOLD.
+"""
+import os, zlib, logging
+import numpy as np
+
+from rule_matcher import MATCHER, RULES
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+INTENT_CLS_THRESHOLD = float(os.getenv("INTENT_CLS_THRESHOLD", "0.6"))
+INTENT_CLS_DIM = int(os.getenv("INTENT_CLS_DIM", str(1 << 14)))
+INTENT_LOG_EXAMPLES = int(os.getenv("INTENT_LOG_EXAMPLES", "50"))    # per intent
+NGRAMS = (2, 3, 4)
+# ----------------------------------------
+
+_TEMPERATURES = np.geomspace(0.005, 1.0, 60)
+
+
+def featurize(texts, dim=INTENT_CLS_DIM) -> np.ndarray:
+    """texts → (n, dim) float32, L2-normalized sublinear n-gram counts."""
+    out = np.zeros((len(texts), dim), dtype="float32")
+    for row, text in enumerate(texts):
+        # same tokens/aliases as the keyword rules ("kaun" → "who")
+        s = f" {' '.join(MATCHER.tokens(text))} "
+        for n in NGRAMS:
+            for i in range(len(s) - n + 1):
+                out[row, zlib.crc32(s[i:i + n].encode("utf-8")) % dim] += 1.0
+    np.log1p(out, out=out)
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return out / norms
+
+
+def _softmax(x):
+    x = x - x.max(axis=-1, keepdims=True)
+    e = np.exp(x)
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+class IntentClassifier:
+    def __init__(self, dim=INTENT_CLS_DIM):
+        self.dim = dim
+        self.labels = []
+        self.centroids = None
+        self.temperature = 0.05
+        self.loo_accuracy = None
+
+    def fit(self, texts, labels):
+        self.labels = sorted(set(labels))
+        self.centroids = None
+        if not self.labels:
+            # no examples (missing / empty intents file): stays untrained
+            return self
+        X = featurize(texts, self.dim)
+        y = np.array([self.labels.index(l) for l in labels])
+
+        sums = np.zeros((len(self.labels), self.dim), dtype="float32")
+        np.add.at(sums, y, X)
+        counts = np.bincount(y, minlength=len(self.labels))
+        self.centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-9)
+
+        self._calibrate(X, y, sums, counts)
+        return self
+
+    def _calibrate(self, X, y, sums, counts):
+        # similarity of each example to every centroid, with its own class
+        # centroid recomputed without it (leave-one-out)
+        keep = counts[y] > 1
+        if not keep.any():
+            return
+        X, y = X[keep], y[keep]
+        sims = X @ self.centroids.T
+        own = sums[y] - X
+        own /= np.maximum(np.linalg.norm(own, axis=1, keepdims=True), 1e-9)
+        rows = np.arange(len(y))
+        sims[rows, y] = (own * X).sum(axis=1)
+
+        nll = [-np.log(_softmax(sims / t)[rows, y] + 1e-12).mean() for t in _TEMPERATURES]
+        self.temperature = float(_TEMPERATURES[int(np.argmin(nll))])
+        self.loo_accuracy = float((sims.argmax(axis=1) == y).mean())
+
+    def scores(self, text) -> dict:
+        """label → probability ({} when untrained)."""
+        if self.centroids is None or not self.labels:
+            return {}
+        probs = _softmax((featurize([text], self.dim) @ self.centroids.T)[0] / self.temperature)
+        return dict(zip(self.labels, probs.tolist()))
+
+    def predict(self, text):
+        """(label, confidence); ("GENERAL", 0.0) when untrained."""
+        scores = self.scores(text)
+        if not scores:
+            return "GENERAL", 0.0
+        label = max(scores, key=scores.get)
+        return label, scores[label]
+
+
+def training_examples(rules=RULES, log=(), allowed=None, per_intent=INTENT_LOG_EXAMPLES):
+    """Labeled examples from the rules file + the newest rule-decided logged turns per intent."""
+    texts, labels = [], []
+    for label, examples in rules.get("intent_examples", {}).items():
+        texts.extend(examples)
+        labels.extend([label] * len(examples))
+
+    taken = {}
+    for turn in reversed(list(log)):
+        label, text = turn.get("intent"), (turn.get("user") or "").strip()
+        if not text or not label or (allowed and label not in allowed):
+            continue
+        # "rule" or "rule+cache"; older turns without a source are skipped
+        if (turn.get("source") or "").split("+")[0] != "rule":
+            continue
+        if taken.get(label, 0) >= per_intent:
+            continue
+        taken[label] = taken.get(label, 0) + 1
+        texts.append(text)
+        labels.append(label)
+    return texts, labels
+
+
+def build_classifier(log=(), allowed=None) -> IntentClassifier:
+    texts, labels = training_examples(log=log, allowed=allowed)
+    clf = IntentClassifier().fit(texts, labels)
+    logger.info("intent classifier: %d examples, %d intents, T=%.3f, LOO accuracy %s",
+                len(texts), len(clf.labels), clf.temperature,
+                "n/a" if clf.loo_accuracy is None else f"{clf.loo_accuracy:.2f}")
+    return clf
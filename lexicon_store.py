@@ -0,0 +1,107 @@
+# lexicon_store.py
+"""
+Memory-mapped posting lists for the lexical passes (rag_data/lexicon.bin),
+the same offset-table idea as chunks.bin.
+
+Layout (little-endian):
+    magic     8 bytes   b"RAGLEX01"
+    vocab     uint64    number of tokens
+    count     uint64    number of chunks
+    doc_len   count x uint32         tokens per chunk (for BM25)
+    table     vocab x (word_offset uint64, word_length uint32,
+                       post_offset uint64, post_count uint32), sorted by token
+    words     UTF-8 token bytes, at table[i].word_offset
+    postings  post_count x (position uint32, term_freq uint32) per token,
+              at table[i].post_offset
+
+Opening reads the header, doc_len and the vocabulary (prefix / suffix /
+infix expansion needs the words); a token's posting list is decoded only
+when a query touches it, so the bulk of the file stays in the shared page
+cache.
+"""
+import mmap, struct
+from bisect import bisect_left
+from collections.abc import Mapping
+import numpy as np
+
+MAGIC = b"RAGLEX01"
+_HEADER = struct.Struct("<8sQQ")
+TABLE_DTYPE = np.dtype([("word_offset", "<u8"), ("word_length", "<u4"),
+                        ("post_offset", "<u8"), ("post_count", "<u4")])
+POSTING_DTYPE = np.dtype([("pos", "<u4"), ("tf", "<u4")])
+
+
+def write_lexicon(path: str, data: dict) -> int:
+    """Write build_lexicon() output to `path`; returns the vocabulary size."""
+    vocab = sorted(data["postings"])
+    count = data["count"]
+
+    doc_len = np.zeros(count, dtype="<u4")
+    words, posts = [], []
+    for tok in vocab:
+        plist = np.array([tuple(p) for p in data["postings"][tok]], dtype=POSTING_DTYPE)
+        np.add.at(doc_len, plist["pos"].astype("int64"), plist["tf"])
+        words.append(tok.encode("utf-8"))
+        posts.append(plist.tobytes())
+
+    table = np.zeros(len(vocab), dtype=TABLE_DTYPE)
+    offset = _HEADER.size + doc_len.nbytes + TABLE_DTYPE.itemsize * len(vocab)
+    for i, w in enumerate(words):
+        table[i]["word_offset"], table[i]["word_length"] = offset, len(w)
+        offset += len(w)
+    for i, p in enumerate(posts):
+        table[i]["post_offset"] = offset
+        table[i]["post_count"] = len(p) // POSTING_DTYPE.itemsize
+        offset += len(p)
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(vocab), count))
+        f.write(doc_len.tobytes())
+        f.write(table.tobytes())
+        for w in words:
+            f.write(w)
+        for p in posts:
+            f.write(p)
+    return len(vocab)
+
+
+class PostingsFile(Mapping):
+    """Read-only token → {position: term_freq} view over lexicon.bin."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, vocab, self.count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a lexicon file")
+        self.doc_len = np.frombuffer(self._mm, dtype="<u4", count=self.count, offset=_HEADER.size)
+        self.table = np.frombuffer(self._mm, dtype=TABLE_DTYPE, count=vocab,
+                                   offset=_HEADER.size + self.doc_len.nbytes)
+        self.vocab = [
+            self._mm[int(o):int(o) + int(n)].decode("utf-8")
+            for o, n in zip(self.table["word_offset"], self.table["word_length"])
+        ]
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def __iter__(self):
+        return iter(self.vocab)
+
+    def _row(self, tok):
+        i = bisect_left(self.vocab, tok)
+        return i if i < len(self.vocab) and self.vocab[i] == tok else None
+
+    def __contains__(self, tok):
+        return self._row(tok) is not None
+
+    def __getitem__(self, tok) -> dict:
+        i = self._row(tok)
+        if i is None:
+            raise KeyError(tok)
+        row = self.table[i]
+        plist = np.frombuffer(self._mm, dtype=POSTING_DTYPE, count=int(row["post_count"]),
+                              offset=int(row["post_offset"]))
+        return dict(zip(plist["pos"].tolist(), plist["tf"].tolist()))
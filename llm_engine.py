@@ -1,8 +1,16 @@
-import os, time, json, logging, requests
-from dotenv import load_dotenv
+import os, logging
+
+from chat_context import build_messages
+from chat_store import ChatStore
+from llm_router import ROUTER, AllBackendsFailed
 
 logger = logging.getLogger(__name__)
-CHAT_FILE = os.path.join(os.path.dirname(__file__), "chat_history.json")
+CHAT_FILE = os.path.join(os.path.dirname(__file__), "chat_history.jsonl")
+LEGACY_CHAT_FILE = os.path.join(os.path.dirname(__file__), "chat_history.json")
+
+# shared by ws_server and server.py: context comes from memory, the log is append-only
+CHAT_STORE = ChatStore(CHAT_FILE, legacy_path=LEGACY_CHAT_FILE)
+LLM_ERROR_REPLY = "Sorry yaar, server side thoda issue aa gaya hai 😕"
 def sanitize_reply(text):
     banned = ["bhai", "beta", "yaar", "dost", "bro", "dear"]
     for w in banned:
@@ -10,86 +18,24 @@ def sanitize_reply(text):
     return text
 
 def load_chat():
-    try:
-        if not os.path.exists(CHAT_FILE):
-            return []
-
-        with open(CHAT_FILE, "r", encoding="utf-8") as f:
-            content = f.read().strip()
-            if not content:
-                return []
-            data = json.loads(content)
-            if isinstance(data, list):
-                return data
-            return []
-    except Exception:
-        logger.exception("load_chat failed")
-        return []
+    return CHAT_STORE.recent()
 
 
-def save_chat(user_text, bot_text, lang="hinglish"):
+def save_chat(user_text, bot_text, lang="hinglish", intent=None, session_id=None, source=None):
+    # ring buffer + background log append; nothing here waits on the disk
     try:
-        history = load_chat()
-
-        history.append({
-            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
-            "language": lang,
-            "user": user_text,
-            "assistant": bot_text
-        })
-
-        # keep last N messages only
-        history = history[-200:]
-
-        with open(CHAT_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-
+        CHAT_STORE.append(user_text, bot_text, lang, intent, session_id, source)
     except Exception:
         logger.exception("save_chat failed")
 
-def build_chat_context(user_text, lang, limit=6):
-    messages = []
+def build_chat_context(user_text, lang, limit=None, session_id=None):
+    # this session's turns only, trimmed to a token budget; older turns
+    # arrive as a rolling summary so the prompt size stays flat
+    history = CHAT_STORE.recent(limit, session=session_id)
+    return build_messages(history, user_text, session_id)
 
-    try:
-        history = load_chat()
-        if not isinstance(history, list):
-            history = []
-    except Exception:
-        history = []
-
-    # keep only last N exchanges
-    for h in history[-limit:]:
-        if "user" in h:
-            messages.append({
-                "role": "user",
-                "content": h.get("user", "")
-            })
-        if "assistant" in h:
-            messages.append({
-                "role": "assistant",
-                "content": h.get("assistant", "")
-            })
-
-    # current user message
-    messages.append({
-        "role": "user",
-        "content": user_text
-    })
-
-    return messages   # ✅ CRITICAL
-
-
-def call_llm_api(user_text, lang="hinglish"):
-    """
-    Uses GROQ_API_KEY from env or .env and Groq chat endpoint.
-    Mirrors your earlier call_llm_api implementation.
-    """
-    load_dotenv()
-    API_KEY = os.getenv("GROQ_API_KEY")
-    if not API_KEY:
-        logger.warning("GROQ_API_KEY not set")
-        return "Sorry yaar, server side thoda issue aa gaya hai 😕"
 
+def _build_request(user_text, lang, session_id=None):
     if lang and lang.lower() in ["hi", "hindi"]:
         lang_prompt = ("Reply ONLY in simple, natural Hindi. Use easy everyday language. No complex Sanskrit words.")
     elif lang and lang.lower() in ["hinglish", "en-in"]:
@@ -102,12 +48,12 @@ def call_llm_api(user_text, lang="hinglish"):
         f"{lang_prompt}"
     )
 
-    ctx = build_chat_context(user_text, lang)
+    ctx = build_chat_context(user_text, lang, session_id=session_id)
     if not isinstance(ctx, list):
         ctx = [{"role": "user", "content": user_text}]
 
-    payload = {
-        "model": "llama-3.1-8b-instant",
+    # backend-neutral; llm_router picks the model per backend
+    return {
         "temperature": 0.35,
         "max_tokens": 450,
         "messages": [
@@ -117,24 +63,54 @@ def call_llm_api(user_text, lang="hinglish"):
     }
 
 
+async def call_llm_api(user_text, lang="hinglish", session_id=None, site="chat"):
+    """
+    One complete reply from whichever backend llm_router picks for `site`
+    (Groq first, local Ollama when Groq is slow, failing or unset).
+    """
+    try:
+        reply = await ROUTER.complete(site, _build_request(user_text, lang, session_id))
+    except AllBackendsFailed:
+        logger.exception("LLM call failed")
+        return LLM_ERROR_REPLY
+    return sanitize_reply(reply)
+
+
+async def sanitize_stream(deltas):
+    """
+    sanitize_reply() for a token stream: text is held back until the next
+    whitespace so a banned word split across two deltas is still removed.
+    """
+    pending = ""
+    async for d in deltas:
+        pending += d
+        cut = max(pending.rfind(" "), pending.rfind("\n"))
+        if cut >= 0:
+            out = sanitize_reply(pending[:cut + 1])
+            pending = pending[cut + 1:]
+            if out:
+                yield out
+    if pending:
+        out = sanitize_reply(pending)
+        if out:
+            yield out
+
+
+async def call_llm_api_stream(user_text, lang="hinglish", session_id=None):
+    """
+    Streaming variant of call_llm_api: yields reply text deltas as the
+    routed backend produces them. Falls back to the canned error line if
+    nothing arrived.
+    """
+    req = _build_request(user_text, lang, session_id)
+
+    sent = False
     try:
-        r = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json=payload,
-            timeout=30
-        )
-        r.raise_for_status()
-        j = r.json()
-        reply = sanitize_reply(
-        j["choices"][0]["message"]["content"].strip()
-    )
+        async for piece in sanitize_stream(ROUTER.stream("chat", req)):
+            sent = True
+            yield piece
+    except Exception:
+        logger.exception("LLM stream failed")
 
-        
-        return reply
-    except Exception as e:
-        logger.exception("LLM call failed")
-        return "Sorry yaar, server side thoda issue aa gaya hai 😕"
\ No newline at end of file
+    if not sent:
+        yield LLM_ERROR_REPLY
@@ -0,0 +1,408 @@
+# llm_router.py
+"""
+Routes chat-completion requests between LLM backends (Groq, local Ollama).
+
+Per backend it keeps:
+- a latency window (p50 / p95; time-to-first-token for streams)
+- success / failure counts
+- a circuit breaker: after BREAKER_FAILURES consecutive failures the
+  backend is skipped for BREAKER_COOLDOWN seconds, then one probe request
+  decides whether it is back
+
+Per call site ("chat", "intent", "translate", "rag") it has a backend
+order, a timeout, and optional hedging. With hedging, if the first
+backend hasn't answered after ~its p95 latency (clamped to
+[hedge_min, hedge_max]), the next backend is asked too and whichever
+answers first wins. A backend that errors is failed over at once.
+
+A request is backend-neutral: {"messages": [...], "temperature": .., "max_tokens": ..}.
+"""
+import os, json, time, asyncio, logging
+from collections import deque
+
+import numpy as np
+from dotenv import load_dotenv
+
+from http_clients import get_session
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# ---------------- CONFIG ----------------
+GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_CHAT_MODEL = os.getenv("OLLAMA_CHAT_MODEL", "qwen2:0.5b")
+
+BREAKER_FAILURES = int(os.getenv("ROUTER_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.getenv("ROUTER_BREAKER_COOLDOWN", "30"))
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 5          # below this the hedge waits hedge_max
+
+
+def _site(name, order, timeout, hedge, hedge_max=2.0, hedge_min=0.3):
+    # env overrides: ROUTER_<SITE>_ORDER / _TIMEOUT / _HEDGE / _HEDGE_MAX
+    env = f"ROUTER_{name.upper()}_"
+    return {
+        "order": os.getenv(env + "ORDER", order).split(","),
+        "timeout": float(os.getenv(env + "TIMEOUT", str(timeout))),
+        "hedge": os.getenv(env + "HEDGE", "1" if hedge else "0") == "1",
+        "hedge_min": hedge_min,
+        "hedge_max": float(os.getenv(env + "HEDGE_MAX", str(hedge_max))),
+    }
+
+
+SITES = {
+    "chat": _site("chat", "groq,ollama", timeout=15, hedge=True),
+    "intent": _site("intent", "groq,ollama", timeout=5, hedge=True, hedge_max=1.0),
+    "translate": _site("translate", "groq,ollama", timeout=10, hedge=False),
+    "rag": _site("rag", "ollama,groq", timeout=20, hedge=True, hedge_max=3.0),
+}
+# ----------------------------------------
+
+# which model each backend generates with (prompt budgets are per model)
+BACKEND_MODELS = {"groq": GROQ_MODEL, "ollama": OLLAMA_CHAT_MODEL}
+
+
+def site_models(site) -> list:
+    """Models that may answer a call site, in its backend order."""
+    return [BACKEND_MODELS[n] for n in SITES[site]["order"] if n in BACKEND_MODELS]
+
+
+class AllBackendsFailed(Exception):
+    def __init__(self, site, errors):
+        self.site = site
+        self.errors = errors
+        detail = "; ".join(f"{name}: {err!r}" for name, err in errors) or "no backend available"
+        super().__init__(f"{site}: {detail}")
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+# ---------- CIRCUIT BREAKER ----------
+
+class CircuitBreaker:
+    """closed → (N consecutive failures) → open → (cooldown) → half-open → one probe."""
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def available(self) -> bool:
+        """Could a request go out now? (does not take the half-open probe)"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self._probing
+
+    def allow(self) -> bool:
+        """Take permission for one request."""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half-open"
+        if self.state == "closed":
+            return True
+        if self.state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half-open" or self.failures >= self.max_failures:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        # request abandoned (hedge lost) → neither success nor failure
+        self._probing = False
+
+
+# ---------- BACKEND ----------
+
+class Backend:
+    """
+    `complete(req) -> str` and optionally `stream(req)` (async generator
+    of text deltas); without `stream`, the full completion is one delta.
+    """
+
+    def __init__(self, name, complete, stream=None, breaker=None):
+        self.name = name
+        self._complete = complete
+        self._stream = stream
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.successes = 0
+        self.failures = 0
+
+    def complete(self, req):
+        return self._complete(req)
+
+    async def stream(self, req):
+        if self._stream is None:
+            yield await self._complete(req)
+            return
+        async for piece in self._stream(req):
+            yield piece
+
+    def record(self, ok, latency=None):
+        if ok:
+            self.successes += 1
+            self.latencies.append(latency)
+            self.breaker.success()
+        else:
+            self.failures += 1
+            was = self.breaker.state
+            self.breaker.failure()
+            if was != "open" and self.breaker.state == "open":
+                logger.warning("%s: circuit open for %.0fs after %d failures",
+                               self.name, self.breaker.cooldown, self.breaker.failures)
+
+    def percentile(self, p):
+        if not self.latencies:
+            return None
+        return float(np.percentile(self.latencies, p))
+
+    def stats(self) -> dict:
+        total = self.successes + self.failures
+        return {
+            "state": self.breaker.state,
+            "p50_ms": None if not self.latencies else self.percentile(50) * 1000,
+            "p95_ms": None if not self.latencies else self.percentile(95) * 1000,
+            "successes": self.successes,
+            "failures": self.failures,
+            "error_rate": self.failures / total if total else 0.0,
+        }
+
+
+# ---------- ROUTER ----------
+
+class Router:
+    def __init__(self, backends, sites=None):
+        self.backends = {b.name: b for b in backends}
+        self.sites = sites or SITES
+        self.hedged = 0
+        self.secondary_wins = 0
+
+    def _order(self, site):
+        cfg = self.sites[site]
+        order = [self.backends[n] for n in cfg["order"] if n in self.backends]
+        return cfg, [b for b in order if b.breaker.available()]
+
+    def hedge_delay(self, backend, cfg) -> float:
+        if len(backend.latencies) < MIN_SAMPLES:
+            return cfg["hedge_max"]
+        return min(max(backend.percentile(95), cfg["hedge_min"]), cfg["hedge_max"])
+
+    async def _attempt(self, backend, first, timeout):
+        """Run one backend call (`first` = awaitable), recording the outcome."""
+        if not backend.breaker.allow():
+            first.close()
+            raise CircuitOpen(backend.name)
+        t0 = time.monotonic()
+        try:
+            result = await asyncio.wait_for(first, timeout)
+        except asyncio.CancelledError:
+            backend.breaker.release()
+            raise
+        except StopAsyncIteration:
+            backend.record(False)
+            raise RuntimeError("empty reply")
+        except Exception:
+            backend.record(False)
+            raise
+        backend.record(True, time.monotonic() - t0)
+        return result
+
+    async def _race(self, site, start):
+        """
+        Launch attempts per the site policy; `start(backend)` → (awaitable,
+        handle). Returns (backend, result, handle) of the first success and
+        cleans up every other attempt via handle cleanup.
+        """
+        cfg, order = self._order(site)
+        pending, errors, launched = {}, [], 0
+
+        def launch():
+            nonlocal launched
+            backend = order[launched]
+            launched += 1
+            first, handle = start(backend)
+            task = asyncio.ensure_future(self._attempt(backend, first, cfg["timeout"]))
+            pending[task] = (backend, handle)
+
+        if not order:
+            raise AllBackendsFailed(site, [])
+        launch()
+        try:
+            while pending:
+                hedge_in = None
+                if cfg["hedge"] and launched == 1 and len(order) > 1:
+                    hedge_in = self.hedge_delay(order[0], cfg)
+
+                done, _ = await asyncio.wait(
+                    pending, timeout=hedge_in, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.hedged += 1
+                    logger.info("%s: %s slow, hedging to %s", site, order[0].name, order[1].name)
+                    launch()
+                    continue
+
+                for task in done:
+                    backend, handle = pending.pop(task)
+                    if task.exception() is None:
+                        if backend is not order[0]:
+                            self.secondary_wins += 1
+                        return backend, task.result(), handle
+                    errors.append((backend.name, task.exception()))
+                    await _close(handle)
+
+                if not pending and launched < len(order):
+                    launch()        # failover
+            raise AllBackendsFailed(site, errors)
+        finally:
+            # losing hedges / leftovers: stop them, then release their streams
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for _, handle in pending.values():
+                await _close(handle)
+
+    async def complete(self, site, req) -> str:
+        _, result, _ = await self._race(site, lambda b: (b.complete(req), None))
+        return result
+
+    async def stream(self, site, req):
+        """
+        Yields text deltas. Hedging/failover decide on the first delta;
+        after that the winning backend streams to the end.
+        """
+        def start(backend):
+            agen = backend.stream(req)
+            return agen.__anext__(), agen
+
+        backend, first, agen = await self._race(site, start)
+        try:
+            yield first
+            async for piece in agen:
+                yield piece
+        except Exception:
+            backend.record(False)       # broke mid-answer
+            raise
+        finally:
+            await agen.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "backends": {name: b.stats() for name, b in self.backends.items()},
+            "hedged": self.hedged,
+            "secondary_wins": self.secondary_wins,
+        }
+
+
+async def _close(handle):
+    if handle is not None:
+        try:
+            await handle.aclose()
+        except Exception:
+            pass
+
+
+# ---------- BACKENDS ----------
+
+def _groq_key():
+    key = os.getenv("GROQ_API_KEY")
+    if not key:
+        raise RuntimeError("GROQ_API_KEY not set")
+    return {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+
+
+def _groq_payload(req, stream=False):
+    payload = {"model": GROQ_MODEL, "messages": req["messages"], "stream": stream}
+    for k in ("temperature", "max_tokens"):
+        if k in req:
+            payload[k] = req[k]
+    return payload
+
+
+async def groq_complete(req):
+    async with get_session("groq").post(
+        GROQ_URL, headers=_groq_key(), json=_groq_payload(req)
+    ) as r:
+        r.raise_for_status()
+        j = await r.json(content_type=None)
+    return j["choices"][0]["message"]["content"].strip()
+
+
+async def groq_stream(req):
+    async with get_session("groq").post(
+        GROQ_URL, headers=_groq_key(), json=_groq_payload(req, stream=True)
+    ) as r:
+        r.raise_for_status()
+        # OpenAI-style SSE: "data: {json}" lines, terminated by "data: [DONE]"
+        async for raw in r.content:
+            line = raw.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+
+def _ollama_payload(req, stream=False):
+    options = {}
+    if "temperature" in req:
+        options["temperature"] = req["temperature"]
+    if "max_tokens" in req:
+        options["num_predict"] = req["max_tokens"]
+    return {"model": OLLAMA_CHAT_MODEL, "messages": req["messages"],
+            "stream": stream, "options": options}
+
+
+async def ollama_complete(req):
+    async with get_session("ollama").post(
+        f"{OLLAMA_URL}/api/chat", json=_ollama_payload(req)
+    ) as r:
+        r.raise_for_status()
+        j = await r.json(content_type=None)
+    return j.get("message", {}).get("content", "").strip()
+
+
+async def ollama_stream(req):
+    async with get_session("ollama").post(
+        f"{OLLAMA_URL}/api/chat", json=_ollama_payload(req, stream=True)
+    ) as r:
+        r.raise_for_status()
+        # NDJSON: {"message": {"content": "..."}, "done": bool} per line
+        async for line in r.content:
+            if not line.strip():
+                continue
+            j = json.loads(line)
+            piece = j.get("message", {}).get("content", "")
+            if piece:
+                yield piece
+            if j.get("done"):
+                break
+
+
+ROUTER = Router([
+    Backend("groq", groq_complete, groq_stream),
+    Backend("ollama", ollama_complete, ollama_stream),
+])
@@ -1,10 +1,11 @@
 
 
-import json
 import os
 import re
-import threading
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List, NamedTuple
+
+from context_store import ContextStore
+from rule_matcher import analyze
 
 # original intent schema (kept for compatibility)
 INTENT_SCHEMA = {
@@ -17,74 +18,37 @@ INTENT_SCHEMA = {
 }
 ALLOWED_CTX_KEYS = {"college", "department", "year", "last_intent"}
 
-# persistence (optional)
-_CTX_FILE = os.path.join(os.path.dirname(__file__), "nlu_context.json")
-_context_lock = threading.Lock()
-_context = {}
-
-def _load_context():
-    global _context
-    try:
-        if os.path.exists(_CTX_FILE):
-            with open(_CTX_FILE, "r", encoding="utf-8") as f:
-                _context = json.load(f)
-    except Exception:
-        _context = {}
-
-def _save_context():
-    try:
-        with _context_lock:
-            with open(_CTX_FILE, "w", encoding="utf-8") as f:
-                json.dump(_context, f, ensure_ascii=False, indent=2)
-    except Exception:
-        pass
-
-# initial load
-_load_context()
+# below this, hybrid_intent asks the classifier / LLM
+NLU_CONFIDENCE_THRESHOLD = float(os.getenv("NLU_CONFIDENCE_THRESHOLD", "0.7"))
+
+# per-session context, persisted off the request path
+_CTX_FILE = os.getenv("NLU_CONTEXT_FILE", os.path.join(os.path.dirname(__file__), "nlu_context.json"))
+CONTEXT_STORE = ContextStore(_CTX_FILE)
 
 # helpers
+_YEAR_RE = re.compile(r"\b(19|20)\d{2}\b")
+
 def _clean(text: str) -> str:
     return (text or "").strip().lower()
 
 def detect_intent_prod(text: str) -> str:
-    t = _clean(text)
-    # explicit phrase checks (keeps original behavior but safer)
-    if any(k in t for k in ["owner", "chairman", "malik", "boss"]):
-        return "COLLEGE_CHAIRMAN"
-    if any(k in t for k in ["director", "principal"]):
-        return "COLLEGE_DIRECTOR"
-    if "hod" in t or "head of department" in t:
-        return "DEPARTMENT_HOD"
-    if any(k in t for k in ["placement", "package", "ctc", "lpa"]):
-        return "PLACEMENTS"
-    if any(k in t for k in ["course", "branch", "degree"]):
-        return "COURSES"
-    if any(k in t for k in ["campus", "hostel", "library", "infrastructure"]):
-        return "CAMPUS"
-    return "GENERAL"
+    # keyword lists + priority order: rules.json "nlu_intents"
+    return analyze(text or "").first("intent") or "GENERAL"
 
 def extract_slots_prod(text: str) -> Dict[str, str]:
-    t = _clean(text)
+    return _extract_slots(text, analyze(text or ""))
+
+def _extract_slots(text, hits) -> Dict[str, str]:
     slots = {}
 
-    # college name hints
-    if any(k in t for k in ["gitanjali", "gits", "geetanjali", "college", "institute"]):
-        slots["college"] = "GITS"
-
-    # department detection
-    if any(k in t for k in ["cse", "computer science", "computer", "cs"]):
-        slots["department"] = "CSE"
-    elif any(k in t for k in ["ai", "artificial intelligence"]):
-        slots["department"] = "AI"
-    elif "mechanical" in t:
-        slots["department"] = "ME"
-    elif "civil" in t:
-        slots["department"] = "CE"
-    elif "ece" in t or "electronics" in t:
-        slots["department"] = "ECE"
+    # college name hints / department (first listed wins): rules.json "slots"
+    for slot in ("college", "department"):
+        value = hits.first(slot)
+        if value:
+            slots[slot] = value
 
     # quick numeric slot detection (year, batch)
-    m = re.search(r"\b(19|20)\d{2}\b", t)
+    m = _YEAR_RE.search(_clean(text))
     if m:
         slots["year"] = m.group(0)
 
@@ -94,36 +58,94 @@ def is_slot_complete(intent: str, slots: Dict[str, str]) -> bool:
     required = INTENT_SCHEMA.get(intent, [])
     return all(r in slots and slots[r] for r in required)
 
-def resolve_context(intent: str, slots: Dict[str, str]) -> Dict[str, str]:
+def resolve_context(intent: str, slots: Dict[str, str], session=None) -> Dict[str, str]:
     """
-    If slots missing and context exists, merge. Does not overwrite explicit slots.
+    If slots missing and the session has context, merge. Does not overwrite explicit slots.
     """
-    with _context_lock:
-        ctx = dict(_context) if _context else {}
-    for k, v in ctx.items():
+    for k, v in CONTEXT_STORE.get(session).items():
+        if k == "last_intent":
+            continue
         if k not in slots or not slots.get(k):
             slots[k] = v
     return slots
 
 
-def update_context(intent, slots):
-    global _context
-    if _context is None:
-        _context = {}
-    if isinstance(slots, dict):
-        _context.update(slots)
+def update_context(intent, slots, session=None):
+    if not isinstance(slots, dict):
+        return
+    values = {k: v for k, v in slots.items() if k in ALLOWED_CTX_KEYS and v}
+    values["last_intent"] = intent
+    CONTEXT_STORE.update(session, values)
+
+class NluResult(NamedTuple):
+    intent: str
+    slots: Dict[str, str]
+    state: str                  # "OK" | "CLARIFY"
+    confidence: float           # 0..1
+    evidence: List[dict]        # {"rule", "value", "matched"} per rule that fired
+
+
+def _evidence(hits, slots, own) -> List[dict]:
+    out = []
+    for group in ("intent", "college", "department"):
+        for value, matched in hits.matches(group).items():
+            out.append({"rule": group, "value": value, "matched": matched})
+    if "year" in own:
+        out.append({"rule": "year", "value": own["year"], "matched": [own["year"]]})
+    for k, v in slots.items():
+        if k not in own:
+            out.append({"rule": "context", "value": v, "matched": [k]})
+    return out
+
+
+def _confidence(hits, intent, state) -> float:
+    if intent != "GENERAL":
+        # several college intents fired → the priority order decided
+        conf = 0.9 if len(hits.labels("intent")) == 1 else 0.6
+        # a required slot is missing (even after context)
+        return min(conf, 0.5) if state == "CLARIFY" else conf
+
+    # no intent keyword: short asks are usually chit-chat; longer ones, or
+    # ones naming a department / the college, may be college questions
+    # phrased without a keyword
+    if hits.any("department") or hits.any("college"):
+        return 0.4
+    return 0.8 if len(hits.tokens) <= 4 else 0.4
+
+
+def nlu_analyze(text: str, session=None) -> NluResult:
+    """
+    nlu_pipeline with the reasoning attached: a confidence in [0, 1] and
+    which rules (keywords, context) produced the intent and slots.
+    `session` selects whose conversation context fills missing slots.
+    """
+    hits = analyze(text or "")
+    intent = hits.first("intent") or "GENERAL"
+    own = _extract_slots(text, hits)
+    slots = resolve_context(intent, dict(own), session)
+
+    state = "OK" if is_slot_complete(intent, slots) else "CLARIFY"
+    if state == "OK":
+        update_context(intent, slots, session)
+
+    return NluResult(intent, slots, state, _confidence(hits, intent, state),
+                     _evidence(hits, slots, own))
 
-def nlu_pipeline(text: str) -> Tuple[str, Dict[str,str], str]:
+
+def rule_guess(text: str) -> Tuple[str, float]:
     """
-    Primary pipeline. Returns (intent, slots, state).
-    State is "OK" or "CLARIFY".
+    (intent, confidence) from the keyword rules alone: no session context,
+    nothing remembered. Cheap enough to call before resolve_intent.
     """
-    intent = detect_intent_prod(text)
-    slots = extract_slots_prod(text)
-    slots = resolve_context(intent, slots)
+    hits = analyze(text or "")
+    intent = hits.first("intent") or "GENERAL"
+    return intent, _confidence(hits, intent, "OK")
 
-    if not is_slot_complete(intent, slots):
-        return intent, slots, "CLARIFY"
 
-    update_context(intent, slots)
-    return intent, slots, "OK"
\ No newline at end of file
+def nlu_pipeline(text: str, session=None) -> Tuple[str, Dict[str,str], str]:
+    """
+    Primary pipeline. Returns (intent, slots, state).
+    State is "OK" or "CLARIFY".
+    """
+    r = nlu_analyze(text, session)
+    return r.intent, r.slots, r.state
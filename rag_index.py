@@ -0,0 +1,385 @@
+# rag_index.py
+import os, re, json, math, time, logging, threading
+from bisect import bisect_left
+from collections import Counter
+import faiss
+
+from chunk_store import ChunkStore
+from lexicon_store import PostingsFile
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.faiss"
+META_FILE = "meta.json"          # legacy: full chunk list as one JSON array
+STORE_FILE = "chunks.bin"
+LEXICON_FILE = "lexicon.bin"
+LEGACY_LEXICON_FILE = "lexicon.json"     # legacy: postings as one JSON object
+VERSION_FILE = "VERSION"
+
+CHECK_INTERVAL = float(os.getenv("RAG_CHECK_INTERVAL", "2.0"))
+
+# search-time knobs for approximate index types
+NPROBE = int(os.getenv("RAG_NPROBE", "8"))
+EF_SEARCH = int(os.getenv("RAG_EF_SEARCH", "64"))
+
+
+def normalize_text(s: str) -> str:
+    s = s.lower()
+    s = re.sub(r"[^a-z0-9\s]", "", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+
+# ---------- LEXICAL INDEX ----------
+
+def build_lexicon(chunks, with_norm=True) -> dict:
+    """
+    Precomputed at build time (saved as lexicon.bin, see lexicon_store):
+      norm     -> normalized text per chunk position (omitted when the
+                  chunk store already carries it)
+      postings -> token -> [[position, term_freq], ...]
+    """
+    norm = [c.get("norm") or normalize_text(c["text"]) for c in chunks]
+    postings = {}
+    for pos, text in enumerate(norm):
+        for tok, tf in Counter(text.split()).items():
+            postings.setdefault(tok, []).append([pos, tf])
+    data = {"count": len(chunks), "postings": postings}
+    if with_norm:
+        data["norm"] = norm
+    return data
+
+
+class Lexicon:
+    """
+    Token → chunk-position posting lists over the normalized chunk text.
+
+    Query tokens may only be partial words at the edges of a substring match
+    ("placement" inside "placements"), so those are expanded against the
+    vocabulary (sorted for prefix/suffix, memoized scan for infix) before the
+    posting lists are intersected.
+    """
+
+    def __init__(self, data, norm=None):
+        # `data` is build_lexicon() output or a mapped PostingsFile (posting
+        # lists decoded per token on use); `norm` may be a lazy sequence
+        # (ChunkStore.norms)
+        self.norm = norm if norm is not None else data["norm"]
+        if isinstance(data, PostingsFile):
+            self.postings = data
+            self.doc_len = data.doc_len.tolist()
+        else:
+            self.postings = {
+                tok: {pos: tf for pos, tf in plist}
+                for tok, plist in data["postings"].items()
+            }
+            self.doc_len = [0] * len(self.norm)
+            for plist in self.postings.values():
+                for pos, tf in plist.items():
+                    self.doc_len[pos] += tf
+        self._vocab = sorted(self.postings)
+        self._rvocab = sorted(t[::-1] for t in self.postings)
+        self._infix = {}
+
+        self.avg_len = (sum(self.doc_len) / len(self.doc_len)) if self.doc_len else 0.0
+
+    def __len__(self):
+        return len(self.norm)
+
+    @staticmethod
+    def _range(words, prefix):
+        lo = bisect_left(words, prefix)
+        hi = bisect_left(words, prefix + "\uffff")
+        return words[lo:hi]
+
+    def _docs(self, tok, mode="exact") -> set:
+        if mode == "exact":
+            words = [tok] if tok in self.postings else []
+        elif mode == "prefix":
+            words = self._range(self._vocab, tok)
+        elif mode == "suffix":
+            words = [w[::-1] for w in self._range(self._rvocab, tok[::-1])]
+        else:
+            words = self._infix.get(tok)
+            if words is None:
+                words = [w for w in self._vocab if tok in w]
+                if len(self._infix) < 4096:
+                    self._infix[tok] = words
+        docs = set()
+        for w in words:
+            docs.update(self.postings[w])
+        return docs
+
+    @staticmethod
+    def _intersect(sets) -> list:
+        sets = sorted(sets, key=len)
+        if not sets:
+            return []
+        hits = set(sets[0])
+        for s in sets[1:]:
+            hits.intersection_update(s)
+            if not hits:
+                break
+        return sorted(hits)
+
+    def match_all(self, tokens) -> list:
+        """Positions whose text contains every token (anywhere in a word)."""
+        return self._intersect([self._docs(t, "infix") for t in set(tokens)])
+
+    def match_phrase(self, q_norm: str) -> list:
+        """Positions whose normalized text contains q_norm verbatim."""
+        toks = q_norm.split()
+        if not toks:
+            return []
+        if len(toks) == 1:
+            sets = [self._docs(toks[0], "infix")]
+        else:
+            sets = [self._docs(toks[0], "suffix"), self._docs(toks[-1], "prefix")]
+            sets += [self._docs(t) for t in toks[1:-1]]
+        return [pos for pos in self._intersect(sets) if q_norm in self.norm[pos]]
+
+    def bm25(self, tokens, k=20, k1=1.5, b=0.75) -> list:
+        """Okapi BM25 over whole-word tokens → [(position, score)], best first."""
+        n = len(self.norm)
+        scores = {}
+        for t in set(tokens):
+            plist = self.postings.get(t)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for pos, tf in plist.items():
+                norm_len = 1 - b + b * self.doc_len[pos] / self.avg_len
+                scores[pos] = scores.get(pos, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * norm_len)
+        return sorted(scores.items(), key=lambda x: -x[1])[:k]
+
+
+def reciprocal_rank_fusion(rankings, k=60) -> list:
+    """
+    Merge several best-first lists of positions: score = sum(1 / (k + rank)).
+    Returns positions, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, pos in enumerate(ranking, 1):
+            scores[pos] = scores.get(pos, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda p: -scores[p])
+
+
+# ---------- BUILD SIDE HELPERS ----------
+
+def tmp_path(path: str) -> str:
+    return f"{path}.tmp{os.getpid()}"
+
+
+def write_version(rag_dir: str) -> str:
+    """
+    Written LAST by the build, after index + meta are in place.
+    The retriever only reloads when this marker changes.
+    """
+    version = f"{time.time_ns()}"
+    path = os.path.join(rag_dir, VERSION_FILE)
+    tmp = tmp_path(path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp, path)
+    return version
+
+
+# ---------- INDEX TYPES ----------
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "sq8", "pq", "ivfpq")
+
+
+def _pq_shape(dim, n):
+    # ~16 dims per sub-quantizer (m must divide dim); faiss wants >= 39
+    # training points per centroid, so nbits shrinks on small corpora
+    m = max([m for m in range(1, dim // 16 + 1) if dim % m == 0] or [1])
+    nbits = max(1, min(8, int(math.log2(max(n // 39, 2)))))
+    return m, nbits
+
+
+def make_index(kind: str, dim: int, n: int):
+    """
+    Empty ID-mapped inner-product index of the given type, sized for about
+    n vectors. Types that need training must be trained before add.
+    """
+    nlist = max(1, min(int(4 * math.sqrt(max(n, 1))), n // 39 or 1))
+    m, nbits = _pq_shape(dim, n)
+    spec = {
+        "flat": "Flat",
+        "ivf": f"IVF{nlist},Flat",
+        "hnsw": "HNSW32",
+        "sq8": "SQ8",
+        "pq": f"PQ{m}x{nbits}",
+        "ivfpq": f"IVF{nlist},PQ{m}x{nbits}",
+    }.get(kind)
+    if spec is None:
+        raise ValueError(f"unknown index type {kind!r}, expected one of {INDEX_TYPES}")
+    return faiss.IndexIDMap2(faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT))
+
+
+def index_kind(index) -> str:
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return "sq8"
+    if isinstance(inner, faiss.IndexPQ):
+        return "pq"
+    return "flat"
+
+
+def configure_search(index, nprobe=NPROBE, ef_search=EF_SEARCH):
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(nprobe, inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+    return index
+
+
+# ---------- SNAPSHOT ----------
+
+class RagSnapshot:
+    """
+    One immutable (index, meta, lexicon) set loaded from disk.
+    `meta` is a ChunkStore, or a plain list for legacy meta.json builds.
+    """
+
+    def __init__(self, index, meta, lexicon, version):
+        self.index = index
+        self.meta = meta
+        self.lexicon = lexicon
+        self.version = version
+        # ID-mapped indexes return chunk ids, not list positions
+        self.pos_by_id = None
+        if not isinstance(meta, ChunkStore):
+            self.pos_by_id = {c.get("id", i): i for i, c in enumerate(meta)}
+
+    def search(self, q_vec, k) -> list:
+        """Vector search → meta positions, best first."""
+        if not self.index.ntotal:
+            return []
+        _, I = self.index.search(q_vec, k)
+        ids = [int(i) for i in I[0] if i >= 0]
+        if self.pos_by_id is None:
+            return self.meta.positions(ids)
+        return [self.pos_by_id[i] for i in ids if i in self.pos_by_id]
+
+
+# ---------- RETRIEVER ----------
+
+class Retriever:
+    """
+    Process-wide holder of the FAISS index + chunk metadata.
+
+    Loaded once; afterwards the on-disk version is re-checked at most every
+    `check_interval` seconds and a new snapshot is swapped in when the build
+    rewrites the files. Queries keep the snapshot they started with, so a
+    swap never breaks an in-flight query.
+    """
+
+    def __init__(self, rag_dir: str, check_interval: float = CHECK_INTERVAL):
+        self.rag_dir = rag_dir
+        self.check_interval = check_interval
+        self._snap = None
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+
+    def _path(self, name):
+        return os.path.join(self.rag_dir, name)
+
+    def disk_version(self):
+        try:
+            marker = self._path(VERSION_FILE)
+            if os.path.exists(marker):
+                with open(marker, encoding="utf-8") as f:
+                    return f.read().strip()
+            # older builds without a marker → fall back to mtimes
+            st_i = os.stat(self._path(INDEX_FILE))
+            store = self._path(STORE_FILE)
+            st_m = os.stat(store if os.path.exists(store) else self._path(META_FILE))
+            return f"{st_i.st_mtime_ns}-{st_m.st_mtime_ns}"
+        except OSError:
+            return None
+
+    def _read_index(self):
+        # memory-mapped where faiss supports it → pages shared across processes
+        path = self._path(INDEX_FILE)
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except Exception:
+            return faiss.read_index(path)
+
+    def _load(self, version):
+        index = configure_search(self._read_index())
+
+        store_path = self._path(STORE_FILE)
+        if os.path.exists(store_path):
+            meta = ChunkStore(store_path)
+            norm = meta.norms
+        else:
+            with open(self._path(META_FILE), encoding="utf-8") as f:
+                meta = json.load(f)
+            norm = None
+
+        if index.ntotal != len(meta):
+            raise ValueError(
+                f"index/meta mismatch: {index.ntotal} vectors vs {len(meta)} chunks"
+            )
+
+        lexicon = None
+        lex_path, legacy_lex = self._path(LEXICON_FILE), self._path(LEGACY_LEXICON_FILE)
+        if os.path.exists(lex_path):
+            postings = PostingsFile(lex_path)
+            if postings.count == len(meta) and norm is not None:
+                lexicon = Lexicon(postings, norm)
+        elif os.path.exists(legacy_lex):
+            with open(legacy_lex, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("count") == len(meta) and (norm is not None or "norm" in data):
+                lexicon = Lexicon(data, norm)
+        if lexicon is None:
+            logger.warning("lexicon missing or stale, building it in memory")
+            lexicon = Lexicon(build_lexicon(list(meta)))
+
+        logger.info("RAG index loaded: %d chunks (version %s)", len(meta), version)
+        return RagSnapshot(index, meta, lexicon, version)
+
+    def get(self) -> RagSnapshot:
+        snap = self._snap
+        if snap is not None and time.monotonic() < self._next_check:
+            return snap
+
+        with self._lock:
+            now = time.monotonic()
+            if self._snap is not None and now < self._next_check:
+                return self._snap
+            self._next_check = now + self.check_interval
+
+            version = self.disk_version()
+            if self._snap is None or (version and version != self._snap.version):
+                try:
+                    self._snap = self._load(version)
+                except Exception:
+                    if self._snap is None:
+                        raise
+                    logger.exception(
+                        "RAG reload failed, keeping version %s", self._snap.version
+                    )
+            return self._snap
+
+    def reload(self) -> RagSnapshot:
+        """Force a version check on the next get()."""
+        self._next_check = 0.0
+        return self.get()
+
+    @property
+    def version(self):
+        snap = self._snap
+        return snap.version if snap else None
@@ -1,44 +1,67 @@
-import os, json, re, requests
+import os, time, asyncio, logging
 import numpy as np
 import faiss
 
+from cache import BoundedCache
+from context_packer import budget_for, pack_contexts
+from embedder import Embedder
+from llm_router import ROUTER, AllBackendsFailed, site_models
+from rag_index import Retriever, normalize_text, reciprocal_rank_fusion
+
+logger = logging.getLogger(__name__)
+
 # ---------------- CONFIG ----------------
 RAG_DIR = "rag_data"
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 
 EMBED_MODEL = "nomic-embed-text"
-LLM_MODEL = "qwen2:0.5b"
 
-TOP_K = 5
-MAX_CONTEXT_CHARS = 1200
+TOP_K = 5              # contexts handed to the prompt after fusion
+CANDIDATES = 20        # depth of each ranked list before fusion
+RRF_K = 60
+# any backend of the "rag" site may answer (hedging) → fit the smallest
+CONTEXT_TOKENS = min((budget_for(m) for m in site_models("rag")), default=budget_for(None))
 DEFAULT_REPLY = "Information not available in the college document."
 
-RAG_CACHE = {}
+RAG_CACHE_ITEMS = int(os.getenv("RAG_CACHE_ITEMS", "2000"))
+RAG_CACHE_BYTES = int(os.getenv("RAG_CACHE_BYTES", str(4 * 1024 * 1024)))
+RAG_CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", str(24 * 3600)))
+RAG_CACHE_FILE = os.path.join(RAG_DIR, "rag_cache.sqlite")
 # ----------------------------------------
 
+# keyed by (normalized question, index version) → a rebuild never serves stale answers
+RAG_CACHE = BoundedCache(
+    max_items=RAG_CACHE_ITEMS,
+    max_bytes=RAG_CACHE_BYTES,
+    ttl=RAG_CACHE_TTL,
+    path=RAG_CACHE_FILE
+)
 
-def load_index_meta():
-    index = faiss.read_index(os.path.join(RAG_DIR, "index.faiss"))
-    meta = json.load(open(os.path.join(RAG_DIR, "meta.json"), encoding="utf-8"))
-    return index, meta
+# shared by every caller → identical texts are embedded once, concurrent ones batched
+EMBEDDER = Embedder(EMBED_MODEL, OLLAMA_URL)
+
+# retrieval latency, tracked apart from generation
+RETRIEVAL_STATS = {"count": 0, "total_ms": 0.0, "last_ms": 0.0, "max_ms": 0.0}
 
+# loaded once, hot-reloaded when build_embeddings_ollama rewrites rag_data
+RETRIEVER = Retriever(RAG_DIR)
 
-def normalize_text(s: str) -> str:
-    s = s.lower()
-    s = re.sub(r"[^a-z0-9\s]", "", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+try:
+    RETRIEVER.get()
+except Exception:
+    logger.warning("RAG index not available yet in %s", RAG_DIR)
+
+
+def load_index_meta():
+    snap = RETRIEVER.get()
+    return snap.index, snap.meta
 
 
-def embed_query(text: str):
+async def embed_query(text: str):
+    # the batcher owns its own pooled session; awaiting its Future keeps the loop free
     try:
-        r = requests.post(
-            f"{OLLAMA_URL}/api/embeddings",
-            json={"model": EMBED_MODEL, "prompt": text},
-            timeout=10
-        )
-        r.raise_for_status()
-        vec = np.array(r.json()["embedding"], dtype="float32").reshape(1, -1)
+        vec = await asyncio.wrap_future(EMBEDDER.submit(text))
+        vec = np.array(vec, dtype="float32").reshape(1, -1)
         faiss.normalize_L2(vec)
         return vec
     except Exception:
@@ -69,66 +92,124 @@ def build_prompt(question, contexts):
     )
 
 
-def trim_contexts(contexts):
-    out, total = [], 0
-    for c in contexts:
-        if total + len(c) > MAX_CONTEXT_CHARS:
-            break
-        out.append(c)
-        total += len(c)
-    return out
+async def retrieve(question: str, q_norm: str, snap, k: int = TOP_K) -> list:
+    """
+    Hybrid retrieval → up to k meta positions, best first.
 
+    BM25, exact-phrase / person-name hits and FAISS inner-product search are
+    ranked independently and merged with reciprocal-rank fusion. The query
+    embedding is started first so it overlaps with the lexical scoring.
+    """
+    started = time.perf_counter()
+    lexicon = snap.lexicon
+    q_task = asyncio.create_task(embed_query(question))
 
-def query_rag(question: str) -> str:
-    q_norm = normalize_text(question)
+    rankings = []
+    bm25 = lexicon.bm25(q_norm.split(), CANDIDATES)
+    bm25_rank = {pos: i for i, (pos, _) in enumerate(bm25)}
+    rankings.append([pos for pos, _ in bm25])
 
-    if q_norm in RAG_CACHE:
-        return RAG_CACHE[q_norm]
+    # exact phrase / name hits, ordered by their BM25 rank
+    exact = lexicon.match_phrase(q_norm)
+    if not exact and is_person_query(q_norm):
+        exact = lexicon.match_all(extract_name_tokens(q_norm))
+    if exact:
+        exact.sort(key=lambda p: bm25_rank.get(p, len(bm25_rank)))
+        rankings.append(exact[:CANDIDATES])
 
-    index, meta = load_index_meta()
-    contexts = []
+    q_vec = await q_task
+    if q_vec is not None:
+        rankings.append(snap.search(q_vec, CANDIDATES))
 
-    # 1️⃣ EXACT MATCH
-    for c in meta:
-        if q_norm in normalize_text(c["text"]):
-            contexts.append(c["text"])
+    hits = reciprocal_rank_fusion(rankings, RRF_K)[:k]
 
-    # 2️⃣ PERSON NAME TOKEN MATCH (CRITICAL FIX)
-    if not contexts and is_person_query(q_norm):
-        name_tokens = extract_name_tokens(q_norm)
-        for c in meta:
-            chunk_norm = normalize_text(c["text"])
-            if all(t in chunk_norm for t in name_tokens):
-                contexts.append(c["text"])
+    ms = (time.perf_counter() - started) * 1000
+    RETRIEVAL_STATS["count"] += 1
+    RETRIEVAL_STATS["total_ms"] += ms
+    RETRIEVAL_STATS["last_ms"] = ms
+    RETRIEVAL_STATS["max_ms"] = max(RETRIEVAL_STATS["max_ms"], ms)
+    logger.info("RAG retrieval %.1f ms (%d lists, %d hits)", ms, len(rankings), len(hits))
+    return hits
 
-    # 3️⃣ SEMANTIC SEARCH (ALWAYS ALLOWED)
-    if not contexts:
-        q_vec = embed_query(question)
-        if q_vec is not None:
-            _, I = index.search(q_vec, TOP_K)
-            for idx in I[0]:
-                if idx >= 0:
-                    contexts.append(meta[idx]["text"])
-
-    # 🚨 HARD STOP (ANTI-HALLUCINATION)
+
+def retrieval_stats() -> dict:
+    st = dict(RETRIEVAL_STATS)
+    st["avg_ms"] = st["total_ms"] / st["count"] if st["count"] else 0.0
+    return st
+
+
+async def retrieve_contexts(question: str, q_norm: str, snap) -> list:
+    """Retrieved chunks, merged / de-duplicated and packed into CONTEXT_TOKENS."""
+    chunks = [snap.meta[pos] for pos in await retrieve(question, q_norm, snap)]
+    return pack_contexts(chunks, CONTEXT_TOKENS)
+
+
+async def prepare_query(question: str):
+    """
+    Returns (cache_key, reply, prompt): `reply` is set when no generation
+    is needed (cache hit / nothing retrieved), otherwise `prompt` is.
+    """
+    q_norm = normalize_text(question)
+
+    snap = RETRIEVER.get()
+    cache_key = (q_norm, snap.version)
+    cached = RAG_CACHE.get(cache_key)
+    if cached is not None:
+        return cache_key, cached, None
+
+    contexts = await retrieve_contexts(question, q_norm, snap)
+
+    # 🚨 HARD STOP (ANTI-HALLUCINATION); not cached, empty retrieval may be a transient failure
     if not contexts:
-        RAG_CACHE[q_norm] = DEFAULT_REPLY
-        return DEFAULT_REPLY
+        return cache_key, DEFAULT_REPLY, None
+
+    return cache_key, None, build_prompt(question, contexts)
 
-    contexts = trim_contexts(contexts[:3])
-    prompt = build_prompt(question, contexts)
 
+def _rag_request(prompt):
+    # local Ollama first, Groq as the hedge / fallback (see llm_router.SITES)
+    return {"messages": [{"role": "user", "content": prompt}]}
+
+
+async def query_rag(question: str) -> str:
+    cache_key, reply, prompt = await prepare_query(question)
+    if reply is not None:
+        return reply
+
+    try:
+        reply = (await ROUTER.complete("rag", _rag_request(prompt)) or "").strip()
+    except AllBackendsFailed:
+        reply = ""
+
+    # only real answers are kept; the fallback line would stick for RAG_CACHE_TTL
+    if not reply:
+        return DEFAULT_REPLY
+    RAG_CACHE.set(cache_key, reply)
+    return reply
+
+
+async def query_rag_stream(question: str, prepared=None):
+    """
+    Streaming variant of query_rag: yields answer text deltas as the
+    backend generates them. Only a completed, non-empty answer is cached.
+    `prepared` is a prepare_query() result fetched ahead of time.
+    """
+    cache_key, reply, prompt = prepared or await prepare_query(question)
+    if reply is not None:
+        yield reply
+        return
+
+    parts = []
+    done = False
     try:
-        r = requests.post(
-            f"{OLLAMA_URL}/api/generate",
-            json={"model": LLM_MODEL, "prompt": prompt, "stream": False},
-            timeout=30
-        )
-        r.raise_for_status()
-        reply = r.json().get("response", "").strip()
-        final = reply if reply else DEFAULT_REPLY
+        async for piece in ROUTER.stream("rag", _rag_request(prompt)):
+            parts.append(piece)
+            yield piece
+        done = True
     except Exception:
-        final = DEFAULT_REPLY
+        logger.exception("RAG stream failed")
 
-    RAG_CACHE[q_norm] = final
-    return final
+    if not "".join(parts).strip():
+        yield DEFAULT_REPLY
+    elif done:
+        RAG_CACHE.set(cache_key, "".join(parts).strip())
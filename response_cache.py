@@ -0,0 +1,180 @@
+# response_cache.py
+"""
+Opt-in cache of LLM answers for repeated general questions.
+
+Lookup is two-step:
+  1. exact: (intent, lang, normalized question)
+  2. semantic: nearest cached question by embedding cosine similarity,
+     accepted above RESPONSE_CACHE_THRESHOLD (same intent + lang only)
+
+Entries expire after RESPONSE_CACHE_TTL and the cache holds at most
+RESPONSE_CACHE_ITEMS answers. Disabled unless RESPONSE_CACHE=1, and only
+intents listed in RESPONSE_CACHE_INTENTS are cached. The cache is shared
+by all visitors, so callers only use it for context-free questions (see
+server_logic._general_answer).
+
+A lookup embeds the question only when the same intent + lang already
+has cached vectors to compare against.
+"""
+import os, logging, threading
+import numpy as np
+
+from cache import BoundedCache
+from rag_index import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_INTENTS = {
+    i.strip().upper() for i in os.getenv("RESPONSE_CACHE_INTENTS", "GENERAL").split(",") if i.strip()
+}
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(6 * 3600)))
+RESPONSE_CACHE_ITEMS = int(os.getenv("RESPONSE_CACHE_ITEMS", "500"))
+# ----------------------------------------
+
+
+class ResponseCache:
+    """
+    `embed` is an async callable text → L2-normalized vector (or None when
+    embeddings are unavailable, which leaves exact matching only).
+    """
+
+    def __init__(self, embed=None, enabled=RESPONSE_CACHE_ENABLED,
+                 intents=RESPONSE_CACHE_INTENTS, threshold=RESPONSE_CACHE_THRESHOLD,
+                 ttl=RESPONSE_CACHE_TTL, max_items=RESPONSE_CACHE_ITEMS):
+        self.embed = embed
+        self.enabled = enabled
+        self.intents = set(intents)
+        self.threshold = threshold
+        self.max_items = max_items
+        self.entries = BoundedCache(max_items=max_items, ttl=ttl)
+
+        # one row per cached question; rows whose entry expired or was
+        # evicted are skipped at lookup and reused on insert
+        self._lock = threading.Lock()
+        self._vecs = None
+        self._keys = []
+        self._groups = np.zeros(0, dtype="int64")
+        self._group_ids = {}
+        self._row_of = {}
+
+        self.counts = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(text, intent, lang):
+        return (intent, lang, normalize_text(text))
+
+    def enabled_for(self, intent) -> bool:
+        return self.enabled and intent in self.intents
+
+    # ---------- LOOKUP ----------
+
+    async def lookup(self, text, intent, lang="hinglish"):
+        """Cached answer for `text`, or None."""
+        if not self.enabled_for(intent):
+            return None
+        self.counts["lookups"] += 1
+
+        key = self.key(text, intent, lang)
+        reply = self.entries.get(key)
+        if reply is not None:
+            self.counts["exact_hits"] += 1
+            return reply
+
+        vec = await self._vector(text) if self._has_rows((intent, lang)) else None
+        if vec is not None:
+            match = self._nearest(vec, (intent, lang))
+            if match is not None:
+                reply = self.entries.get(match)
+                if reply is not None:
+                    self.counts["semantic_hits"] += 1
+                    return reply
+
+        self.counts["misses"] += 1
+        return None
+
+    async def store(self, text, intent, lang, reply):
+        if not self.enabled_for(intent) or not reply:
+            return
+        key = self.key(text, intent, lang)
+        self.entries.set(key, reply)
+        vec = await self._vector(text)
+        if vec is not None:
+            self._add_row(key, vec, (intent, lang))
+
+    # ---------- VECTORS ----------
+
+    async def _vector(self, text):
+        if self.embed is None:
+            return None
+        try:
+            vec = await self.embed(text)
+        except Exception:
+            logger.exception("response cache embedding failed")
+            return None
+        return None if vec is None else np.asarray(vec, dtype="float32").reshape(-1)
+
+    def _group(self, group):
+        return self._group_ids.setdefault(group, len(self._group_ids))
+
+    def _add_row(self, key, vec, group):
+        with self._lock:
+            if self._vecs is None or self._vecs.shape[1] != len(vec):
+                self._vecs = np.zeros((self.max_items, len(vec)), dtype="float32")
+                self._groups = np.full(self.max_items, -1, dtype="int64")
+                self._keys, self._row_of = [], {}
+
+            row = self._row_of.get(key)
+            if row is None:
+                if len(self._keys) < self.max_items:
+                    row = len(self._keys)
+                    self._keys.append(key)
+                else:
+                    row = self._free_row()
+                    if row is None:
+                        return
+                    del self._row_of[self._keys[row]]
+                    self._keys[row] = key
+                self._row_of[key] = row
+
+            self._vecs[row] = vec
+            self._groups[row] = self._group(group)
+
+    def _has_rows(self, group) -> bool:
+        with self._lock:
+            gid = self._group_ids.get(group)
+            return gid is not None and bool((self._groups[:len(self._keys)] == gid).any())
+
+    def _free_row(self):
+        # the entry table evicts on its own; find a row whose entry is gone
+        for row, key in enumerate(self._keys):
+            if self.entries.peek(key) is None:
+                return row
+        return None
+
+    def _nearest(self, vec, group):
+        with self._lock:
+            n = len(self._keys)
+            gid = self._group_ids.get(group)
+            if not n or gid is None or self._vecs.shape[1] != len(vec):
+                return None
+            sims = self._vecs[:n] @ vec
+            sims[self._groups[:n] != gid] = -1.0
+            order = np.argsort(-sims)[:5]
+            candidates = [self._keys[i] for i in order if sims[i] >= self.threshold]
+
+        for key in candidates:
+            if self.entries.peek(key) is not None:
+                return key
+        return None
+
+    # ---------- METRICS ----------
+
+    def stats(self) -> dict:
+        c = dict(self.counts)
+        hits = c["exact_hits"] + c["semantic_hits"]
+        c["hit_rate"] = hits / c["lookups"] if c["lookups"] else 0.0
+        c["items"] = len(self.entries)
+        return c
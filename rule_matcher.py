@@ -0,0 +1,126 @@
+# rule_matcher.py
+"""
+Keyword rules for small talk (desi_brain), college intents / slots
+(nlu_engine) and movement safety, loaded from rules.json and compiled once
+into a single token trie.
+
+One scan of an utterance reports every rule that matched:
+
+    hits = analyze("CSE HOD kaun hai")
+    hits.first("intent")        # "DEPARTMENT_HOD"
+    hits.first("department")    # "CSE"
+    hits.counts("small_talk")   # {label: number of distinct patterns matched}
+
+Matching is on whole words: text and patterns are tokenized the same way
+and both go through the hinglish alias map ("kaun" → "who"), so "cs" does
+not fire inside "physics" and "tum kaun" matches "tum kaun hai".
+"""
+import os, re, json, logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# ---------------- CONFIG ----------------
+RULES_FILE = os.getenv("RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json"))
+# ----------------------------------------
+
+# latin words + devanagari including matras
+_WORD_RE = re.compile(r"[\w\u0900-\u097F]+")
+_END = ""       # never a token → safe terminal key
+
+
+def load_rules(path=RULES_FILE) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class RuleHits:
+    """Result of one scan: group → {label: frozenset of matched patterns}."""
+
+    def __init__(self, hits, order, tokens):
+        self._hits = hits
+        self._order = order
+        self.tokens = tokens
+
+    def any(self, group) -> bool:
+        return bool(self._hits.get(group))
+
+    def labels(self, group) -> list:
+        """Matched labels in rule-file order."""
+        found = self._hits.get(group, {})
+        return [label for label in self._order.get(group, ()) if label in found]
+
+    def first(self, group):
+        """Highest-priority matched label (the earliest in the rule file), or None."""
+        labels = self.labels(group)
+        return labels[0] if labels else None
+
+    def counts(self, group) -> dict:
+        return {label: len(p) for label, p in self._hits.get(group, {}).items()}
+
+    def matches(self, group) -> dict:
+        """label → matched patterns (as normalized phrases), in rule-file order."""
+        found = self._hits.get(group, {})
+        return {label: sorted(" ".join(k) for k in found[label]) for label in self.labels(group)}
+
+
+class RuleMatcher:
+    def __init__(self, rules):
+        self.aliases = dict(rules.get("aliases", {}))
+        self._root = {}
+        self._order = {}
+        self.patterns = 0
+
+        for rule in rules.get("small_talk", []):
+            self.add("small_talk", rule["name"], rule["patterns"])
+        for rule in rules.get("nlu_intents", []):
+            self.add("intent", rule["intent"], rule["keywords"])
+        for slot, values in rules.get("slots", {}).items():
+            for rule in values:
+                self.add(slot, rule["value"], rule["keywords"])
+        self.add("movement", "MOVEMENT", rules.get("movement", []))
+
+    def tokens(self, text) -> list:
+        return [self.aliases.get(w, w) for w in _WORD_RE.findall((text or "").lower())]
+
+    def add(self, group, label, phrases):
+        order = self._order.setdefault(group, [])
+        if label not in order:
+            order.append(label)
+        for phrase in phrases:
+            key = tuple(self.tokens(phrase))
+            if not key:
+                continue
+            node = self._root
+            for tok in key:
+                node = node.setdefault(tok, {})
+            node.setdefault(_END, set()).add((group, label, key))
+            self.patterns += 1
+
+    def scan(self, text) -> RuleHits:
+        toks = self.tokens(text)
+        hits = {}
+        for i in range(len(toks)):
+            node = self._root
+            for tok in toks[i:]:
+                node = node.get(tok)
+                if node is None:
+                    break
+                for group, label, key in node.get(_END, ()):
+                    hits.setdefault(group, {}).setdefault(label, set()).add(key)
+
+        frozen = {g: {l: frozenset(p) for l, p in labels.items()} for g, labels in hits.items()}
+        return RuleHits(frozen, self._order, toks)
+
+
+RULES = load_rules()
+MATCHER = RuleMatcher(RULES)
+
+
+@lru_cache(maxsize=512)
+def analyze(text: str) -> RuleHits:
+    """
+    Scan once per utterance: movement check, desi_brain and nlu_engine all
+    read the same (cached) result.
+    """
+    return MATCHER.scan(text)
@@ -1,9 +1,9 @@
-from datetime import datetime
 import json
 import os
 import threading
 import asyncio
-from flask import Flask, send_from_directory, request, jsonify
+import queue
+from flask import Flask, Response, send_from_directory, request, jsonify, stream_with_context
 from werkzeug.exceptions import BadRequest
 from concurrent.futures import TimeoutError as FuturesTimeoutError
 import numpy as np
@@ -11,14 +11,13 @@ import cv2
 from flask_cors import CORS
 from face_engine import recognize_faces
 from pc_event_queue import push
-from server_logic import handle_text
+from server_logic import handle_text, handle_text_stream
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 AUDIO_DIR = os.path.join(BASE_DIR, "audio_responses")
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
 app = Flask(__name__)
 CORS(app)
-CHAT_FILE = "chat_history.jsonl"
 
 
 _loop = asyncio.new_event_loop()
@@ -33,17 +32,6 @@ threading.Thread(
     daemon=True
 ).start()
 
-def save_chat(user_text: str, reply_text: str, intent: str):
-    record = {
-        "time": datetime.now().isoformat(),
-        "user": user_text,
-        "assistant": reply_text,
-        "intent": intent
-    }
-
-    with open(CHAT_FILE, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
-
 @app.route("/recognize", methods=["POST"])
 def recognize():
     if "image" not in request.files:
@@ -63,25 +51,45 @@ def recognize():
             break
 
     return jsonify({"faces": faces})
-@app.route("/text", methods=["POST"])
-def text_api():
+def _read_text_request():
+    """Returns (text, None) or (None, error_response)."""
     if not request.is_json:
-        return jsonify({"error": "Content-Type must be application/json"}), 400
+        return None, (jsonify({"error": "Content-Type must be application/json"}), 400)
 
     try:
         data = request.get_json(force=False, silent=False)
     except BadRequest:
-        return jsonify({"error": "Invalid JSON payload"}), 400
+        return None, (jsonify({"error": "Invalid JSON payload"}), 400)
 
     if not isinstance(data, dict) or "text" not in data:
-        return jsonify({"error": "Missing 'text' field"}), 400
+        return None, (jsonify({"error": "Missing 'text' field"}), 400)
 
     user_text = data["text"]
     if not isinstance(user_text, str) or not user_text.strip():
-        return jsonify({"error": "'text' must be a non-empty string"}), 400
+        return None, (jsonify({"error": "'text' must be a non-empty string"}), 400)
+
+    return user_text, None
+
+
+def _session_id():
+    """
+    Conversation key for an HTTP client: an explicit "session_id" in the
+    body or X-Session-Id header, else the client address.
+    """
+    data = request.get_json(silent=True)
+    sid = data.get("session_id") if isinstance(data, dict) else None
+    sid = sid or request.headers.get("X-Session-Id")
+    return str(sid) if sid else f"http:{request.remote_addr}"
+
+
+@app.route("/text", methods=["POST"])
+def text_api():
+    user_text, err = _read_text_request()
+    if err is not None:
+        return err
 
     future = asyncio.run_coroutine_threadsafe(
-        handle_text(user_text),
+        handle_text(user_text, session_id=_session_id()),
         _loop
     )
     try:
@@ -94,6 +102,54 @@ def text_api():
     
     return jsonify(result)
 
+@app.route("/text/stream", methods=["POST"])
+def text_stream_api():
+    """
+    Server-Sent Events variant of /text: one `data: {"type":"delta",...}`
+    event per reply chunk, then a final `data: {"type":"final",...}`.
+    """
+    user_text, err = _read_text_request()
+    if err is not None:
+        return err
+
+    session_id = _session_id()
+    events = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for event in handle_text_stream(user_text, session_id=session_id):
+                events.put(event)
+        except Exception:
+            events.put({"reply": "Failed to process text request",
+                        "intent": {"name": "error", "state": "HANDLE_FAIL"}})
+        finally:
+            events.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), _loop)
+
+    def generate():
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=30)
+                except queue.Empty:
+                    yield "event: error\ndata: {\"error\": \"Request timed out\"}\n\n"
+                    return
+                if event is done:
+                    return
+                if event.get("type") != "delta":
+                    event = {"type": "final", **event}
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            future.cancel()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.route("/audio/<path:fname>")
 def serve_audio(fname):
     return send_from_directory(AUDIO_DIR, fname)
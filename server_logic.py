@@ -1,17 +1,40 @@
 # server_logic.py
 
+import os
+import json
+import asyncio
+import hashlib
 import logging
 from datetime import datetime
 
 from desi_brain import desi_brain
 from hybrid_intent import resolve_intent
-from llm_engine import call_llm_api, save_chat
+from llm_engine import CHAT_STORE, LLM_ERROR_REPLY, call_llm_api_stream, save_chat
+from nlu_engine import CONTEXT_STORE, NLU_CONFIDENCE_THRESHOLD, rule_guess, update_context
+from rag_index import normalize_text
+from response_cache import ResponseCache
+from rule_matcher import RULES, analyze
+from singleflight import BackgroundStream, SingleFlight
 #from util import hinglish_to_hindi_global
 
 try:
-    from rag_query_ollama import query_rag
+    from rag_query_ollama import embed_query, prepare_query, query_rag_stream
 except Exception:
-    query_rag = None
+    embed_query = prepare_query = query_rag_stream = None
+
+# when intent resolution is still running after SPECULATE_AFTER (i.e. it
+# went to the LLM picker), start RAG retrieval alongside it and keep it if
+# the intent picks a college topic. The GENERAL answer is a paid LLM call,
+# so it is only started early for utterances the rules could not place
+# (GENERAL below NLU_CONFIDENCE_THRESHOLD)
+SPECULATIVE = os.getenv("SPECULATIVE_EXECUTION", "1") == "1"
+SPECULATE_AFTER = float(os.getenv("SPECULATE_AFTER_MS", "30")) / 1000
+
+# repeated general questions ("what is AI" / "ai kya hai") answered from
+# memory; opt-in via RESPONSE_CACHE=1
+RESPONSE_CACHE = ResponseCache(embed=embed_query)
+
+PIPELINE_FLIGHT = SingleFlight("handle_text")
 
 logger = logging.getLogger(__name__)
 
@@ -19,75 +42,147 @@ logger = logging.getLogger(__name__)
 # Movement Safety (HARD RULE)
 # -----------------------------
 
-MOVEMENT_KEYWORDS = {
-    "aage", "peeche", "baaye", "daaye",
-    "forward", "backward", "left", "right", "move", "chal"
+# keywords: rules.json "movement" (whole words only)
+MOVEMENT_KEYWORDS = set(RULES["movement"])
+
+COLLEGE_INTENTS = {
+    "DEPARTMENT_HOD",
+    "PLACEMENTS",
+    "COURSES",
+    "CAMPUS",
+    "COLLEGE_DIRECTOR",
+    "COLLEGE_CHAIRMAN"
 }
 
 # -----------------------------
 # MAIN BRAIN
 # -----------------------------
 
-async def handle_text(text: str, lang: str = "hinglish") -> dict:
+async def handle_text_stream(text: str, lang: str = "hinglish", session_id=None):
+    """
+    Streaming pipeline. Yields {"type": "delta", "text": ...} events while a
+    backend is generating, then the final result dict (same shape as
+    handle_text) as the LAST item. `session_id` keeps each visitor's
+    conversation memory separate.
+
+    Identical requests arriving together (mic, kiosk page, /text — each with
+    its own session id) share one run of the pipeline; each caller still
+    gets every event. See _flight_key for when two sessions may share.
+    """
     text = (text or "").strip()
-    t = text.lower()
+    key, fresh = _flight_key(text, lang, session_id)
+
+    result = None
+    async for event in PIPELINE_FLIGHT.stream(key, lambda: _pipeline(text, lang, session_id)):
+        if event.get("type") == "delta":
+            yield event
+        else:
+            result = event
+
+    # the run may have been another fresh session's: remember the slots here too
+    name = result["intent"]["name"]
+    if fresh and result["intent"].get("state") == "OK" and "slots" in result["intent"]:
+        update_context(name, result["intent"]["slots"], session_id)
+
+    # logged per caller: each coalesced request is a turn of its own
+    if name == "GENERAL" or name in COLLEGE_INTENTS:
+        save_chat(text, result["reply"], lang, name, session_id, result["intent"].get("source"))
+    yield result
 
+
+def _flight_key(text, lang, session_id):
+    """
+    (coalescing key, context-free?). A session with no chat history and no
+    NLU slot context gets the same answer as any other such session, so
+    those share on the text alone; otherwise the key carries a digest of
+    the history and slots that shape the answer.
+    """
+    history = CHAT_STORE.recent(session=session_id)
+    slots = CONTEXT_STORE.get(session_id)
+    base = (normalize_text(text), lang)
+    if not history and not slots:
+        return base, True
+
+    state = json.dumps([[[h.get("user"), h.get("assistant")] for h in history],
+                        sorted(slots.items())], ensure_ascii=False)
+    return base + (hashlib.sha1(state.encode("utf-8")).hexdigest(),), False
+
+
+async def _pipeline(text, lang, session_id):
     print("🔥 handle_text:", text)
 
     # 0️⃣ Movement safety (NO LLM)
-    if any(w in t for w in MOVEMENT_KEYWORDS):
-        return {
+    if analyze(text).any("movement"):
+        yield {
             "reply": 
                 "Please provide complete movement command. Example: aage jao."
             ,
             "intent": {"name": "MOVEMENT", "state": "CLARIFY"}
         }
+        return
 
     # 1️⃣ Desi Brain (small talk)
     try:
         desi_reply = desi_brain(text)
         if desi_reply:
-            return {
+            yield {
                 "reply": desi_reply,
                 "intent": {"name": "SMALL_TALK", "state": "OK"}
             }
+            return
     except Exception:
         logger.exception("desi_brain failed")
 
-    # 2️⃣ HYBRID INTENT RESOLUTION
-    intent, slots, source = resolve_intent(text)
+    # 2️⃣ HYBRID INTENT RESOLUTION (+ speculative branches while it runs)
+    intent_task = asyncio.ensure_future(resolve_intent(text, session_id))
+    general = rag = None
+    if SPECULATIVE:
+        done, _ = await asyncio.wait({intent_task}, timeout=SPECULATE_AFTER)
+        if not done:
+            if _may_be_general(text):
+                general = BackgroundStream(lambda: _general_answer(text, lang, session_id),
+                                           "speculative-general")
+            if prepare_query:
+                rag = asyncio.ensure_future(prepare_query(text))
+    try:
+        intent, slots, source = await intent_task
+    except BaseException:
+        _cancel(general, rag)
+        raise
     print(f"🧠 Intent={intent} via {source}")
 
+    # commit to one branch; every other intent falls through to GENERAL
+    if intent == "TIME" or intent in COLLEGE_INTENTS:
+        _cancel(general)
+    if intent not in COLLEGE_INTENTS:
+        _cancel(rag)
+
     # 3️⃣ TIME
     if intent == "TIME":
         now = datetime.now().strftime("%I:%M %p")
-        return {
+        yield {
             "reply": f"Current time {now} hai",
             "intent": {"name": "TIME", "state": "OK"}
         }
+        return
 
     # 4️⃣ COLLEGE INTENTS → RAG ONLY
-    if intent in {
-        "DEPARTMENT_HOD",
-        "PLACEMENTS",
-        "COURSES",
-        "CAMPUS",
-        "COLLEGE_DIRECTOR",
-        "COLLEGE_CHAIRMAN"
-    }:
-        if not query_rag:
-            reply = "College information system is not available."
+    if intent in COLLEGE_INTENTS:
+        parts = []
+        if not query_rag_stream:
+            parts.append("College information system is not available.")
         else:
             try:
-                reply = query_rag(text) or "Information not available in the college document."
+                prepared = await rag if rag is not None else None
+                async for piece in query_rag_stream(text, prepared):
+                    parts.append(piece)
+                    yield {"type": "delta", "text": piece}
             except Exception:
                 logger.exception("RAG failed")
-                reply = "Information not available in the college document."
 
-        reply = reply
-        save_chat(text, reply, lang)
+        reply = "".join(parts).strip() or "Information not available in the college document."
 
-        return {
+        yield {
             "reply": reply,
             "intent": {
                 "name": intent,
@@ -96,22 +191,69 @@ async def handle_text(text: str, lang: str = "hinglish") -> dict:
                 "slots": slots
             }
         }
+        return
 
-    # 5️⃣ GENERAL → LLM
-    try:
-        reply = call_llm_api(text, lang)
-    except Exception:
-        logger.exception("LLM failed")
-        reply = "Technical issue aa gaya hai. Please try again."
-
-    reply = reply
-    save_chat(text, reply, lang)
+    # 5️⃣ GENERAL → LLM (or the response cache), possibly already underway
+    answer = general if general is not None else _general_answer(text, lang, session_id)
+    reply, cached = "", False
+    async for event in answer:
+        if event["type"] == "delta":
+            yield event
+        else:
+            reply, cached = event["reply"], event["cached"]
 
-    return {
+    yield {
         "reply": reply,
         "intent": {
             "name": "GENERAL",
             "state": "OK",
-            "source": source
+            "source": f"{source}+cache" if cached else source
         }
     }
+
+
+async def _general_answer(text, lang, session_id):
+    """GENERAL branch: delta events, then {"type": "done", "reply", "cached"}."""
+    # the LLM sees this session's earlier turns; such answers are not
+    # shareable, so they neither come from nor go into the cache
+    shareable = not CHAT_STORE.recent(1, session=session_id)
+    cached = await RESPONSE_CACHE.lookup(text, "GENERAL", lang) if shareable else None
+    if cached is not None:
+        yield {"type": "delta", "text": cached}
+        yield {"type": "done", "reply": cached, "cached": True}
+        return
+
+    parts = []
+    try:
+        async for piece in call_llm_api_stream(text, lang, session_id):
+            parts.append(piece)
+            yield {"type": "delta", "text": piece}
+    except Exception:
+        logger.exception("LLM failed")
+
+    reply = "".join(parts).strip()
+    if shareable and reply and reply != LLM_ERROR_REPLY:
+        await RESPONSE_CACHE.store(text, "GENERAL", lang, reply)
+    yield {
+        "type": "done",
+        "reply": reply or "Technical issue aa gaya hai. Please try again.",
+        "cached": False
+    }
+
+
+def _may_be_general(text) -> bool:
+    intent, confidence = rule_guess(text)
+    return intent == "GENERAL" and confidence < NLU_CONFIDENCE_THRESHOLD
+
+
+def _cancel(*branches):
+    for b in branches:
+        if b is not None:
+            b.cancel()
+
+
+async def handle_text(text: str, lang: str = "hinglish", session_id=None) -> dict:
+    result = None
+    async for event in handle_text_stream(text, lang, session_id):
+        result = event
+    return result
@@ -0,0 +1,120 @@
+# singleflight.py
+"""
+Request coalescing: concurrent calls with the same key share ONE in-flight
+computation and all get its result.
+
+    FLIGHT = SingleFlight("tts")
+    fname = await FLIGHT.do(key, lambda: make_audio(text))
+    async for event in FLIGHT.stream(key, lambda: pipeline(text)):
+        ...
+
+The shared work runs in its own task, so a caller that disconnects or is
+cancelled never cancels it for the others. Nothing is remembered once the
+flight lands; this is not a cache.
+"""
+import asyncio, logging
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundStream:
+    """
+    Drives an async generator in its own task, buffering every item.
+    Any number of readers iterate it; each sees all items from the start.
+    """
+
+    def __init__(self, agen_fn, name="stream", on_done=None):
+        self.events = []
+        self.done = False
+        self.error = None
+        self._name = name
+        self._on_done = on_done
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._produce(agen_fn))
+
+    async def _produce(self, agen_fn):
+        try:
+            async for event in agen_fn():
+                self.events.append(event)
+                self._wake()
+        except Exception as e:
+            logger.exception("%s: shared computation failed", self._name)
+            self._finish(e)
+        except BaseException as e:      # cancelled: don't leave readers waiting
+            self._finish(e)
+            raise
+        else:
+            self._finish()
+
+    def _finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._wake()
+        if self._on_done:
+            self._on_done(self)
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def cancel(self):
+        self.task.cancel()
+
+    async def __aiter__(self):
+        i = 0
+        while True:
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self, name="flight"):
+        self.name = name
+        self.coalesced = 0      # callers served by someone else's flight
+        # flights are asyncio objects → keyed by loop as well (ws_server and
+        # server.py's background loop each get their own)
+        self._calls = {}
+        self._streams = {}
+
+    # ---------- ONE RESULT ----------
+
+    async def do(self, key, fn):
+        """await fn() once per key at a time; everyone awaiting gets its result."""
+        k = (asyncio.get_running_loop(), key)
+        task = self._calls.get(k)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[k] = task
+            task.add_done_callback(lambda _: self._calls.pop(k, None))
+        else:
+            self.coalesced += 1
+        # shield: a cancelled caller must not cancel the shared call
+        return await asyncio.shield(task)
+
+    # ---------- STREAM ----------
+
+    async def stream(self, key, agen_fn):
+        """
+        Iterate agen_fn() once per key at a time; every concurrent caller
+        sees all of its items from the start, in order.
+        """
+        k = (asyncio.get_running_loop(), key)
+        flight = self._streams.get(k)
+        if flight is None:
+            flight = BackgroundStream(agen_fn, self.name, on_done=lambda f: self._landed(k, f))
+            self._streams[k] = flight
+        else:
+            self.coalesced += 1
+
+        async for event in flight:
+            yield event
+
+    def _landed(self, k, flight):
+        if self._streams.get(k) is flight:
+            del self._streams[k]
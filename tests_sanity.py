@@ -31,3 +31,886 @@ def test_rag_basic():
     r = handle_text(q)
     # If RAG returns an answer it should be present in the reply
     assert "hod" in r["reply"].lower() or "i don't know" in r["reply"].lower()
+
+def test_retriever_hot_reload(tmp_path):
+    import json, faiss, numpy as np
+    from rag_index import Retriever, write_version
+
+    def build(n):
+        xb = np.eye(n, 4, dtype="float32")
+        index = faiss.IndexFlatIP(4)
+        index.add(xb)
+        faiss.write_index(index, str(tmp_path / "index.faiss"))
+        (tmp_path / "meta.json").write_text(
+            json.dumps([{"id": i, "text": f"chunk {i}"} for i in range(n)])
+        )
+        write_version(str(tmp_path))
+
+    build(2)
+    r = Retriever(str(tmp_path), check_interval=0)
+    old = r.get()
+    assert len(old.meta) == 2
+
+    build(3)
+    new = r.get()
+    assert new is not old and len(new.meta) == 3
+    # in-flight holders of the old snapshot keep working
+    assert old.index.search(np.eye(1, 4, dtype="float32"), 1)[1][0][0] == 0
+
+def test_lexicon_matches_linear_scan():
+    from rag_index import Lexicon, build_lexicon, normalize_text
+    chunks = [{"text": "HOD Name: Dr. Mayank Patel"}, {"text": "Placements: 90% placed"}]
+    lex = Lexicon(build_lexicon(chunks))
+    for q in ["mayank patel", "placement", "ank pat", "hod name dr"]:
+        expect = [i for i, c in enumerate(chunks) if q in normalize_text(c["text"])]
+        assert lex.match_phrase(q) == expect
+    assert lex.match_all(["hod", "patel"]) == [0]
+
+def test_bounded_cache_evicts_and_persists(tmp_path):
+    from cache import BoundedCache
+    path = str(tmp_path / "c.sqlite")
+    c = BoundedCache(max_items=2, path=path)
+    c.set(("who is the hod", "v1"), "Dr. Mayank Patel")
+    c.set(("a", "v1"), "x")
+    c.set(("b", "v1"), "y")
+    assert c.get(("who is the hod", "v1")) is None
+    assert c.stats()["evictions"] == 1
+
+    warm = BoundedCache(max_items=2, path=path)
+    assert warm.get(("b", "v1")) == "y"
+    assert warm.get(("b", "v2")) is None
+    assert warm.stats()["hits"] == 1
+
+def test_embedder_batches_and_caches():
+    import threading
+    import numpy as np
+    from embedder import Embedder
+
+    calls = []
+    emb = Embedder("fake", window=0.05)
+    emb._request = lambda texts: (calls.append(list(texts)), [np.ones(3, "float32") * len(t) for t in texts])[1]
+
+    futs = [emb.submit(t) for t in ["a", "bb", "a", "ccc"]]
+    assert [f.result(2)[0] for f in futs] == [1, 2, 1, 3]
+    assert calls == [["a", "bb", "ccc"]]
+
+    assert emb.embed("bb")[0] == 2
+    assert len(calls) == 1
+
+def test_incremental_build_reembeds_only_changed(tmp_path, monkeypatch):
+    import json
+    import numpy as np
+    import build_embeddings_ollama as b
+    from rag_index import Retriever
+
+    embedded = []
+
+    def fake_embed(texts, *a, **kw):
+        embedded.extend(texts)
+        return [np.random.rand(8).astype("float32") for _ in texts]
+
+    monkeypatch.setattr(b, "embed_missing", fake_embed)
+
+    def write(texts):
+        chunks = [{"id": i, "text": t} for i, t in enumerate(texts)]
+        (tmp_path / "chunks.json").write_text(json.dumps({"chunks": chunks}))
+
+    write(["alpha", "beta", "gamma"])
+    b.build(str(tmp_path))
+    assert sorted(embedded) == ["alpha", "beta", "gamma"]
+
+    embedded.clear()
+    write(["alpha", "BETA v2", "gamma"])
+    b.build(str(tmp_path))
+    assert embedded == ["BETA v2"]
+
+    snap = Retriever(str(tmp_path)).get()
+    assert snap.index.ntotal == 3
+    assert [c["text"] for c in snap.meta][1] == "BETA v2"
+
+def test_handle_text_stream_yields_deltas_then_final(monkeypatch):
+    import asyncio
+    import server_logic
+
+    async def resolve(t, session_id=None):
+        return "GENERAL", {}, "rule"
+
+    async def llm_stream(t, l, session_id=None):
+        for piece in ["Black ", "hole ", "hai"]:
+            yield piece
+
+    monkeypatch.setattr(server_logic, "resolve_intent", resolve)
+    monkeypatch.setattr(server_logic, "call_llm_api_stream", llm_stream)
+    monkeypatch.setattr(server_logic, "save_chat", lambda *a: None)
+
+    async def run():
+        return [e async for e in server_logic.handle_text_stream("Explain black hole")]
+
+    events = asyncio.run(run())
+    assert [e["text"] for e in events[:-1]] == ["Black ", "hole ", "hai"]
+    assert events[-1]["reply"] == "Black hole hai"
+
+
+def test_sanitize_stream_handles_split_words():
+    import asyncio
+    from llm_engine import sanitize_reply, sanitize_stream
+    deltas = ["Arre ya", "ar, AI ek ", "machine hai bh", "ai"]
+
+    async def run():
+        async def gen():
+            for d in deltas:
+                yield d
+        return "".join([p async for p in sanitize_stream(gen())])
+
+    assert asyncio.run(run()) == sanitize_reply("".join(deltas))
+
+def test_bm25_and_rank_fusion():
+    from rag_index import Lexicon, build_lexicon, reciprocal_rank_fusion
+    chunks = [
+        {"text": "Placements: 90% students placed, highest package 12 LPA"},
+        {"text": "Hostel and library facilities on campus"},
+        {"text": "HOD Dr. Mayank Patel leads placement training"},
+    ]
+    lex = Lexicon(build_lexicon(chunks))
+    assert [p for p, _ in lex.bm25(["placement", "training"])][0] == 2
+    assert lex.bm25(["unknownword"]) == []
+
+    assert reciprocal_rank_fusion([[2, 0], [0, 2], [0]]) == [0, 2]
+
+def test_lexicon_file_matches_in_memory_lexicon(tmp_path):
+    from lexicon_store import PostingsFile, write_lexicon
+    from rag_index import Lexicon, build_lexicon
+    chunks = [
+        {"text": "Placements: 90% students placed, highest package 12 LPA"},
+        {"text": "Hostel and library facilities on campus"},
+        {"text": "HOD Dr. Mayank Patel leads placement training"},
+    ]
+    data = build_lexicon(chunks)
+    write_lexicon(str(tmp_path / "lexicon.bin"), data)
+    mapped = Lexicon(PostingsFile(str(tmp_path / "lexicon.bin")), data["norm"])
+    memory = Lexicon(data)
+
+    assert mapped.postings["placement"] == memory.postings["placement"] == {2: 1}
+    assert "unknownword" not in mapped.postings
+    for q in (["placement", "training"], ["hostel"], ["nothing"]):
+        assert mapped.bm25(q) == memory.bm25(q)
+    assert mapped.match_phrase("mayank pat") == memory.match_phrase("mayank pat") == [2]
+    assert mapped.match_all(["place", "lpa"]) == [0]
+
+def test_chunk_store_reads_lazily_by_id(tmp_path):
+    from chunk_store import ChunkStore, write_store
+    path = str(tmp_path / "chunks.bin")
+    write_store(path, [{"id": 7, "text": "सात"}, {"id": 3, "text": "three"}])
+
+    store = ChunkStore(path)
+    assert len(store) == 2
+    assert store[0]["text"] == "सात"
+    assert store.texts[1] == "three"
+    assert store.positions([3, 99, 7]) == [1, 0]
+
+def test_ingest_streams_paragraphs_and_cells(tmp_path):
+    import json
+    import docx
+    import ingest_docx_groq as ing
+
+    for name, extra in [("a.docx", "Placement cell"), ("b.docx", "Hostel")]:
+        d = docx.Document()
+        d.add_paragraph(f"Intro of {name}")
+        table = d.add_table(rows=1, cols=2)
+        table.cell(0, 0).text = extra
+        table.cell(0, 1).text = "Room 101"
+        d.save(str(tmp_path / name))
+
+    blocks = list(ing.iter_blocks(str(tmp_path / "a.docx")))
+    assert blocks == [("para", "Intro of a.docx"), ("cell", "Placement cell"), ("cell", "Room 101")]
+
+    ing.main([str(tmp_path)], str(tmp_path / "out"), chunk_size=400, workers=2)
+    chunks = json.loads((tmp_path / "out" / "chunks.json").read_text())["chunks"]
+    docs = [c["doc"] for c in chunks]
+    assert docs == sorted(docs) and set(docs) == {"a.docx", "b.docx"}
+    assert chunks[0]["id"] == ing.stable_chunk_id("a.docx", chunks[0]["text"])
+    assert any("Room 101" in c["text"] for c in chunks if c["doc"] == "b.docx")
+
+def test_pack_contexts_merges_dedupes_and_budgets():
+    from context_packer import estimate_tokens, pack_contexts
+    chunks = [
+        {"doc": "a", "seq": 1, "text": "The HOD is Dr. Patel. Labs open at nine."},
+        {"doc": "a", "seq": 0, "text": "CSE has 4 labs. The HOD is Dr. Patel."},
+        {"doc": "b", "seq": 0, "text": "The HOD is Dr. Patel. " + "Hostel fees are due monthly. " * 40},
+    ]
+    out = pack_contexts(chunks, 60)
+    assert out[0] == "CSE has 4 labs. The HOD is Dr. Patel. Labs open at nine."
+    assert all("HOD" not in block for block in out[1:])
+    assert sum(estimate_tokens(b) for b in out) <= 60
+
+
+def test_doc_watcher_reingests_only_changed_docs(tmp_path, monkeypatch):
+    import os
+    import docx
+    import numpy as np
+    import build_embeddings_ollama as b
+    from ingest_watch import DocWatcher
+    from rag_index import Retriever
+
+    embedded = []
+
+    def fake_embed(texts, *a, **kw):
+        embedded.extend(texts)
+        return [np.random.rand(8).astype("float32") for _ in texts]
+
+    monkeypatch.setattr(b, "embed_missing", fake_embed)
+
+    docs, rag = tmp_path / "docs", tmp_path / "rag"
+    docs.mkdir()
+    rag.mkdir()
+
+    def save(name, text, age=60):
+        d = docx.Document()
+        d.add_paragraph(text)
+        d.save(str(docs / name))
+        old = os.stat(docs / name).st_mtime - age
+        os.utime(docs / name, (old, old))
+
+    save("fees.docx", "Hostel fee is 50000")
+    save("hod.docx", "HOD of CSE is Dr. Patel")
+    reloads = []
+    w = DocWatcher(str(docs), str(rag), on_update=reloads.append)
+
+    assert w.sync()["chunks"] == 2
+    ids = {c["doc"]: c["id"] for c in Retriever(str(rag)).get().meta}
+    assert w.sync() is None                     # nothing changed
+
+    embedded.clear()
+    save("fees.docx", "Hostel fee is 55000", age=30)
+    stats = w.sync()
+    assert stats["changed"] == ["fees.docx"]
+    assert [t.strip() for t in embedded] == ["Hostel fee is 55000"]
+
+    meta = list(Retriever(str(rag)).get().meta)
+    assert {c["doc"]: c["id"] for c in meta}["hod.docx"] == ids["hod.docx"]
+    assert len(reloads) == 2
+
+    os.remove(docs / "hod.docx")
+    assert w.sync()["removed"] == ["hod.docx"]
+    assert [c["doc"] for c in Retriever(str(rag)).get().meta] == ["fees.docx"]
+
+def test_chat_store_ring_log_and_rotation(tmp_path):
+    import json
+    from chat_store import ChatStore
+
+    legacy = tmp_path / "old.json"
+    legacy.write_text(json.dumps([{"user": "hi", "assistant": "hello"}]))
+    path = str(tmp_path / "chat.jsonl")
+
+    store = ChatStore(path, ring_size=3, max_bytes=150, backups=5,
+                      legacy_path=str(legacy))
+    for i in range(6):
+        store.append(f"q{i}", f"a{i}", "en", "GENERAL")
+        store.flush()
+    assert [h["user"] for h in store.recent(2)] == ["q4", "q5"]
+    assert len(store.recent()) == 3
+    store.close()
+
+    logs = sorted(tmp_path.glob("chat.jsonl*"))
+    assert len(logs) > 1                                   # rotated
+    lines = [l for p in logs for l in p.read_text().splitlines()]
+    assert sorted(json.loads(l)["user"] for l in lines) == ["hi"] + [f"q{i}" for i in range(6)]
+
+    reopened = ChatStore(path, ring_size=10)
+    assert reopened.recent()[-1]["intent"] == "GENERAL"
+    reopened.close()
+
+def test_chat_store_flush_and_writer_keep_log_order(tmp_path):
+    import json, threading
+    from chat_store import ChatStore
+
+    path = str(tmp_path / "chat.jsonl")
+    store = ChatStore(path, max_bytes=2000, backups=50, flush_interval=0.001)
+    assert store._writer is None                # nothing started until the first turn
+
+    def talk(n):
+        for i in range(100):
+            store.append(f"{n}-{i}", "ok")
+            if i % 7 == 0:
+                store.flush()
+
+    threads = [threading.Thread(target=talk, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    store.close()
+
+    logs = sorted(tmp_path.glob("chat.jsonl.*"), key=lambda p: -int(p.suffix[1:])) + [tmp_path / "chat.jsonl"]
+    seqs = [json.loads(l)["seq"] for p in logs for l in p.read_text().splitlines()]
+    assert len(logs) > 2 and seqs == list(range(400))
+
+def test_chat_context_is_per_session_and_token_bounded(tmp_path, monkeypatch):
+    import chat_context
+    from chat_store import ChatStore
+    from context_packer import estimate_tokens
+
+    store = ChatStore(str(tmp_path / "chat.jsonl"))
+    store.append("what is ai", "AI is artificial intelligence.", session="b")
+    for i in range(40):
+        store.append(f"question {i} about hostels", f"Answer {i}. " + "Details here. " * 10, session="a")
+
+    msgs = chat_context.build_messages(store.recent(session="a"), "fees?", "a",
+                                       budget=150, summary_budget=60)
+    assert msgs[0]["role"] == "system" and "question" in msgs[0]["content"]
+    assert msgs[-1] == {"role": "user", "content": "fees?"}
+    assert not any("what is ai" in m["content"] for m in msgs)
+    assert sum(estimate_tokens(m["content"]) for m in msgs) < 150 + 60 + 20
+
+    calls = []
+    real = chat_context.summarize_turn
+    monkeypatch.setattr(chat_context, "summarize_turn", lambda t: calls.append(t) or real(t))
+    store.append("question 40 about hostels", "Answer 40. " + "Details here. " * 10, session="a")
+    chat_context.build_messages(store.recent(session="a"), "fees?", "a",
+                                budget=150, summary_budget=60)
+    assert len(calls) == 1          # only the turn that just left the window
+    store.close()
+
+def test_response_cache_exact_semantic_and_flags():
+    import asyncio
+    import numpy as np
+    from response_cache import ResponseCache
+
+    vectors = {
+        "what is ai": [1.0, 0.0, 0.0],
+        "ai kya hai": [0.96, 0.28, 0.0],
+        "tell me a joke": [0.0, 0.0, 1.0],
+    }
+
+    embedded = []
+
+    async def embed(text):
+        embedded.append(text)
+        return np.array(vectors[text.lower().strip("?! ")], dtype="float32")
+
+    cache = ResponseCache(embed=embed, enabled=True, intents={"GENERAL"}, threshold=0.9)
+
+    async def run():
+        await cache.store("What is AI?", "GENERAL", "en", "AI = artificial intelligence")
+        return [
+            await cache.lookup("what is ai", "GENERAL", "en"),      # exact
+            await cache.lookup("ai kya hai", "GENERAL", "en"),      # semantic
+            await cache.lookup("ai kya hai", "GENERAL", "hi"),      # other language
+            await cache.lookup("tell me a joke", "GENERAL", "en"),  # too far
+            await cache.lookup("what is ai", "PLACEMENTS", "en"),   # intent not cached
+        ]
+
+    hits = asyncio.run(run())
+    assert hits[:2] == ["AI = artificial intelligence"] * 2
+    assert hits[2:] == [None, None, None]
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 2)
+    # no embedding for a group with nothing cached ("hi") or an uncached intent
+    assert embedded == ["What is AI?", "ai kya hai", "tell me a joke"]
+
+def test_response_cache_skipped_for_sessions_with_history(monkeypatch):
+    import asyncio
+    import server_logic
+    from response_cache import ResponseCache
+
+    class Store:
+        def recent(self, limit=None, session=None):
+            return [{"user": "mera naam Ravi hai"}] if session == "old" else []
+
+    async def llm_stream(t, l, session_id=None):
+        yield f"answer for {session_id}"
+
+    cache = ResponseCache(enabled=True)
+    monkeypatch.setattr(server_logic, "RESPONSE_CACHE", cache)
+    monkeypatch.setattr(server_logic, "CHAT_STORE", Store())
+    monkeypatch.setattr(server_logic, "call_llm_api_stream", llm_stream)
+
+    async def ask(sid):
+        return [e async for e in server_logic._general_answer("what is my name", "en", sid)][-1]
+
+    assert asyncio.run(ask("old"))["reply"] == "answer for old"
+    assert len(cache.entries) == 0 and cache.stats()["lookups"] == 0
+    assert asyncio.run(ask("new"))["cached"] is False
+    assert asyncio.run(ask("new2")) == {"type": "done", "reply": "answer for new", "cached": True}
+    assert asyncio.run(ask("old"))["reply"] == "answer for old"
+
+def test_identical_concurrent_requests_share_one_pipeline(monkeypatch):
+    import asyncio
+    import server_logic
+
+    calls, saved = [], []
+
+    async def resolve(t, session_id=None):
+        return "GENERAL", {}, "rule"
+
+    async def llm_stream(t, l, session_id=None):
+        calls.append(session_id)
+        for piece in ["AI ", "hai"]:
+            await asyncio.sleep(0.01)
+            yield piece
+
+    class Store:
+        def recent(self, limit=None, session=None):
+            return [{"user": "mera naam Ravi", "assistant": "Hi Ravi"}] if session == "old" else []
+
+    class Context:
+        def get(self, session=None):
+            return {"college": "GITS"} if session == "slots" else {}
+
+    monkeypatch.setattr(server_logic, "resolve_intent", resolve)
+    monkeypatch.setattr(server_logic, "call_llm_api_stream", llm_stream)
+    monkeypatch.setattr(server_logic, "save_chat", lambda *a: saved.append(a[4]))
+    monkeypatch.setattr(server_logic, "CHAT_STORE", Store())
+    monkeypatch.setattr(server_logic, "CONTEXT_STORE", Context())
+
+    async def ask(text, sid):
+        return [e async for e in server_logic.handle_text_stream(text, session_id=sid)]
+
+    async def run():
+        return await asyncio.gather(ask("What is AI", "ws:1"), ask("what is  ai", "http:10.0.0.5"),
+                                    ask("what is AI", "old"), ask("what is AI", "slots"))
+
+    kiosk, mic, old, slots = asyncio.run(run())
+    # two fresh clients share one run; sessions with history / slots get their own
+    assert len(calls) == 3 and {"old", "slots"} <= set(calls)
+    assert [e.get("text") for e in kiosk] == [e.get("text") for e in mic]
+    assert kiosk[-1]["reply"] == mic[-1]["reply"] == old[-1]["reply"] == "AI hai"
+    assert sorted(saved) == sorted(["ws:1", "http:10.0.0.5", "old", "slots"])
+
+def test_llm_router_hedges_fails_over_and_breaks_circuit():
+    import asyncio
+    from llm_router import Backend, CircuitBreaker, Router
+
+    calls = []
+
+    def fake(name, delay, fail=False):
+        async def complete(req):
+            calls.append(name)
+            await asyncio.sleep(delay)
+            if fail:
+                raise ConnectionError(name)
+            return f"{name} reply"
+        return complete
+
+    site = {"order": ["slow", "fast"], "timeout": 1.0, "hedge": True,
+            "hedge_min": 0.01, "hedge_max": 0.05}
+    router = Router([Backend("slow", fake("slow", 0.5)), Backend("fast", fake("fast", 0.01))],
+                    {"chat": site})
+    assert asyncio.run(router.complete("chat", {})) == "fast reply"
+    assert router.hedged == 1
+
+    broken = Backend("groq", fake("groq", 0, fail=True), breaker=CircuitBreaker(failures=2, cooldown=60))
+    local = Backend("ollama", fake("ollama", 0))
+    router = Router([broken, local], {"chat": dict(site, order=["groq", "ollama"], hedge=False)})
+
+    async def stream():
+        return [p async for p in router.stream("chat", {})]
+
+    calls.clear()
+    for _ in range(3):
+        assert asyncio.run(stream()) == ["ollama reply"]
+    assert calls == ["groq", "ollama", "groq", "ollama", "ollama"]   # open after 2 failures
+    assert router.stats()["backends"]["groq"]["state"] == "open"
+
+def test_speculative_pipeline_overlaps_intent_and_answer(monkeypatch):
+    import asyncio
+    import server_logic
+
+    started, branch = [], {}
+
+    async def slow_resolve(t, session_id=None):
+        # the LLM intent picker only "returns" once the speculative branch has
+        # begun, so this completes only if the two overlap
+        if "hod" in t.lower():
+            await asyncio.sleep(0.05)
+            return "DEPARTMENT_HOD", {"department": "CSE"}, "rule"
+        await asyncio.wait_for(branch["started"].wait(), 2)
+        return ("GENERAL", {}, "llm") if "ai" in t.lower() else ("PLACEMENTS", {}, "llm")
+
+    async def llm_stream(t, l, session_id=None):
+        started.append(t)
+        branch["started"].set()
+        yield "AI hai"
+
+    async def prepare(q):
+        branch["started"].set()
+        return None, "Placement record", None
+
+    async def rag_stream(q, prepared=None):
+        yield prepared[1] if prepared else "HOD record"
+
+    monkeypatch.setattr(server_logic, "SPECULATIVE", True)
+    monkeypatch.setattr(server_logic, "SPECULATE_AFTER", 0.001)
+    monkeypatch.setattr(server_logic, "resolve_intent", slow_resolve)
+    monkeypatch.setattr(server_logic, "call_llm_api_stream", llm_stream)
+    monkeypatch.setattr(server_logic, "prepare_query", prepare)
+    monkeypatch.setattr(server_logic, "query_rag_stream", rag_stream)
+    monkeypatch.setattr(server_logic, "save_chat", lambda *a: None)
+
+    async def ask(text):
+        branch["started"] = asyncio.Event()
+        return await server_logic.handle_text(text)
+
+    result = asyncio.run(ask("please tell me about AI and what it can do now"))
+    assert result["reply"] == "AI hai"
+    assert started == ["please tell me about AI and what it can do now"]
+
+    # rule-routed wording: retrieval is prefetched, the paid GENERAL answer is not
+    result = asyncio.run(ask("please tell me about placements here"))
+    assert (result["reply"], result["intent"]["name"]) == ("Placement record", "PLACEMENTS")
+    result = asyncio.run(ask("GITS CSE HOD kaun hai"))
+    assert result["intent"]["name"] == "DEPARTMENT_HOD"
+    assert len(started) == 1
+
+def test_rule_matcher_one_scan_word_boundaries():
+    from rule_matcher import RuleMatcher, load_rules
+
+    m = RuleMatcher(load_rules())
+    hits = m.scan("GITS ke CSE HOD kaun hai")
+    assert hits.first("intent") == "DEPARTMENT_HOD"
+    assert hits.first("college") == "GITS" and hits.first("department") == "CSE"
+    assert not hits.any("movement")
+
+    # whole words only: no "cs" in physics, "ai" in chairman, "right" in bright
+    hits = m.scan("physics chairman bright")
+    assert hits.first("department") is None and hits.first("intent") == "COLLEGE_CHAIRMAN"
+    assert not hits.any("movement")
+    assert m.scan("aage chalo").any("movement")
+
+    # aliases apply to patterns too ("tum kaun" matches after kaun → who)
+    assert m.scan("tum kaun ho").counts("small_talk") == {"who_are_you": 1}
+    assert m.scan("hello namaste").counts("small_talk") == {"greeting": 1}
+
+def test_intent_classifier_confident_locally_else_llm(monkeypatch):
+    import asyncio, hybrid_intent
+    from intent_classifier import IntentClassifier
+
+    clf = IntentClassifier().fit(
+        ["hostel kaisa hai", "hostel ki fees", "library timing", "canteen kahan hai",
+         "highest package kitna", "placement record", "companies for placement", "average package"],
+        ["CAMPUS"] * 4 + ["PLACEMENTS"] * 4,
+    )
+    label, conf = clf.predict("hostel me wifi hai kya")
+    assert label == "CAMPUS" and 0.5 < conf <= 1.0
+
+    # nothing to train on (missing / empty intents file) → never raises
+    empty = IntentClassifier().fit([], [])
+    assert empty.predict("hostel") == ("GENERAL", 0.0) and empty.scores("hostel") == {}
+
+    # only rule-decided turns are learned from; the classifier's own / LLM labels are not
+    from intent_classifier import training_examples
+    log = [{"user": "hod kaun", "intent": "DEPARTMENT_HOD", "source": "rule"},
+           {"user": "jobs kaise hai", "intent": "PLACEMENTS", "source": "llm"},
+           {"user": "mess ka khana", "intent": "CAMPUS", "source": "classifier"},
+           {"user": "old turn", "intent": "CAMPUS"}]
+    texts, _ = training_examples({"intent_examples": {}}, log)
+    assert texts == ["hod kaun"]
+    assert abs(sum(clf.scores("anything").values()) - 1.0) < 1e-5
+
+    async def llm(text):
+        return "GENERAL"
+
+    monkeypatch.setattr(hybrid_intent, "CLASSIFIER", clf)
+    monkeypatch.setattr(hybrid_intent, "_llm_pick_intent", llm)
+    monkeypatch.setattr(hybrid_intent, "INTENT_CLS_THRESHOLD", 0.5)
+    # fresh session: no remembered college, so CAMPUS stays CLARIFY
+    assert asyncio.run(hybrid_intent.resolve_intent("hostel ke rooms kaise hai bataiye", "t-cls"))[2] == "classifier"
+    monkeypatch.setattr(hybrid_intent, "INTENT_CLS_THRESHOLD", 1.01)
+    assert asyncio.run(hybrid_intent.resolve_intent("hostel ke rooms kaise hain bataiye", "t-cls"))[2] == "llm"
+
+def test_nlu_confidence_evidence_and_decision_cache(monkeypatch):
+    import asyncio, hybrid_intent
+    from cache import BoundedCache
+    from nlu_engine import nlu_analyze
+
+    r = nlu_analyze("GITS CSE HOD kaun hai")
+    assert (r.intent, r.state) == ("DEPARTMENT_HOD", "OK") and r.confidence >= 0.9
+    assert {"rule": "intent", "value": "DEPARTMENT_HOD", "matched": ["hod"]} in r.evidence
+    assert nlu_analyze("hod chairman").confidence < nlu_analyze("chairman gits").confidence
+    assert nlu_analyze("tell me something about the stars tonight").confidence < 0.7
+
+    calls = []
+
+    async def llm(text):
+        calls.append(text)
+        return "PLACEMENTS" if len(calls) > 1 else None     # first call fails
+
+    class Unsure:
+        def predict(self, text):
+            return "GENERAL", 0.1
+
+    monkeypatch.setattr(hybrid_intent, "CLASSIFIER", Unsure())
+    monkeypatch.setattr(hybrid_intent, "_llm_pick_intent", llm)
+    monkeypatch.setattr(hybrid_intent, "DECISIONS", BoundedCache(max_items=10))
+    q = "how good are the jobs after studying here"
+    assert asyncio.run(hybrid_intent.resolve_intent(q))[0] == "GENERAL"     # not cached
+    assert asyncio.run(hybrid_intent.resolve_intent(q))[0] == "PLACEMENTS"
+    intent, _, source = asyncio.run(hybrid_intent.resolve_intent("How good are the jobs, after studying here?"))
+    assert (intent, source) == ("PLACEMENTS", "llm")
+    assert len(calls) == 2
+    assert hybrid_intent.intent_stats()["decisions"]["hits"] == 1
+
+    assert hybrid_intent.clear_decisions() == 1
+    asyncio.run(hybrid_intent.resolve_intent(q))
+    assert len(calls) == 3
+
+def test_nlu_context_is_per_session_with_ttl_and_write_behind(tmp_path):
+    import json, time, threading
+    from context_store import ContextStore
+
+    path = tmp_path / "ctx.json"
+    store = ContextStore(str(path), ttl=60, flush_interval=0.05)
+
+    def kiosk(i):
+        for n in range(200):
+            store.update(f"kiosk{i}", {"department": f"D{i}", "n": n})
+
+    threads = [threading.Thread(target=kiosk, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [store.get(f"kiosk{i}") for i in range(4)] == [{"department": f"D{i}", "n": 199} for i in range(4)]
+    assert store.get("someone-else") == {}
+
+    time.sleep(0.3)         # written by the background thread, not by update()
+    saved = json.loads(path.read_text())["sessions"]
+    assert saved["kiosk2"]["data"]["department"] == "D2"
+
+    store.close()
+    again = ContextStore(str(path), ttl=60)
+    assert again.get("kiosk3")["department"] == "D3"
+
+    old = ContextStore(None, ttl=0.05)
+    old.update("s", {"college": "GITS"})
+    time.sleep(0.1)
+    assert old.get("s") == {}
+
+def test_translation_batch_cache_and_fallback(monkeypatch, tmp_path):
+    import asyncio, util
+    from cache import BoundedCache
+
+    calls = []
+
+    class FakeRouter:
+        async def complete(self, site, req):
+            prompt = req["messages"][-1]["content"]
+            calls.append(prompt)
+            if "numbered" not in prompt:
+                return "एक"
+            lines = prompt.split("Input:\n", 1)[1].splitlines()
+            return "\n".join(f"{line.split(']')[0]}] हिंदी {line.split(']')[1].strip()}" for line in lines)
+
+    cache_file = str(tmp_path / "tr.sqlite")
+    monkeypatch.setattr(util, "ROUTER", FakeRouter())
+    monkeypatch.setattr(util, "_TRANSLATION_CACHE", BoundedCache(max_items=10, path=cache_file))
+
+    out = asyncio.run(util.hinglish_to_hindi_reply("AI kya hai? IIT accha hai. AI kya hai?"))
+    assert out == "हिंदी AI kya hai? हिंदी IIT accha hai. हिंदी AI kya hai?"
+    assert len(calls) == 1 and "__ACR_0__" in calls[0]          # one request, acronyms frozen
+
+    # cached across restarts; only the new sentence is translated
+    monkeypatch.setattr(util, "_TRANSLATION_CACHE", BoundedCache(max_items=10, path=cache_file))
+    assert asyncio.run(util.hinglish_to_hindi_batch(["IIT accha hai.", "naya"])) == ["हिंदी IIT accha hai.", "एक"]
+    assert len(calls) == 2
+
+    # already Devanagari (no Latin letters): returned as is, no request
+    assert asyncio.run(util.hinglish_to_hindi_global("नमस्ते, 2024!")) == "नमस्ते, 2024!"
+    assert asyncio.run(util.hinglish_to_hindi_reply("आप कैसे हैं? ठीक हूँ।")) == "आप कैसे हैं? ठीक हूँ।"
+    assert len(calls) == 2
+
+def test_face_gallery_batched_topk_matches_brute_force():
+    import numpy as np
+    from face_gallery import FaceGallery, UNKNOWN
+
+    rng = np.random.default_rng(0)
+    enc = rng.normal(0, 0.1, (300, 128))
+    names = [f"p{i // 3}" for i in range(300)]          # 3 encodings per person
+    faces = np.vstack([enc[7] + 0.001, rng.normal(0, 1, 128)])
+
+    for index in ("numpy", "faiss"):
+        g = FaceGallery(enc, names, index=index)
+        assert g.backend == index and g.matrix.dtype == np.float32 and g.matrix.flags.c_contiguous
+        dists, rows = g.search(faces, 5)
+        brute = np.linalg.norm(enc[None, :, :] - faces[:, None, :], axis=2)
+        assert np.allclose(dists, np.sort(brute, axis=1)[:, :5], atol=1e-3)
+
+        known, stranger = g.match(faces, k=3, tolerance=0.55)
+        assert known["name"] == "p2" and len({c["name"] for c in known["candidates"]}) == 3
+        assert stranger["name"] == UNKNOWN and stranger["candidates"]
+
+    assert FaceGallery([], []).match(faces[:1]) == [{"name": UNKNOWN, "distance": None, "candidates": []}]
+
+def test_llm_intent_pick_sends_no_chat_history(monkeypatch):
+    import asyncio, hybrid_intent
+
+    seen = []
+
+    class FakeRouter:
+        async def complete(self, site, req):
+            seen.append((site, req))
+            return "PLACEMENTS"
+
+    monkeypatch.setattr(hybrid_intent, "ROUTER", FakeRouter())
+    assert asyncio.run(hybrid_intent._llm_pick_intent("jobs kaisi milti hai")) == "PLACEMENTS"
+    site, req = seen[0]
+    assert site == "intent" and len(req["messages"]) == 1    # just the classifier prompt
+
+def test_rag_does_not_cache_failures(monkeypatch):
+    import asyncio
+    import rag_query_ollama as rq
+    from cache import BoundedCache
+    from llm_router import AllBackendsFailed
+
+    answers = []
+
+    class Router:
+        async def complete(self, site, req):
+            if not answers:
+                raise AllBackendsFailed(site, [])
+            return answers.pop()
+
+        async def stream(self, site, req):
+            for piece in [""]:
+                yield piece
+
+    async def prepare(q):
+        return ("q", 1), None, "prompt"
+
+    monkeypatch.setattr(rq, "ROUTER", Router())
+    monkeypatch.setattr(rq, "RAG_CACHE", BoundedCache(max_items=10))
+    monkeypatch.setattr(rq, "prepare_query", prepare)
+
+    assert asyncio.run(rq.query_rag("hod kaun")) == rq.DEFAULT_REPLY
+    answers.append("")
+    assert asyncio.run(rq.query_rag("hod kaun")) == rq.DEFAULT_REPLY
+
+    async def stream():
+        return [p async for p in rq.query_rag_stream("hod kaun")]
+
+    assert asyncio.run(stream()) == ["", rq.DEFAULT_REPLY]
+    assert len(rq.RAG_CACHE) == 0
+
+    answers.append("Dr. Mayank Patel")
+    assert asyncio.run(rq.query_rag("hod kaun")) == "Dr. Mayank Patel"
+    assert rq.RAG_CACHE.get(("q", 1)) == "Dr. Mayank Patel"
+
+def test_chunk_ids_survive_editing_one_paragraph(tmp_path):
+    import json
+    import docx
+    import ingest_docx_groq as ing
+
+    paras = ["GITS was founded in 1996 in Udaipur.", "The CSE department has four labs.",
+             "HOD of CSE is Dr. Mayank Patel.", "Placements: 90% of students placed last year.",
+             "Highest package was 12 LPA.", "Hostel fee is 50000 per year.",
+             "The library opens at nine.", "Canteen serves lunch from 12 to 3.",
+             "The director is Dr. N. K. Sharma.", "The chairman founded the trust.",
+             "Admissions open every June.", "Bus service covers the whole city."]
+
+    def chunk(texts):
+        d = docx.Document()
+        for t in texts:
+            d.add_paragraph(t)
+        d.save(str(tmp_path / "info.docx"))
+        ing.chunk_document(str(tmp_path / "info.docx"), str(tmp_path / "part.jsonl"), chunk_size=120)
+        return [json.loads(line) for line in open(tmp_path / "part.jsonl", encoding="utf-8")]
+
+    old = chunk(paras)
+    assert all(len(c["text"]) <= 120 for c in old)
+    # whole paragraphs only: every chunk is a run of complete paragraphs
+    assert " ".join(c["text"] for c in old) == " ".join(paras)
+
+    paras[5] = "Hostel fee is 55000 per year, mess charges extra."
+    new_ids = {c["id"] for c in chunk(paras)}
+    lost = [c["text"] for c in old if c["id"] not in new_ids]
+    assert len(lost) == 1 and "50000" in lost[0]
+
+def test_every_index_kind_round_trips_and_survives_updates(tmp_path, monkeypatch):
+    import json
+    import numpy as np
+    import build_embeddings_ollama as b
+    from rag_index import INDEX_TYPES, Retriever, index_kind
+
+    rng = np.random.default_rng(0)
+    monkeypatch.setattr(b, "embed_missing",
+                        lambda texts, *a, **kw: list(rng.random((len(texts), 32), dtype="float32")))
+
+    def write(rag, texts):
+        chunks = [{"id": i, "text": t} for i, t in enumerate(texts)]
+        (rag / "chunks.json").write_text(json.dumps({"chunks": chunks}))
+
+    texts = [f"chunk number {i}" for i in range(300)]
+    for kind in INDEX_TYPES:
+        rag = tmp_path / kind
+        rag.mkdir()
+        write(rag, texts)
+        b.build(str(rag), index_type=kind)
+        snap = Retriever(str(rag)).get()            # read back memory-mapped where supported
+        assert (index_kind(snap.index), snap.index.ntotal) == (kind, 300)
+
+        # incremental: one chunk edited, one added; the type is kept (HNSW is rebuilt)
+        write(rag, texts[:5] + ["chunk number 5 edited"] + texts[6:] + ["a new chunk"])
+        assert b.build(str(rag))["embedded"] == 2
+        snap = Retriever(str(rag)).get()
+        assert (index_kind(snap.index), snap.index.ntotal) == (kind, 301)
+        assert snap.index.search(np.ones((1, 32), "float32"), 3)[1].shape == (1, 3)
+
+def test_ingest_names_docs_by_relative_path_and_keeps_nested_text(tmp_path):
+    import json, zipfile
+    import docx
+    import pytest
+    import build_embeddings_ollama as b
+    import ingest_docx_groq as ing
+
+    for dept in ("cse", "me"):
+        (tmp_path / dept).mkdir()
+        d = docx.Document()
+        d.add_paragraph("Syllabus is on the college website.")
+        d.save(str(tmp_path / dept / "syllabus.docx"))
+
+    ing.main([str(tmp_path)], str(tmp_path / "out"), workers=1)
+    chunks = json.loads((tmp_path / "out" / "chunks.json").read_text())["chunks"]
+    assert [c["doc"] for c in chunks] == ["cse/syllabus.docx", "me/syllabus.docx"]
+    assert len({c["id"] for c in chunks}) == 2
+    b.check_unique_ids(chunks)
+    with pytest.raises(ValueError, match="syllabus.docx"):
+        b.check_unique_ids(chunks + [dict(chunks[0], doc="other/syllabus.docx")])
+
+    # a text box (w:p inside w:p) must not wipe the outer paragraph's text
+    w = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    xml = (f'<w:document {w}><w:body><w:p><w:r><w:t>Fees are </w:t></w:r>'
+           '<w:r><w:txbxContent><w:p><w:r><w:t>Box note</w:t></w:r></w:p></w:txbxContent></w:r>'
+           '<w:r><w:t>due in July</w:t></w:r></w:p></w:body></w:document>')
+    with zipfile.ZipFile(tmp_path / "box.docx", "w") as z:
+        z.writestr("word/document.xml", xml)
+    assert list(ing.iter_blocks(str(tmp_path / "box.docx"))) == [
+        ("para", "Box note"), ("para", "Fees are due in July")]
+
+def test_build_handles_an_empty_corpus(tmp_path, monkeypatch):
+    import json
+    import numpy as np
+    import build_embeddings_ollama as b
+    from rag_index import Retriever
+
+    monkeypatch.setattr(b, "embed_missing", lambda texts, *a, **kw: [np.ones(8, "float32") for _ in texts])
+    write = lambda chunks: (tmp_path / "chunks.json").write_text(json.dumps({"chunks": chunks}))
+
+    write([])
+    assert b.build(str(tmp_path))["chunks"] == 0                # fresh, nothing to index
+    write([{"id": 1, "text": "Hostel fee is 50000"}])
+    b.build(str(tmp_path), index_type="hnsw")
+    write([])                                                   # last document deleted
+    b.build(str(tmp_path))
+
+    snap = Retriever(str(tmp_path)).get()
+    assert snap.index.ntotal == len(snap.meta) == len(snap.lexicon) == 0
+    assert snap.search(np.ones((1, 8), "float32"), 5) == []
+    assert snap.lexicon.bm25(["hostel"]) == []
+
+def test_rag_context_budget_follows_router_models():
+    import rag_query_ollama as rq
+    from context_packer import budget_for
+    from llm_router import GROQ_MODEL, OLLAMA_CHAT_MODEL, site_models
+
+    assert site_models("rag") == [OLLAMA_CHAT_MODEL, GROQ_MODEL]
+    assert rq.CONTEXT_TOKENS == min(budget_for(OLLAMA_CHAT_MODEL), budget_for(GROQ_MODEL))
@@ -1,15 +1,30 @@
-import requests
 import os
+import re
+import asyncio
 
-from dotenv import load_dotenv
+from cache import BoundedCache
+from llm_router import ROUTER, AllBackendsFailed
 
-import re
-_TRANSLATION_CACHE = {}
+# ---------------- CONFIG ----------------
+TRANSLATION_CACHE_ITEMS = int(os.getenv("TRANSLATION_CACHE_ITEMS", "5000"))
+TRANSLATION_CACHE_BYTES = int(os.getenv("TRANSLATION_CACHE_BYTES", str(4 * 1024 * 1024)))
+TRANSLATION_CACHE_FILE = os.getenv(
+    "TRANSLATION_CACHE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_data", "translation_cache.sqlite")
+)
+TRANSLATE_BATCH_MAX = int(os.getenv("TRANSLATE_BATCH_MAX", "12"))     # sentences per request
+# ----------------------------------------
+
+# source text → Hindi; LRU-bounded, survives restarts (sqlite)
+_TRANSLATION_CACHE = BoundedCache(
+    max_items=TRANSLATION_CACHE_ITEMS,
+    max_bytes=TRANSLATION_CACHE_BYTES,
+    path=TRANSLATION_CACHE_FILE
+)
 
 ACRONYM_PATTERN = re.compile(
     r"\b[A-Z]{2,}[A-Z0-9]*s?\b"  # NASA, WHO, AIIMS, IITs, GPT4
 )
-import re
 
 # English letter → Hindi sound map
 LETTER_TO_HINDI = {
@@ -43,31 +58,37 @@ def freeze_acronyms(text):
 
     frozen_text = ACRONYM_PATTERN.sub(replacer, text)
     return frozen_text, acronyms
+
 def restore_acronyms(translated, acronyms):
     for key, value in acronyms.items():
         translated = translated.replace(key, value)
     return translated
-def hinglish_to_hindi(text):
-    load_dotenv()
-    API_KEY = os.getenv("GROQ_API_KEY")
-    examples = [
-        # few-shot examples — source (Hinglish/English) -> target (Hindi in Devanagari)
-        {
-            "src": "kal milte hain, office mein 10 baje.",
-            "tgt": "कल मिलते हैं, ऑफिस में १० बजे।"
-        },
-        {
-            "src": "Can you send the report by tonight?",
-            "tgt": "क्या आप रिपोर्ट आज रात तक भेज सकते हैं?"
-        },
-        {
-            "src": "meri gaadi breakdown ho gayi hai",
-            "tgt": "मेरी गाड़ी खराब हो गई है।"
-        }
-    ]
 
+# few-shot examples — source (Hinglish/English) -> target (Hindi in Devanagari)
+EXAMPLES = [
+    {
+        "src": "kal milte hain, office mein 10 baje.",
+        "tgt": "कल मिलते हैं, ऑफिस में १० बजे।"
+    },
+    {
+        "src": "Can you send the report by tonight?",
+        "tgt": "क्या आप रिपोर्ट आज रात तक भेज सकते हैं?"
+    },
+    {
+        "src": "meri gaadi breakdown ho gayi hai",
+        "tgt": "मेरी गाड़ी खराब हो गई है।"
+    }
+]
+
+SYSTEM_PROMPT = (
+    "You are a precise Hindi language expert translator. "
+    "Always respond with only the translated sentence in Devanagari Hindi. "
+    "Do not add commentary, transliteration, or extra lines."
+)
+
+async def hinglish_to_hindi(text):
     example_text = "\n".join(
-        f"Input: {ex['src']}\nHindi: {ex['tgt']}\n" for ex in examples
+        f"Input: {ex['src']}\nHindi: {ex['tgt']}\n" for ex in EXAMPLES
     )
     prompt = (
         "Task: Convert the given sentence (Hinglish or English) into simple, natural, "
@@ -79,43 +100,120 @@ def hinglish_to_hindi(text):
         f"Input: {text}\n"
         "Hindi:"
     )
-    
 
-    payload = {
-        "model": "llama-3.1-8b-instant",
+    request = {
         "temperature": 0.1,
         "max_tokens": 250,
         "messages": [
-            {"role": "system", "content": (
-                    "You are a precise Hindi language expert translator. "
-                    "Always respond with only the translated sentence in Devanagari Hindi. "
-                    "Do not add commentary, transliteration, or extra lines."
-                )},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ]
     }
 
     try:
-        r = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json=payload,
-            timeout=20
-        )
-        r.raise_for_status()
-        return r.json()["choices"][0]["message"]["content"].strip()
-    except:
+        return await ROUTER.complete("translate", request)
+    except AllBackendsFailed:
         return text
-def hinglish_to_hindi_global(text):
-    if text in _TRANSLATION_CACHE:
-        return _TRANSLATION_CACHE[text]
 
-    result = restore_acronyms(
-        hinglish_to_hindi(freeze_acronyms(text)[0]),
-        freeze_acronyms(text)[1]
-    )
-    _TRANSLATION_CACHE[text] = result
+_LATIN_RE = re.compile(r"[A-Za-z]")
+
+def needs_translation(text):
+    # no Latin letters → already Devanagari (or just digits / punctuation)
+    return bool(_LATIN_RE.search(text or ""))
+
+async def hinglish_to_hindi_global(text):
+    if not needs_translation(text):
+        return text
+    cached = _TRANSLATION_CACHE.get(text)
+    if cached is not None:
+        return cached
+
+    frozen, acronyms = freeze_acronyms(text)
+    result = restore_acronyms(await hinglish_to_hindi(frozen), acronyms)
+    if result != text:      # a failed call echoes the input; don't keep that
+        _TRANSLATION_CACHE.set(text, result)
     return result
+
+
+# ---------- BATCH ----------
+
+_NUMBERED_RE = re.compile(r"^\s*\[(\d+)\]\s*(.*)$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?।])\s+")
+
+def split_sentences(text):
+    return [s for s in _SENTENCE_RE.split((text or "").strip()) if s]
+
+async def _translate_numbered(frozen):
+    """One request for several sentences; None if the reply doesn't line up."""
+    example_text = "\n".join(
+        f"[{i}] {ex['src']}" for i, ex in enumerate(EXAMPLES, 1)
+    ) + "\n\n" + "\n".join(
+        f"[{i}] {ex['tgt']}" for i, ex in enumerate(EXAMPLES, 1)
+    )
+    prompt = (
+        "Task: Convert each numbered sentence (Hinglish or English) into simple, natural, "
+        "spoken Hindi written in Devanagari script. Use conversational phrasing (not overly formal). "
+        "Preserve named entities (names, places, acronyms) and punctuation. "
+        "Return exactly one line per input, in the same order, each starting with its [number]; "
+        "nothing else.\n\n"
+        f"Example input:\n{example_text}\n\n"
+        "Input:\n" + "\n".join(f"[{i}] {t}" for i, t in enumerate(frozen, 1))
+    )
+    request = {
+        "temperature": 0.1,
+        "max_tokens": 120 * len(frozen),
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    }
+
+    try:
+        raw = await ROUTER.complete("translate", request)
+    except AllBackendsFailed:
+        return None
+
+    out = {}
+    for line in raw.splitlines():
+        m = _NUMBERED_RE.match(line)
+        if m and m.group(2).strip():
+            out[int(m.group(1))] = m.group(2).strip()
+    if sorted(out) != list(range(1, len(frozen) + 1)):
+        return None
+    return [out[i] for i in range(1, len(frozen) + 1)]
+
+async def hinglish_to_hindi_batch(texts):
+    """
+    Translate many sentences with as few LLM requests as possible: cached
+    ones are skipped, the rest go TRANSLATE_BATCH_MAX per request. If a
+    batched reply can't be split back apart, those sentences fall back to
+    one request each.
+    """
+    results = [_TRANSLATION_CACHE.get(t) if needs_translation(t) else t for t in texts]
+    todo = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+
+    done = {}
+    for i in range(0, len(todo), TRANSLATE_BATCH_MAX):
+        chunk = todo[i:i + TRANSLATE_BATCH_MAX]
+        if len(chunk) == 1:
+            done[chunk[0]] = await hinglish_to_hindi_global(chunk[0])
+            continue
+
+        frozen = [freeze_acronyms(t) for t in chunk]
+        translated = await _translate_numbered([f for f, _ in frozen])
+        if translated is None:
+            fallback = await asyncio.gather(*(hinglish_to_hindi_global(t) for t in chunk))
+            done.update(zip(chunk, fallback))
+            continue
+        for t, (_, acronyms), hindi in zip(chunk, frozen, translated):
+            done[t] = restore_acronyms(hindi, acronyms)
+            _TRANSLATION_CACHE.set(t, done[t])
+
+    return [r if r is not None else done[t] for t, r in zip(texts, results)]
+
+async def hinglish_to_hindi_reply(text):
+    """
+    A whole reply, sentence by sentence, in one batched request. Used by
+    common.tts_to_file when TTS_HINDI_SCRIPT=1.
+    """
+    return " ".join(await hinglish_to_hindi_batch(split_sentences(text)))
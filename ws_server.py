@@ -1,12 +1,16 @@
 import asyncio
 import json
+import uuid
 import logging
 import websockets
 from websockets.exceptions import ConnectionClosed
 
-from server_logic import handle_text      # ASYNC
+from server_logic import handle_text, handle_text_stream      # ASYNC
 from common import tts_to_file             # ASYNC
 from pc_event_queue import pop             # blocking
+from http_clients import close_sessions
+from ingest_watch import WATCH_DIR, DocWatcher
+from rag_query_ollama import RAG_DIR, RETRIEVER
 
 HOST = "0.0.0.0"
 PORT = 8765
@@ -50,12 +54,12 @@ async def heartbeat(ws):
         pass
 
 # ---------- PROCESS COMMAND ----------
-async def process_command(ws, text):
+async def process_command(ws, text, session_id=None):
     try:
         logger.info("DEBUG: calling handle_text for text=%s", text)
 
         try:
-            result = await handle_text(text)
+            result = await handle_text(text, session_id=session_id)
             logger.info("DEBUG: handle_text returned: %s", repr(result)[:400])
         except Exception:
             logger.exception("handle_text failed")
@@ -79,6 +83,37 @@ async def process_command(ws, text):
             "intent": {"name": "error", "state": "CRASH"}
         })
 
+# ---------- PROCESS COMMAND (STREAMING) ----------
+async def process_command_stream(ws, text, session_id=None):
+    """
+    Same as process_command, but forwards reply deltas as
+    {"type": "delta"} frames while the backend generates, then the
+    full result as {"type": "final", ...}.
+    """
+    try:
+        result = None
+        async for event in handle_text_stream(text, session_id=session_id):
+            if event.get("type") == "delta":
+                if not await safe_send(ws, event):
+                    return
+            else:
+                result = event
+
+        if not isinstance(result, dict):
+            result = {"reply": str(result)}
+
+        ok = await safe_send(ws, {"type": "final", **result})
+        asyncio.create_task(tts_background(ws, result["reply"]))
+        logger.info("DEBUG: stream finished ok=%s", ok)
+
+    except Exception:
+        logger.exception("process_command_stream crashed")
+        await safe_send(ws, {
+            "type": "final",
+            "reply": "Server processing error.",
+            "intent": {"name": "error", "state": "HANDLE_FAIL"}
+        })
+
 # ---------- WS HANDLER ----------
 async def ws_handler(ws):
     logger.info("Client connected: %s", ws.remote_address)
@@ -86,6 +121,9 @@ async def ws_handler(ws):
 
     hb = asyncio.create_task(heartbeat(ws))
     tasks = set()
+    # one conversation per connection unless the client sends its own id
+    # (e.g. to keep its memory across reconnects)
+    conn_session = f"ws:{uuid.uuid4().hex}"
 
     try:
         async for msg in ws:
@@ -114,7 +152,11 @@ async def ws_handler(ws):
                     # do not reraise — log and continue to avoid killing the handler
                     continue
 
-                task = asyncio.create_task(process_command(ws, text))
+                session_id = str(data.get("session_id") or conn_session)
+                if data.get("stream"):
+                    task = asyncio.create_task(process_command_stream(ws, text, session_id))
+                else:
+                    task = asyncio.create_task(process_command(ws, text, session_id))
                 tasks.add(task)
                 task.add_done_callback(tasks.discard)
 
@@ -163,7 +205,13 @@ async def main():
         max_size=2**20
     ):
         asyncio.create_task(face_dispatch_loop())
-        await asyncio.Future()
+        if WATCH_DIR:
+            # edited college docs go live without a restart
+            DocWatcher(WATCH_DIR, RAG_DIR, on_update=lambda _: RETRIEVER.reload()).start()
+        try:
+            await asyncio.Future()
+        finally:
+            await close_sessions()
 
 if __name__ == "__main__":
     asyncio.run(main())